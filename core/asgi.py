@@ -9,8 +9,25 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers import asgi
+from django.db import close_old_connections
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+
+class ASGIHandler(asgi.ASGIHandler):
+    async def handle(self, scope, receive, send):
+        try:
+            await super().handle(scope, receive, send)
+        finally:
+            # Django 5.0 cancels the response task, request_finished
+            # included, when the client hangs up right after the response.
+            # The connections would then never go back to the pool
+            await sync_to_async(close_old_connections)()
+
+
+django.setup(set_prefix=False)
+application = ASGIHandler()
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import deque
+
+from django.db import DatabaseError
+
+
+class PoolTimeout(DatabaseError):
+    pass
+
+
+class ConnectionPool:
+    """
+    A fixed size pool of raw DB-API connections shared by every thread.
+
+    `max_size` caps the connections open at once (idle plus checked out),
+    and threads wait up to `timeout` seconds for one to be returned.
+    Connections older than `max_lifetime` seconds are closed on return.
+    """
+
+    def __init__(self, max_size=10, timeout=30, max_lifetime=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle = deque()
+        self._created = {}
+
+    def acquire(self, connect):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f'No database connection was free after {self.timeout}s (pool size {self.max_size})')
+
+        try:
+            while True:
+                with self._lock:
+                    raw = self._idle.pop() if self._idle else None
+                if raw is None:
+                    raw = connect()
+                    self._created[id(raw)] = time.monotonic()
+                    return raw
+                # Health check connections that sat idle in the pool, the
+                # server may have dropped them in the meantime
+                if self._usable(raw):
+                    return raw
+                self._discard(raw)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, raw, reusable=True):
+        try:
+            created = self._created.get(id(raw), 0)
+            expired = self.max_lifetime is not None and time.monotonic() - created > self.max_lifetime
+            if reusable and not expired:
+                with self._lock:
+                    self._idle.append(raw)
+            else:
+                self._discard(raw)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for raw in idle:
+            self._discard(raw)
+
+    def _usable(self, raw):
+        try:
+            cursor = raw.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, raw):
+        self._created.pop(id(raw), None)
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(settings_dict, options):
+    # One pool per database, the test runner swaps NAME for the test database
+    key = (settings_dict['ENGINE'], str(settings_dict['NAME']), settings_dict.get('HOST'), settings_dict.get('PORT'))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(**options)
+        return _pools[key]
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Borrows connections from a ConnectionPool instead of opening one per
+    thread. Enabled with OPTIONS['pool'] = {'max_size': ..., 'timeout': ...},
+    closing the Django connection (at the end of every request when
+    CONN_MAX_AGE is 0) hands the raw connection back to the pool.
+    """
+
+    @property
+    def pool_options(self):
+        return self.settings_dict['OPTIONS'].get('pool')
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        if not self.pool_options:
+            return super().get_new_connection(conn_params)
+        pool = get_pool(self.settings_dict, self.pool_options)
+        return pool.acquire(lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params))
+
+    def _close(self):
+        if not self.pool_options or self.connection is None:
+            return super()._close()
+        # Only connections back in a clean autocommit state are reused
+        reusable = self.get_autocommit() and not self.in_atomic_block and not self.errors_occurred
+        get_pool(self.settings_dict, self.pool_options).release(self.connection, reusable)
@@ -0,0 +1,12 @@
+from django.db.backends.sqlite3 import base
+
+from core.backends.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        # A plain BEGIN takes the write lock on the first write, and SQLite
+        # fails a read lock upgrade with "database is locked" right away
+        # instead of waiting out the busy timeout. Taking the write lock up
+        # front lets concurrent checkouts queue behind each other instead.
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,78 @@
+"""
+Gunicorn settings: `gunicorn -c core/gunicorn.conf.py`.
+
+SERVER_MODE=asgi (the default) runs core.asgi under uvicorn workers, one
+event loop per core. SERVER_MODE=wsgi runs core.wsgi under threaded sync
+workers, 2 * cores + 1 of them, each with a pool of one database
+connection per thread.
+
+Migrations are not run here, `manage.py migrate` is a separate step
+before the server starts. The app is loaded once in the master and the
+workers fork from it, so code changes need a new master: send USR2 to
+start one next to the old, then QUIT to the old master once it is up.
+HUP only restarts the workers, gracefully.
+"""
+
+import gc
+import multiprocessing
+import os
+
+
+cores = multiprocessing.cpu_count()
+mode = os.environ.get('SERVER_MODE', 'asgi')
+
+if mode == 'asgi':
+    wsgi_app = 'core.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    workers = int(os.environ.get('WEB_CONCURRENCY', cores))
+    # Sync code runs on a fresh thread per request under ASGI, so only a
+    # pool shared by those threads keeps database connections open
+    os.environ.setdefault('DB_POOL_SIZE', '20')
+else:
+    wsgi_app = 'core.wsgi:application'
+    worker_class = 'gthread'
+    workers = int(os.environ.get('WEB_CONCURRENCY', cores * 2 + 1))
+    # A thread holds at most one database connection, so with the server's
+    # DB_MAX_CONNECTIONS (less some headroom for cron jobs and shells) the
+    # threads split it between the workers, 4 each otherwise
+    budget = os.environ.get('DB_MAX_CONNECTIONS')
+    threads = int(os.environ.get('WEB_THREADS') or (max(1, int(budget) // workers) if budget else 4))
+    # Pooled rather than one persistent connection per thread, sized so no
+    # thread ever waits for one
+    os.environ.setdefault('DB_POOL_SIZE', str(threads))
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+# Keep-alive connections are held open by the proxy in front
+keepalive = 5
+timeout = int(os.environ.get('WEB_TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30'))
+
+# Recycle workers now and then so slow leaks can't pile up, with jitter so
+# they don't all restart at once
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '5000'))
+max_requests_jitter = max_requests // 10
+
+preload_app = True
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-') or None
+
+
+def when_ready(server):
+    # Import every view while still in the master, then move everything
+    # loaded so far out of the collector's reach: the gc writing to those
+    # objects would otherwise copy their pages into every worker
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Nothing opened by the master may be shared with a worker
+    from django.core.cache import caches
+    from django.db import connections
+
+    from core.backends.pool import close_pools
+
+    connections.close_all()
+    close_pools()
+    caches.close_all()
@@ -0,0 +1,170 @@
+import mimetypes
+import os
+import re
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_safe
+
+
+# ManifestStaticFilesStorage names (app.1a2b3c4d5e6f.css) and content
+# addressed image variants never change, so they can be cached for a year
+IMMUTABLE_PATTERNS = [re.compile(r'\.[0-9a-f]{12}\.\w+$'), re.compile(r'^variants/')]
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Anything else is revalidated, which costs a 304 while it is unchanged
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """A read-only window of `length` bytes of an open file, from `start`."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _etag(stat_result, suffix=''):
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}{suffix}"'
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags or f'W/{etag}' in etags
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(header, size):
+    # Single byte ranges only, which is what browsers and media players send.
+    # None for anything else (multiple ranges, garbage), which is ignored
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        length = min(int(end), size)
+        return size - length, size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    end = min(int(end), size - 1) if end else size - 1
+    return start, end
+
+
+def serve_file(request, root, path):
+    try:
+        fullpath = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    try:
+        stat_result = os.stat(fullpath)
+    except OSError:
+        raise Http404
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404
+
+    content_type, _ = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+    cache_control = (
+        IMMUTABLE_CACHE_CONTROL if any(pattern.search(path) for pattern in IMMUTABLE_PATTERNS)
+        else REVALIDATE_CACHE_CONTROL
+    )
+    range_header = request.headers.get('Range')
+
+    # Serve a precompressed copy when the client takes it (never for ranges,
+    # which address bytes of the uncompressed file)
+    encoding = None
+    if not range_header:
+        accepted = request.headers.get('Accept-Encoding', '')
+        for name, extension in ENCODINGS:
+            if name in accepted:
+                try:
+                    compressed = os.stat(fullpath + extension)
+                except OSError:
+                    continue
+                encoding, fullpath, stat_result = name, fullpath + extension, compressed
+                break
+
+    etag = _etag(stat_result, f'-{encoding}' if encoding else '')
+    headers = {
+        'ETag': etag,
+        'Last-Modified': formatdate(stat_result.st_mtime, usegmt=True),
+        'Cache-Control': cache_control,
+        'Accept-Ranges': 'bytes',
+        'Vary': 'Accept-Encoding',
+    }
+
+    if _not_modified(request, etag, stat_result.st_mtime):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    size = stat_result.st_size
+    byte_range = None
+    if range_header:
+        # If-Range: only honour the range if the client's copy is current
+        if_range = request.headers.get('If-Range')
+        if if_range is None or if_range == etag:
+            byte_range = _parse_range(range_header, size)
+            # A range that parses but starts past the end can't be satisfied,
+            # one that doesn't parse gets the whole file
+            if byte_range is not None and byte_range[0] >= size:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+    file = open(fullpath, 'rb')
+    if byte_range is None:
+        # A whole file goes out through the server's wsgi.file_wrapper,
+        # which uses sendfile() (zero copy) where the server supports it
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        response = FileResponse(RangeFile(file, start, end - start + 1), content_type=content_type, status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    return serve_file(request, settings.MEDIA_ROOT, path)
+
+
+@require_safe
+def serve_static(request, path):
+    return serve_file(request, settings.STATIC_ROOT, path)
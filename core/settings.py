@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 import os
 
+from core.database import database_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -30,9 +32,21 @@ ALLOWED_HOSTS = []
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'ecommerce_app', 'api', 'media')
 MEDIA_URL = '/media/'
-
-# Default file storage backend for development
-DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+# Threads rendering product image variants in each server process
+PRODUCT_IMAGE_WORKERS = int(os.environ.get('PRODUCT_IMAGE_WORKERS', '2'))
+# Render variants right after the request commits instead (tests, local runs)
+PRODUCT_IMAGES_EAGER = os.environ.get('PRODUCT_IMAGES_EAGER') == '1'
+
+# Default file storage backend for development, collectstatic writes hashed
+# names plus .gz/.br copies
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'core.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 
 # # Use the default email backend
@@ -59,6 +73,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'ecommerce_app',
+    'user_app',
     'rest_framework',
     'rest_framework.authtoken',
     'django_filters',
@@ -66,6 +81,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ecommerce_app.metrics.PerformanceMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,10 +89,21 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ecommerce_app.replicas.ReplicaPinningMiddleware',
 ]
 
+# Fraction of requests timed by PerformanceMetricsMiddleware (0 turns it off)
+PERF_METRICS_SAMPLE_RATE = float(os.environ.get('PERF_METRICS_SAMPLE_RATE', '0.05'))
+# Which sampled responses get a Server-Timing header: 'all', 'staff' or 'off'.
+# The timings tell clients how the backend works, so by default only staff see them
+PERF_METRICS_SERVER_TIMING = os.environ.get('PERF_METRICS_SERVER_TIMING', 'staff')
+
 ROOT_URLCONF = 'core.urls'
 
+# Route cached catalog reads, contact messages and payment polls to async
+# views, set by core/asgi.py when running under an ASGI server
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -99,13 +126,79 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# DATABASE_URL picks the backend (see core.database.database_config), the
+# local SQLite file is the default. DB_CONN_MAX_AGE keeps connections open
+# between requests and DB_POOL_SIZE shares a pool of them between threads.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+    'default': database_config(
+        os.environ.get('DATABASE_URL', 'sqlite:///db.sqlite3'),
+        base_dir=BASE_DIR,
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        pool_size=int(os.environ.get('DB_POOL_SIZE', '0')),
+        pool_timeout=float(os.environ.get('DB_POOL_TIMEOUT', '30')),
+    )
+}
+
+# Read replicas, DATABASE_REPLICA_URLS is a comma separated list of URLs.
+# `manage.py replicate` copies the primary into SQLite replicas for local runs.
+for index, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(','))):
+    DATABASES[f'replica{index + 1}'] = {
+        **database_config(url, base_dir=BASE_DIR, conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', '60'))),
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['ecommerce_app.replicas.ReplicaRouter']
+# Clients read from the primary for this long after a write, pinned by a
+# signed cookie that any worker can check and by user id in the
+# REPLICA_PIN_CACHE_ALIAS cache, for token clients that keep no cookies
+REPLICA_PIN_SECONDS = 5
+# Replicas further behind than this are skipped for reads
+REPLICA_MAX_LAG_SECONDS = 5
+REPLICA_LAG_CHECK_INTERVAL = 1
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Catalog pages and product payloads, point this at a shared backend
+    # (e.g. redis or memcached) to share entries and invalidations between workers
+    'catalog': {
+        'BACKEND': os.environ.get('CATALOG_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CATALOG_CACHE_LOCATION', 'catalog'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
 
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_TIMEOUT = 300
+
+# Each process keeps its own product search index. Changes made through
+# the ORM signals are shared through a version counter in the catalog
+# cache; anything else (bulk_create, .update(), another codebase) shows up
+# once the index is older than SEARCH_INDEX_TTL seconds and is reloaded.
+SEARCH_INDEX_TTL = int(os.environ.get('SEARCH_INDEX_TTL', '300'))
+
+REPLICA_PIN_CACHE_ALIAS = os.environ.get('REPLICA_PIN_CACHE_ALIAS', CATALOG_CACHE_ALIAS)
+
+# Token -> user lookups are cached in each process for AUTH_TOKEN_CACHE_TTL
+# seconds, which bounds how long another process may still accept a token
+# revoked elsewhere. AUTH_TOKEN_CACHE_ALIAS adds a shared cache behind it.
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', '30'))
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_ALIAS = os.environ.get('AUTH_TOKEN_CACHE_ALIAS') or None
+AUTH_TOKEN_CACHE_SHARED_TTL = 300
+
+# API tokens expire after AUTH_TOKEN_TTL seconds without use. Using one
+# pushes its expiry back, at most once per AUTH_TOKEN_RENEW_INTERVAL.
+# Expired tokens are deleted by `manage.py sweep_auth_tokens`.
+AUTH_TOKEN_TTL = int(os.environ.get('AUTH_TOKEN_TTL', str(30 * 24 * 3600)))
+AUTH_TOKEN_RENEW_INTERVAL = int(os.environ.get('AUTH_TOKEN_RENEW_INTERVAL', '3600'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -125,6 +218,30 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# PASSWORD_HASHER_PROFILE picks the hasher new passwords are made with:
+# argon2 (the default), scrypt or pbkdf2. The others stay listed so
+# existing hashes keep verifying, and are upgraded on the next login.
+PASSWORD_HASHER_PROFILE = os.environ.get('PASSWORD_HASHER_PROFILE', 'argon2')
+_password_hashers = {
+    'argon2': 'user_app.hashers.Argon2PasswordHasher',
+    'scrypt': 'user_app.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [_password_hashers.pop(PASSWORD_HASHER_PROFILE), *_password_hashers.values(),
+                    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+# OWASP's minimum for argon2id: 19 MiB and two passes, single threaded
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', '2'))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', '19456'))  # KiB
+PASSWORD_ARGON2_PARALLELISM = 1
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', str(2 ** 14)))
+
+# Sign-ups hash their password on a pool of PASSWORD_HASHING_WORKERS
+# threads per process (0 hashes on the request thread). Beyond
+# PASSWORD_HASHING_QUEUE waiting sign-ups, registration answers 503.
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', '2'))
+PASSWORD_HASHING_QUEUE = int(os.environ.get('PASSWORD_HASHING_QUEUE', '16'))
+PASSWORD_HASHING_QUEUE_TIMEOUT = 5
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
@@ -142,6 +259,12 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Serve STATIC_ROOT and MEDIA_ROOT from Django itself (core.serving), with
+# ETags, ranges and long cache headers. Turn off behind a web server that
+# serves them directly.
+SERVE_FILES = os.environ.get('SERVE_FILES', '1') == '1'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -152,14 +275,60 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',  
-        'rest_framework.authentication.TokenAuthentication',
+        'user_app.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_THROTTLE_CLASSES': [
+        'ecommerce_app.throttling.TokenBucketThrottle',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'ecommerce_app.api.pagination.PageNumberOrKeysetPagination',
     'PAGE_SIZE': 10,
+    # Proxies in front of the server whose X-Forwarded-For entries are
+    # trusted. With 0, clients are told apart by REMOTE_ADDR only, so
+    # a forged header can't buy a fresh throttle bucket
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', '0')),
+}
+
+# Token buckets, as (tokens per second, burst). Each client, a user or
+# else an IP, has one bucket across all endpoints. A scope in
+# THROTTLE_CLIENT_SCOPE_RATES also has a bucket per client, and one in
+# THROTTLE_SCOPE_RATES a bucket shared by every client, capping the load
+# it may put on the site. A request's scope is its URL name (or the
+# view's get_throttle_scope()), and takes THROTTLE_COSTS[scope] tokens
+# from each of its buckets, 1 by default.
+THROTTLE_ENABLED = os.environ.get('THROTTLE_ENABLED', '1') == '1'
+THROTTLE_RATES = {
+    'user': (20, 200),
+    'anon': (10, 100),
+}
+THROTTLE_CLIENT_SCOPE_RATES = {
+    # 5 attempts, then one every 10 seconds
+    'login': (1, 50),
+    'register': (1, 50),
+    'contact_view': (1, 50),
 }
+THROTTLE_SCOPE_RATES = {
+    # 50 fuzzy searches a second for everyone together
+    'product-search': (500, 1000),
+}
+THROTTLE_COSTS = {
+    'product-search': 10,
+    'login': 10,
+    'register': 10,
+    'contact_view': 10,
+}
+# Buckets are kept per process, unless this names a cache to share them in
+THROTTLE_CACHE_ALIAS = os.environ.get('THROTTLE_CACHE_ALIAS') or None
+
+# Contact messages are spooled to a file per process and written in
+# batches of up to CONTACT_BUFFER_SIZE, at least every
+# CONTACT_BUFFER_INTERVAL seconds. `manage.py drain_contact_messages`
+# writes what processes that died left in CONTACT_SPOOL_DIR.
+CONTACT_BUFFER_SIZE = int(os.environ.get('CONTACT_BUFFER_SIZE', '100'))
+CONTACT_BUFFER_INTERVAL = float(os.environ.get('CONTACT_BUFFER_INTERVAL', '1'))
+CONTACT_SPOOL_DIR = os.environ.get('CONTACT_SPOOL_DIR', os.path.join(BASE_DIR, 'spool', 'contact'))
 
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
@@ -168,3 +337,20 @@ AUTHENTICATION_BACKENDS = [
 
 STRIPE_PUBLIC_KEY = 'pk_test_51OUyI5AB7c17WEYMdpeUHRAm8TL9gyJf8MnPnofWkSQslFkvBGp4U7BFgKm4uBDPqnUqPsz9qkHLIf9ckkY88KJD00fW56jACc'
 STRIPE_SECRET_KEY = 'sk_test_51OUyI5AB7c17WEYMRRxRm8yzPacZzdeunwydgwZ2fEPnI44kgkpYvw0irY0DLse5ZdDlT60S8D7JZeB0raBK7Hm100HOWFGP5x'
+
+# Payments are queued as PaymentJob rows and charged by `manage.py run_payment_worker`
+PAYMENT_GATEWAY = os.environ.get('PAYMENT_GATEWAY', 'ecommerce_app.payments.StripeGateway')
+# Charge right after the request commits instead of waiting for a worker (tests, local runs)
+PAYMENT_JOBS_EAGER = os.environ.get('PAYMENT_JOBS_EAGER') == '1'
+PAYMENT_JOB_MAX_ATTEMPTS = 5
+# A job stuck in processing this long is assumed abandoned by a dead worker
+PAYMENT_JOB_LEASE_SECONDS = 120
+# Workers announce finished jobs in this cache to wake the long polls of
+# payment/jobs/<pk>/wait/, so it has to be shared with the web processes
+PAYMENT_JOB_CACHE_ALIAS = os.environ.get('PAYMENT_JOB_CACHE_ALIAS', CATALOG_CACHE_ALIAS)
+# Connection limit of the HTTP client used by `run_payment_worker --concurrency`
+PAYMENT_GATEWAY_MAX_CONNECTIONS = int(os.environ.get('PAYMENT_GATEWAY_MAX_CONNECTIONS', '1000'))
+
+# Stock is held this long for an unpaid order, `manage.py sweep_stock_holds`
+# releases it afterwards
+STOCK_HOLD_TTL_SECONDS = int(os.environ.get('STOCK_HOLD_TTL_SECONDS', '900'))
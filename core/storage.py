@@ -0,0 +1,52 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:  # in requirements.txt, without it only gzip is written
+    brotli = None
+
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.json', '.svg', '.html', '.txt', '.xml', '.map', '.ico', '.ttf', '.eot'}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Hashed file names (app.1a2b3c4d5e6f.css) that can be cached forever,
+    plus .gz and .br copies of text files written at collectstatic time so
+    they are never compressed per request.
+    """
+
+    # Files added without collectstatic are served under their own name
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed = []
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed.append(hashed_name)
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+        for name in hashed:
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as source:
+            data = source.read()
+        encoders = [('gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            encoders.append(('br', lambda data: brotli.compress(data, quality=11)))
+        for extension, encode in encoders:
+            compressed = encode(data)
+            # Not worth a second file when it barely shrinks
+            if len(compressed) < len(data) * 0.95:
+                path = f'{name}.{extension}'
+                if self.exists(path):
+                    self.delete(path)
+                self._save(path, ContentFile(compressed))
@@ -1,8 +1,17 @@
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path , include
+from django.urls import path , include, re_path
+
+from core.serving import serve_media, serve_static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('ecommerce_app.api.urls')),
     path('account/', include('user_app.api.urls')),
 ]
+
+if settings.SERVE_FILES:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
+        re_path(r'^%s(?P<path>.+)$' % settings.STATIC_URL.lstrip('/'), serve_static, name='static'),
+    ]
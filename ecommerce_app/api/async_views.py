@@ -0,0 +1,139 @@
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from ecommerce_app.api.forms import ContactForm
+from ecommerce_app.api.serializers import PaymentJobSerializer
+from ecommerce_app.cache import catalog_cache
+from ecommerce_app.contact import contact_buffer
+from ecommerce_app.models import PaymentJob
+from ecommerce_app.payments import wait_for_job
+from ecommerce_app.throttling import scope_for, throttler
+
+
+# Longest a client may hold a payment job poll open, in seconds
+MAX_WAIT = 30
+
+
+def cached_catalog_view(kind, view):
+    """
+    Serve catalog cache hits straight from the event loop and hand
+    everything else (misses, the browsable API, writes) to the DRF `view`.
+    Hits take from the same throttle buckets the DRF view would.
+    """
+    sync_view = sync_to_async(view)
+
+    async def catalog_view(request, *args, **kwargs):
+        if request.method == 'GET' and wants_json(request):
+            data = await catalog_cache.aget(kind, request, kwargs.get('pk'))
+            if data is not None:
+                try:
+                    wait = await sync_to_async(throttle)(request, view.view_class())
+                except AuthenticationFailed:
+                    # The DRF view answers bad credentials
+                    return await sync_view(request, *args, **kwargs)
+                if wait:
+                    return throttled(wait)
+                response = HttpResponse(JSONRenderer().render(data), content_type='application/json')
+                response['Vary'] = 'Accept'
+                return response
+        return await sync_view(request, *args, **kwargs)
+
+    catalog_view.csrf_exempt = True
+    return catalog_view
+
+
+def wants_json(request):
+    return 'format' not in request.GET and 'text/html' not in request.headers.get('Accept', '')
+
+
+@csrf_exempt
+async def contact_view(request):
+    if request.method != 'POST':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+    # Anyone may post here, so it shares the DRF views' buckets per IP
+    wait = await sync_to_async(throttler.check)('contact_view', BaseThrottle().get_ident(request), False)
+    if wait:
+        return throttled(wait)
+
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'detail': 'JSON parse error'}, status=400)
+    else:
+        data = request.POST
+
+    form = ContactForm(data)
+    if not form.is_valid():
+        return JsonResponse({'error': 'Invalid form data'})
+    # Only appends a line to the spool file, quick enough for the event loop
+    contact_buffer.add(**form.cleaned_data)
+    return JsonResponse({'success': True})
+
+
+async def payment_job_wait_view(request, pk):
+    """
+    Long-poll a payment job: answer as soon as it has succeeded or failed,
+    or with its current state after ?timeout= seconds (at most MAX_WAIT).
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+    try:
+        user = await sync_to_async(authenticate)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({'detail': str(e.detail)}, status=e.status_code)
+    if user is None or not user.is_authenticated:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    try:
+        timeout = float(request.GET.get('timeout', MAX_WAIT))
+    except ValueError:
+        timeout = math.nan
+    if not math.isfinite(timeout):
+        return JsonResponse({'detail': 'timeout must be a number of seconds.'}, status=400)
+    timeout = min(max(timeout, 0), MAX_WAIT)
+
+    jobs = PaymentJob.objects.filter(pk=pk, user=user)
+    job = await jobs.afirst()
+    if job is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    if job.status not in ('succeeded', 'failed') and timeout:
+        await wait_for_job(job.pk, timeout)
+        job = await jobs.afirst()
+    return HttpResponse(JSONRenderer().render(PaymentJobSerializer(job).data), content_type='application/json')
+
+
+def drf_request(request):
+    # Same authenticators as the DRF views, so tokens and sessions both work
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    return Request(request, authenticators=authenticators)
+
+
+def authenticate(request):
+    return drf_request(request).user
+
+
+def throttle(request, view):
+    """Take the tokens TokenBucketThrottle would for `view`, returns 0 or the seconds to wait."""
+    request = drf_request(request)
+    user = request.user
+    authenticated = bool(user and user.is_authenticated)
+    ident = user.pk if authenticated else BaseThrottle().get_ident(request)
+    return throttler.check(scope_for(view, request), ident, authenticated)
+
+
+def throttled(wait):
+    response = JsonResponse({'detail': f'Request was throttled. Expected available in {math.ceil(wait)} seconds.'}, status=429)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
@@ -0,0 +1,134 @@
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination, _reverse_ordering
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination on a stable key, with no COUNT(*) and no OFFSET.
+
+    Views can set `keyset_ordering`, otherwise models with a `created`
+    field page on (-created, -id) and everything else on -id. Cursors hold
+    every field of the key, unlike DRF's which hold the first one and an
+    offset into its ties, so rows sharing a `created` page both ways.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        # Previous pages are read backwards from the first row of the page after
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(queryset.model, ordering, position))
+
+        # The extra row tells whether there is more beyond this page
+        rows = list(queryset[:self.page_size + 1])
+        self.page = rows[:self.page_size]
+        more = len(rows) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, more
+        else:
+            self.has_next, self.has_previous = more, position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def after(self, model, ordering, position):
+        # (a, b) comes after (x, y) when a comes after x, or a = x and b comes after y
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise ValueError
+            # Cursors come from clients, a value the field can't hold is a
+            # bad cursor rather than a failing query
+            values = [
+                model._meta.get_field(order.lstrip('-')).to_python(value)
+                for order, value in zip(ordering, values)
+            ]
+            if None in values:
+                raise ValueError
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        conditions, equal = [], {}
+        for order, value in zip(ordering, values):
+            field = order.lstrip('-')
+            conditions.append(Q(**equal, **{f'{field}__{"lt" if order.startswith("-") else "gt"}': value}))
+            equal[field] = value
+        return reduce(or_, conditions)
+
+    def position(self, row):
+        fields = [order.lstrip('-') for order in self.ordering]
+        return json.dumps([str(row[field] if isinstance(row, dict) else getattr(row, field)) for field in fields])
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.position(self.page[0])))
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'keyset_ordering', None)
+        if ordering:
+            return tuple(ordering)
+
+        field_names = {field.name for field in queryset.model._meta.get_fields()}
+        if 'created' in field_names:
+            return ('-created', '-id')
+        return ('-id',)
+
+
+class PageNumberOrKeysetPagination(PageNumberPagination):
+    """
+    Page number pagination by default, keyset pagination on request.
+
+    Clients opt in per request with `?pagination=cursor`, and keep paging
+    with the opaque `cursor` value from the `next`/`previous` links.
+    """
+
+    mode_query_param = 'pagination'
+    keyset_class = KeysetPagination
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.keyset_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.keyset is not None:
+            return self.keyset.to_html()
+        return super().to_html()
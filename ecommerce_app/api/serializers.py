@@ -1,14 +1,36 @@
 from rest_framework import serializers
 from django.db.models import Sum, F
 from decimal import Decimal
-from ecommerce_app.models import Product, Order, Cart, CartItem, Payment, Review, Wishlist
+from django.core.files.storage import default_storage
+from ecommerce_app.models import Product, ProductRating, Order, OrderSummary, Cart, CartItem, Payment, PaymentJob, Review, Wishlist
+from ecommerce_app.orders import OrderError, collapse_line_items, place_order
+from ecommerce_app.carts import CartError, apply_cart_operations
+
+class ProductRatingSerializer(serializers.ModelSerializer):
+    mean = serializers.FloatField(source='rating_mean', read_only=True)
+    count = serializers.IntegerField(source='review_count', read_only=True)
+    histogram = serializers.DictField(read_only=True)
+
+    class Meta:
+        model = ProductRating
+        fields = ['count', 'mean', 'histogram']
+
+
+def _media_url(path, request):
+    url = default_storage.url(path)
+    return request.build_absolute_uri(url) if request is not None else url
+
 
 class ProductSerializer(serializers.ModelSerializer):
     initial_stock_quantity = serializers.IntegerField(write_only=True)
+    rating = serializers.SerializerMethodField()
+    # Stock minus what is held for unpaid orders
+    available_quantity = serializers.IntegerField(read_only=True)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        exclude = ('user',)
+        exclude = ('user', 'stock_reserved')
 
     def validate(self, data):
         # Ensure that required fields are present in the request
@@ -21,6 +43,29 @@ class ProductSerializer(serializers.ModelSerializer):
 
         return data
 
+    def get_rating(self, obj):
+        # Read from the materialized summary, select_related('rating_summary') avoids a query per product
+        try:
+            summary = obj.rating_summary
+        except ProductRating.DoesNotExist:
+            summary = ProductRating(product=obj)
+        return ProductRatingSerializer(summary).data
+
+    def get_image_variants(self, obj):
+        # {'thumb': {'width': 200, 'height': 200, 'webp': url, 'jpeg': url}, 'w320': ...},
+        # empty until the variants of the current image have been rendered
+        manifest = obj.image_variants or {}
+        if not obj.image or manifest.get('source') != obj.image.name:
+            return {}
+        request = self.context.get('request')
+        variants = {}
+        for name, entry in manifest['variants'].items():
+            variants[name] = {
+                key: value if key in ('width', 'height') else _media_url(value, request)
+                for key, value in entry.items()
+            }
+        return variants
+
     def create(self, validated_data):
         # Set the initial stock quantity when creating a new product
         initial_stock_quantity = validated_data.pop('initial_stock_quantity', 0)
@@ -43,22 +88,30 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         exclude = ('user', 'amount')
+        read_only_fields = ('needs_attention',)
 
     def create(self, validated_data):
         products_data = validated_data.pop('products')
-        order = super().create(validated_data)
 
-        
-        for product_data in products_data:
-            product_id = product_data['product']
-            quantity = product_data['quantity']
-            order.products.add(Product.objects.get(pk=product_id), through_defaults={'quantity': quantity})
+        # Stock check, stock decrement, order and line items all happen in
+        # one transaction with a constant number of queries
+        try:
+            quantities = collapse_line_items(products_data)
+            return place_order(**validated_data, quantities=quantities)
+        except OrderError as e:
+            raise serializers.ValidationError({'detail': str(e)})
+
 
-        # Calculate and update the order amount based on the added products
-        order.amount = order.products.aggregate(total_amount=Sum(F('price')))['total_amount'] or Decimal(0)
-        order.save()
+class OrderSummarySerializer(serializers.ModelSerializer):
+    # Everything comes off the one summary row, line items included
+    id = serializers.IntegerField(source='order_id', read_only=True)
 
-        return order
+    class Meta:
+        model = OrderSummary
+        fields = [
+            'id', 'status', 'is_shipped', 'shipping_date', 'total', 'item_count', 'line_items', 'created', 'updated',
+        ]
+        read_only_fields = fields
         
 
         
@@ -75,11 +128,36 @@ class CartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = '__all__'
+
+
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+    product = serializers.IntegerField()
+    # add: how many to add, set: the new quantity (0 removes the item)
+    quantity = serializers.IntegerField(min_value=0, default=1)
+
+    def validate(self, data):
+        if data['op'] == 'add' and data['quantity'] < 1:
+            raise serializers.ValidationError({'quantity': 'Must be at least 1 when adding.'})
+        return data
+
+
+class CartBulkSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=500)
+
+    def save(self, cart):
+        try:
+            return apply_cart_operations(cart, self.validated_data['operations'])
+        except CartError as e:
+            raise serializers.ValidationError({'detail': str(e)})
         
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = ['order', 'payment_method', 'transaction_details', 'status','stripe_token']
+        # An order whose payment failed is paid again, enqueue_payment keeps
+        # it from being charged twice
+        extra_kwargs = {'order': {'validators': []}}
 
     stripe_token = serializers.CharField(write_only=True)
     
@@ -99,6 +177,13 @@ class CartPaymentSerializer(serializers.Serializer):
             raise serializers.ValidationError("Invalid cart ID.")
 
         return value
+
+
+class PaymentJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PaymentJob
+        fields = ['id', 'kind', 'order', 'status', 'result', 'attempts', 'idempotency_key', 'created', 'updated']
+        read_only_fields = fields
         
         
 class ReviewSerializer(serializers.ModelSerializer):
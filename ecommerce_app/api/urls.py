@@ -1,20 +1,22 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from ecommerce_app.api.views import (
     # Product Views
     ProductListView, ProductDetailView, ProductCreateView, ProductUpdateView, ProductDeleteView,
+    CatalogCacheStatsView,
     
     # Order Views
-    OrderListView, OrderDetailView, OrderCreateView, OrderUpdateView, OrderDeleteView,
+    OrderListView, OrderHistoryView, OrderDetailView, OrderCreateView, OrderUpdateView, OrderDeleteView,
     
     # Cart Views
-    CartDetailView, CartAddProductView, CartRemoveProductView, CartUpdateProductQuantityView,
+    CartDetailView, CartAddProductView, CartBulkUpdateView, CartRemoveProductView, CartUpdateProductQuantityView,
     
     # CartItem Views
     CartItemCreateView, CartItemUpdateView, CartItemDeleteView, CartItemListAPIView,
     
     # Payment Views
-    PaymentProcessView, CartPaymentProcessView , PaymentDetailView, PaymentListView, 
+    PaymentProcessView, CartPaymentProcessView , PaymentDetailView, PaymentListView, PaymentJobDetailView,
     
     # Review Views
     ReviewListView, ReviewCreateView,
@@ -38,7 +40,11 @@ from ecommerce_app.api.views import (
     #Contact View
     ContactView,
 
+    # Metrics View
+    MetricsView,
+
 )
+from ecommerce_app.api.async_views import cached_catalog_view, contact_view, payment_job_wait_view
 
 router = DefaultRouter()
 router.register(r'wishlist', WishlistViewSet, basename='wishlist')
@@ -50,9 +56,11 @@ urlpatterns = [
     path('products/create/', ProductCreateView.as_view(), name='product-create'),
     path('products/<int:pk>/update/', ProductUpdateView.as_view(), name='product-update'),
     path('products/<int:pk>/delete/', ProductDeleteView.as_view(), name='product-delete'),
+    path('products/cache/stats/', CatalogCacheStatsView.as_view(), name='product-cache-stats'),
 
     # Order URLs
     path('orders/', OrderListView.as_view(), name='order-list'),
+    path('orders/history/', OrderHistoryView.as_view(), name='order-history'),
     path('orders/<int:pk>/', OrderDetailView.as_view(), name='order-detail'),
     path('orders/create/', OrderCreateView.as_view(), name='order-create'),
     path('orders/<int:pk>/update/', OrderUpdateView.as_view(), name='order-update'),
@@ -63,6 +71,7 @@ urlpatterns = [
     path('cart/<int:pk>/remove/', CartRemoveProductView.as_view(), name='cart-remove-product'),
     path('cart/<int:pk>/update/', CartUpdateProductQuantityView.as_view(), name='cart-update-product-quantity'),
     path('cart/add/', CartAddProductView.as_view(), name='cart-add-product'),
+    path('cart/bulk/', CartBulkUpdateView.as_view(), name='cart-bulk'),
     
 
     # CartItem URLs
@@ -76,6 +85,8 @@ urlpatterns = [
     path('payment/cart/process/', CartPaymentProcessView.as_view(), name='payment-cart-process'),
     path('payment/<int:pk>/', PaymentDetailView.as_view(), name='payment-detail'),
     path('payments/', PaymentListView.as_view(), name='payment-list'),
+    path('payment/jobs/<int:pk>/', PaymentJobDetailView.as_view(), name='payment-job-detail'),
+    path('payment/jobs/<int:pk>/wait/', payment_job_wait_view, name='payment-job-wait'),
 
     # Review URLs
     path('reviews/', ReviewListView.as_view(), name='review-list'),
@@ -115,4 +126,18 @@ urlpatterns = [
     
     # Contact URLs
     path('contact/', ContactView.as_view(), name='contact_view'),
+
+    # Metrics URLs
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
+
+# Under ASGI these come first, so cached catalog reads and contact
+# messages are answered on the event loop without taking a thread
+async_urlpatterns = [
+    path('products/', cached_catalog_view('list', ProductListView.as_view()), name='product-list'),
+    path('products/<int:pk>/', cached_catalog_view('detail', ProductDetailView.as_view()), name='product-detail'),
+    path('contact/', contact_view, name='contact_view'),
+]
+
+if settings.ASYNC_VIEWS:
+    urlpatterns = async_urlpatterns + urlpatterns
@@ -8,27 +8,36 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser , AllowAny
 from rest_framework.exceptions import PermissionDenied
 from rest_framework import serializers
 from ecommerce_app.models import (
-    Product, Order, Cart, CartItem, Payment, Review, Wishlist, ContactMessage
+    Product, Order, OrderSummary, Cart, CartItem, Payment, PaymentJob, Review, Wishlist, ContactMessage
 )
 from ecommerce_app.api.serializers import (
-    ProductSerializer, OrderSerializer, CartSerializer, CartItemSerializer,
-    PaymentSerializer, CartPaymentSerializer ,ReviewSerializer,
+    ProductSerializer, OrderSerializer, OrderSummarySerializer, CartSerializer, CartItemSerializer,
+    PaymentSerializer, CartPaymentSerializer, CartBulkSerializer, PaymentJobSerializer, ReviewSerializer,
     WishlistSerializer
 )
-from django.http import Http404, JsonResponse
+from django.http import Http404, JsonResponse, HttpResponse
 from django.conf import settings
-import stripe
 from django.contrib.auth.models import AnonymousUser
 from rest_framework.pagination import PageNumberPagination
+from ecommerce_app.api.pagination import KeysetPagination, PageNumberOrKeysetPagination
 from rest_framework.decorators import action
 from rest_framework.viewsets import ModelViewSet
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from django.utils import timezone
 from datetime import datetime, timedelta
 from rest_framework.exceptions import ValidationError
 from rest_framework import generics, filters
 from django_filters.rest_framework import DjangoFilterBackend
-from fuzzywuzzy import fuzz
+from ecommerce_app.search import product_index
+from ecommerce_app.cache import catalog_cache
+from ecommerce_app.contact import contact_buffer
+from ecommerce_app.payments import enqueue_payment, live_job
+from ecommerce_app.orders import OrderError, place_order
+from ecommerce_app.metrics import registry as metrics_registry
+from ecommerce_app.replicas import ReplicaReadMixin
 
 from .forms import ContactForm
 from django.core.mail import send_mail
@@ -41,10 +50,10 @@ from django.views.decorators.csrf import csrf_exempt
 #---------------------------- Product Views -------------------------------------
 
 
-class ProductListView(generics.ListAPIView):
+class ProductListView(ReplicaReadMixin, generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
-    pagination_class = PageNumberPagination
+    pagination_class = PageNumberOrKeysetPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]  # Add SearchFilter and DjangoFilterBackend
     search_fields = ['name']  # Specify the fields you want to search
 
@@ -54,7 +63,7 @@ class ProductListView(generics.ListAPIView):
         search_term = self.request.query_params.get('search')
 
         # If a category is specified, filter the queryset by that category
-        queryset = Product.objects.all()
+        queryset = Product.objects.select_related('rating_summary').order_by('id')
         if category:
             queryset = queryset.filter(category=category)
 
@@ -64,31 +73,53 @@ class ProductListView(generics.ListAPIView):
 
         return queryset
 
+    def get_throttle_scope(self, request):
+        # Fuzzy searches cost more than browsing, see THROTTLE_COSTS
+        return 'product-search' if request.query_params.get('search') else 'product-list'
+
+    def list(self, request, *args, **kwargs):
+        # Serve repeated catalog pages from the cache without touching the ORM
+        key = catalog_cache.key('list', request)
+        return catalog_cache.fetch(
+            key,
+            lambda: super(ProductListView, self).list(request, *args, **kwargs),
+            products=lambda data: [product['id'] for product in data['results']],
+        )
+
     def fuzzy_search(self, queryset, field, search_term):
-        # Perform fuzzy search using fuzzywuzzy's process method
-        results = []
-        for item in queryset:
-            ratio = fuzz.partial_ratio(search_term.lower(), getattr(item, field).lower())
-            if ratio >= 80:  # You can adjust the threshold as needed
-                results.append(item)
+        # Look the term up in the in-process name index instead of scoring
+        # every product row in Python
+        matched_ids = product_index.search(search_term)
 
         # Check if there are any matching items
-        if not results:
+        if not matched_ids:
             return queryset.none()
 
-        # Create a new queryset with the matched items
-        matched_items = Product.objects.filter(pk__in=[item.pk for item in results])
-
-        # Return the queryset of matched items
-        return matched_items
+        # Narrow the (possibly category filtered) queryset to the matches
+        return queryset.filter(pk__in=matched_ids)
 
-class ProductDetailView(RetrieveAPIView):
+class ProductDetailView(ReplicaReadMixin, RetrieveAPIView):
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
 
     def get_queryset(self):
         # Provide a default queryset for all users
-        return Product.objects.all()
+        return Product.objects.select_related('rating_summary')
+
+    def retrieve(self, request, *args, **kwargs):
+        key = catalog_cache.key('detail', request, kwargs['pk'])
+        return catalog_cache.fetch(
+            key,
+            lambda: super(ProductDetailView, self).retrieve(request, *args, **kwargs),
+            products=lambda data: [data['id']],
+        )
+
+
+class CatalogCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(catalog_cache.stats())
 
 class ProductCreateView(CreateAPIView):
     permission_classes = [IsAdminUser]
@@ -130,18 +161,28 @@ class ProductDeleteView(DestroyAPIView):
 #---------------------------- Order Views -------------------------------------
 
 
-class OrderListView(ListAPIView):
+class OrderListView(ReplicaReadMixin, ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         if self.request.user.is_authenticated:
+            # Newest first, read straight off the (user, created) indexes
             if self.request.user.is_staff:
-                return Order.objects.all()
-            return Order.objects.filter(user=self.request.user)
+                return Order.objects.order_by('-created', '-id')
+            return Order.objects.filter(user=self.request.user).order_by('-created', '-id')
         else:
             return Order.objects.none()
 
+class OrderHistoryView(ReplicaReadMixin, ListAPIView):
+    serializer_class = OrderSummarySerializer
+    permission_classes = [IsAuthenticated]
+    # No COUNT(*), each page is one query on the (user, created) index
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return OrderSummary.objects.filter(user=self.request.user)
+
 class OrderDetailView(RetrieveAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
@@ -170,33 +211,10 @@ class OrderCreateView(CreateAPIView):
         serializer = self.get_serializer(data=request.data, context={'user': request.user})
         serializer.is_valid(raise_exception=True)
 
-        # Calculate the total amount based on the prices of products in the order
-        products_data = serializer.validated_data['products']
-        total_amount = sum(Product.objects.get(pk=product['product']).price * product['quantity'] for product in products_data)
-
-        # Update the amount field in the serializer data
-        serializer.validated_data['amount'] = total_amount
-
-        self.check_stock_availability(products_data)
+        # The serializer prices the order and reserves stock atomically
         self.perform_create(serializer)
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
-
-    def check_stock_availability(self, products_data):
-        for product_data in products_data:
-            try:
-                # Assuming product ID is directly present in the product data
-                product_id = product_data['product']
-                quantity = product_data['quantity']
-
-                product = Product.objects.get(pk=product_id)
-
-                if quantity > product.stock_quantity:
-                    raise serializers.ValidationError({'detail': f"Not enough stock for product {product.name}. Available stock: {product.stock_quantity}"})
-            except KeyError:
-                raise serializers.ValidationError({'detail': "Product data is missing the required fields."})
-            except Product.DoesNotExist:
-                raise serializers.ValidationError({'detail': f"Product with ID {product_id} does not exist."})
             
             
 class OrderUpdateView(UpdateAPIView):
@@ -214,8 +232,9 @@ class OrderUpdateView(UpdateAPIView):
         serializer = self.get_serializer(instance, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
 
-        if 'is_shipped' in request.data and request.data['is_shipped']:
-            instance.mark_as_shipped()
+        # Shipping stamps the date, the summary picks both up on save
+        if serializer.validated_data.get('is_shipped') and not instance.shipping_date:
+            serializer.validated_data['shipping_date'] = timezone.now()
 
         self.perform_update(serializer)
 
@@ -243,12 +262,15 @@ class CartDetailView(RetrieveAPIView):
     def get_queryset(self):
         user = self.request.user
 
+        # Load the nested cart items in one query instead of one per cart
+        carts = Cart.objects.prefetch_related('cart_items')
+
         if user.is_authenticated and user.is_staff:
             # Admin can view all carts
-            return Cart.objects.all()
+            return carts
         elif user.is_authenticated:
             # Regular user can view only their own cart
-            return Cart.objects.filter(user=user)
+            return carts.filter(user=user)
         else:
             # Anonymous user has no access
             return Cart.objects.none()
@@ -264,30 +286,49 @@ class CartAddProductView(CreateAPIView):
 
         if not products_data:
             return Response({'detail': 'No products provided'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(products_data, list) or not all(isinstance(entry, dict) for entry in products_data):
+            return Response(
+                {'detail': 'products must be a list of {"product": id, "quantity": n} objects'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        cart = self.get_or_create_cart()
-
-        for product_entry in products_data:
-            product_id = product_entry.get('product')
-            quantity = product_entry.get('quantity', 1)  # Default to 1 if quantity is not provided
-
-            # You can perform additional validation here, such as checking if the product exists
-            product = Product.objects.get(pk=product_id)
-            cart_item, created = CartItem.objects.get_or_create(product=product, cart=cart, defaults={'quantity': quantity})
-
-        serializer = CartItemSerializer(cart_item)
+        # Adding is an 'add' batch on the bulk path, so quantities of items
+        # already in the cart go up instead of being ignored
+        operations = [
+            {'op': 'add', 'product': entry.get('product'), 'quantity': entry.get('quantity', 1)}
+            for entry in products_data
+        ]
+        bulk = CartBulkSerializer(data={'operations': operations})
+        bulk.is_valid(raise_exception=True)
+        items = bulk.save(self.get_or_create_cart())
+
+        # Answer with the item of the last product sent, like adding one by
+        # one did, whatever order the upsert returned the items in
+        last = bulk.validated_data['operations'][-1]['product']
+        serializer = CartItemSerializer(next(item for item in items if item.product_id == last))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def get_or_create_cart(self):
-        user = self.request.user
-        cart, created = Cart.objects.get_or_create(user=user)
-        if created:
-            print(f"A new cart was created for user: {user}")
+        cart, _ = Cart.objects.get_or_create(user=self.request.user)
         return cart
 
+class CartBulkUpdateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        # Apply a batch of add/set/remove operations to the user's cart in
+        # one transaction and return the whole cart
+        serializer = CartBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        serializer.save(cart)
+
+        prefetch_related_objects([cart], 'cart_items')
+        return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
+
 class CartRemoveProductView(DestroyAPIView):
     permission_classes = [IsAuthenticated | IsAdminUser]
-    queryset = CartItem.objects.all()
+    queryset = CartItem.objects.select_related('cart')
     serializer_class = CartItemSerializer
 
     def destroy(self, request, *args, **kwargs):
@@ -304,7 +345,7 @@ class CartRemoveProductView(DestroyAPIView):
             return Response({'detail': 'CartItem not found'}, status=status.HTTP_404_NOT_FOUND)
 
 class CartUpdateProductQuantityView(UpdateAPIView):
-    queryset = CartItem.objects.all()
+    queryset = CartItem.objects.select_related('cart')
     serializer_class = CartItemSerializer
     permission_classes = [IsAuthenticated | IsAdminUser]
 
@@ -356,57 +397,48 @@ class CartItemListAPIView(ListAPIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 #----------------------------------------------------------------------------------------------------------
 
+def get_idempotency_key(request):
+    # Clients retrying a payment send the same key to get the same job back
+    return request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
+
+
+def payment_job_response(request, job, created):
+    data = PaymentJobSerializer(job).data
+    data['status_url'] = request.build_absolute_uri(reverse('payment-job-detail', args=[job.pk]))
+    return Response(data, status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK)
+
+
 class PaymentProcessView(CreateAPIView):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated]
 
-    def perform_create(self, serializer):
+    def create(self, request, *args, **kwargs):
+        # A replayed request returns the job it created the first time
+        idempotency_key = get_idempotency_key(request)
+        if idempotency_key:
+            job = PaymentJob.objects.filter(user=request.user, idempotency_key=idempotency_key).first()
+            if job is not None:
+                return payment_job_response(request, job, created=False)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         order = serializer.validated_data['order']
 
         # Check if the user is the owner of the order or an admin
         if not (self.request.user.is_staff or self.request.user == order.user):
             raise PermissionDenied("You do not have permission to perform this action.")
 
-        # Check if the user is authenticated
-        if not self.request.user.is_authenticated or isinstance(self.request.user, AnonymousUser):
-            raise PermissionDenied("You must be authenticated to perform this action.")
-
-        serializer.validated_data['user'] = self.request.user
-
-        # Process payment using the Stripe API
-        stripe.api_key = 'sk_test_51OUyI5AB7c17WEYMRRxRm8yzPacZzdeunwydgwZ2fEPnI44kgkpYvw0irY0DLse5ZdDlT60S8D7JZeB0raBK7Hm100HOWFGP5x'  # Replace with your actual Stripe secret key
-        stripe_token = serializer.validated_data['stripe_token']
-
-        try:
-            total_amount = 0
-
-            # Calculate the total amount based on the products in the order
-            for product in order.products.all():
-                total_amount += product.price * product.stock_quantity  # Assuming you have a unit_price field in your Product model
-
-            charge = stripe.Charge.create(
-                amount=int(total_amount * 100),  # Convert amount to cents
-                currency='usd',
-                source=stripe_token,
-                description='Payment for Order #{}'.format(order.id),
-            )
-
-            # Set the shipping date to today + 3 days (you can adjust this logic based on your requirements)
-            shipping_date = datetime.now() + timedelta(days=3)
-
-            transaction_details = {
-                'charge_id': charge.id,
-                'payment_status': charge.status,
-                'shipping_date': shipping_date.strftime('%Y-%m-%d %H:%M:%S'),  # Convert datetime to string
-                'payment_amount': total_amount,  # Total amount based on the products in the order
-            }
-            serializer.save(transaction_details=transaction_details, status='success')
-
-        except stripe.error.CardError as e:
-            # Handle card error
-            serializer.save(transaction_details={'error': str(e)}, status='failed')
-            raise serializers.ValidationError({'detail': 'Payment failed. {}'.format(str(e))})
+        # The gateway call happens on a payment worker, not on this thread
+        job, created = enqueue_payment(
+            user=request.user,
+            kind='order',
+            order=order,
+            stripe_token=serializer.validated_data['stripe_token'],
+            idempotency_key=idempotency_key,
+            payment_method=serializer.validated_data['payment_method'],
+        )
+        return payment_job_response(request, job, created)
         
 class CartPaymentProcessView(CreateAPIView):
     serializer_class = CartPaymentSerializer
@@ -420,114 +452,56 @@ class CartPaymentProcessView(CreateAPIView):
             raise PermissionDenied("Invalid cart ID.")
 
     def create_order(self, cart):
-        order = Order.objects.create(user=self.request.user, amount=0, status='pending')
-
-        for cart_item in cart.cart_items.all():
-            order.amount += cart_item.product.price * cart_item.quantity
-
-        order.save()
-        return order
-
-    def process_payment(self, order, stripe_token):
-        stripe.api_key = 'sk_test_51OUyI5AB7c17WEYMRRxRm8yzPacZzdeunwydgwZ2fEPnI44kgkpYvw0irY0DLse5ZdDlT60S8D7JZeB0raBK7Hm100HOWFGP5x'
-
+        # Entering checkout holds the cart's stock until the payment settles
+        quantities = dict(cart.cart_items.values_list('product_id', 'quantity'))
         try:
-            # Ensure the amount is a positive integer
-            amount_in_cents = int(order.amount * 100)
-            if amount_in_cents < 1:
-                raise ValueError("Invalid amount value")
-
-            charge = stripe.Charge.create(
-                amount=amount_in_cents,
-                currency='usd',
-                source=stripe_token,
-                description='Payment for Order #{}'.format(order.id),
-            )
-
-            transaction_details = {
-                'charge_id': charge.id,
-                'payment_status': charge.status,
-            }
+            return place_order(self.request.user, quantities, status='pending')
+        except OrderError as e:
+            raise ValidationError({'detail': str(e)})
 
-            Payment.objects.create(
+    def create(self, request, *args, **kwargs):
+        # A replayed request returns the job it created the first time
+        idempotency_key = get_idempotency_key(request)
+        if idempotency_key:
+            job = PaymentJob.objects.filter(user=request.user, idempotency_key=idempotency_key).first()
+            if job is not None:
+                return payment_job_response(request, job, created=False)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart = self.get_cart(serializer.validated_data['cart_id'])
+        # Checking out again while the cart's payment runs would order it twice
+        job = live_job(cart=cart)
+        if job is not None:
+            return payment_job_response(request, job, created=False)
+
+        with transaction.atomic():
+            order = self.create_order(cart)
+
+            # The charge, the payment record, emptying the cart and shipping
+            # all happen on a payment worker once the gateway answers
+            job, created = enqueue_payment(
+                user=request.user,
+                kind='cart',
                 order=order,
-                payment_method='stripe',
-                transaction_details=transaction_details,
-                status='success',
-                user=self.request.user,
-                stripe_token=stripe_token
+                cart=cart,
+                stripe_token=serializer.validated_data['stripe_token'],
+                idempotency_key=idempotency_key,
             )
+            if not created:
+                # Lost a race with the same request or cart, drop the duplicate order
+                transaction.set_rollback(True)
 
-        except stripe.error.StripeError as e:
-            # Handle Stripe errors
-            return Response({'detail': 'Payment failed. {}'.format(str(e))}, status=status.HTTP_400_BAD_REQUEST)
-
-        except ValueError as e:
-            # Handle value error for invalid amount
-            return Response({'detail': 'Invalid amount value. {}'.format(str(e))}, status=status.HTTP_400_BAD_REQUEST)
-
-        except Exception as e:
-            # Handle other exceptions
-            return Response({'detail': 'An unexpected error occurred. {}'.format(str(e))}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return payment_job_response(request, job, created)
 
-    def clear_cart(self, cart):
-        cart.cart_items.all().delete()
 
-    def update_shipping_status(self, order):
-        order.is_shipped = True
-        order.shipping_date = timezone.now()
-        order.save()
-
-    def perform_create(self, serializer):
-        cart_id = serializer.validated_data['cart_id']
-        stripe_token = serializer.validated_data['stripe_token']
-
-        cart = self.get_cart(cart_id)
-        order = self.create_order(cart)
+class PaymentJobDetailView(RetrieveAPIView):
+    serializer_class = PaymentJobSerializer
+    permission_classes = [IsAuthenticated]
 
-        try:
-            self.process_payment(order, stripe_token)
-            self.clear_cart(cart)
-            self.update_shipping_status(order)
-
-            # Print statements for debugging
-            print("Payment successful and products shipped.")
-            print(f"Order ID: {order.id}")
-            print(f"Amount Paid: {order.amount}")
-            print(f"Charge ID: {order.payment.transaction_details.get('charge_id', '')}")
-            print(f"Payment Status: {order.payment.transaction_details.get('payment_status', '')}")
-            print(f"Shipping Date: {order.shipping_date}")
-
-            # Return a detailed response for testing
-            return Response({
-                'detail': 'Payment successful and products shipped.',
-                'order_id': order.id,
-                'amount_paid': order.amount,
-                'charge_id': order.payment.transaction_details.get('charge_id', ''),
-                'payment_status': order.payment.transaction_details.get('payment_status', ''),
-                'shipping_date': order.shipping_date,
-            }, status=status.HTTP_200_OK)
-
-        except stripe.error.StripeError as e:
-            # Print statements for debugging
-            print(f"StripeError: {str(e)}")
-
-            # Handle Stripe errors
-            return Response({'detail': 'Payment failed. {}'.format(str(e))}, status=status.HTTP_400_BAD_REQUEST)
-
-        except ValueError as e:
-            # Print statements for debugging
-            print(f"ValueError: {str(e)}")
-
-            # Handle value error for invalid amount
-            return Response({'detail': 'Invalid amount value. {}'.format(str(e))}, status=status.HTTP_400_BAD_REQUEST)
-
-        except Exception as e:
-            # Print statements for debugging
-            print(f"Unexpected Error: {str(e)}")
-
-            # Handle other exceptions
-            return Response({'detail': 'An unexpected error occurred. {}'.format(str(e))}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    def get_queryset(self):
+        # Clients poll this until the job has succeeded or failed
+        return PaymentJob.objects.filter(user=self.request.user)
 
 
 class PaymentDetailView(RetrieveAPIView):
@@ -544,7 +518,7 @@ class PaymentDetailView(RetrieveAPIView):
             # Handle the case where the user is not authenticated
             return Payment.objects.none()
 
-class PaymentListView(ListAPIView):
+class PaymentListView(ReplicaReadMixin, ListAPIView):
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated]
 
@@ -553,15 +527,16 @@ class PaymentListView(ListAPIView):
 
         # Check if the user is authenticated and not an AnonymousUser
         if user.is_authenticated and not isinstance(user, AnonymousUser):
-            return Payment.objects.filter(user=user)
+            return Payment.objects.filter(user=user).order_by('-id')
         else:
             # Handle the case where the user is not authenticated or is AnonymousUser
             return Payment.objects.none()
 
 #------------------------------------------------------------------------------------------------------
 
-class ReviewListView(ListAPIView):
-    queryset = Review.objects.all()
+class ReviewListView(ReplicaReadMixin, ListAPIView):
+    # Pages need a stable order, newest first
+    queryset = Review.objects.order_by('-id')
     serializer_class = ReviewSerializer
 
 class ReviewCreateView(CreateAPIView):
@@ -634,10 +609,17 @@ class ReviewCreateView(CreateAPIView):
 #--------------------------------------------------------------------------------------------------------
 
 class WishlistViewSet(ModelViewSet):
-    queryset = Wishlist.objects.all()
+    queryset = Wishlist.objects.order_by('-id')
     serializer_class = WishlistSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            # Serialize every wishlist's product ids from one extra query
+            queryset = queryset.prefetch_related('products')
+        return queryset
+
     def perform_create(self, serializer):
         #it sets the user based on the user making the request
         serializer.save(user=self.request.user)
@@ -667,7 +649,7 @@ class WishlistViewSet(ModelViewSet):
     @action(detail=True, methods=['get'])
     def list_products(self, request, pk=None): 
         wishlist = self.get_object()
-        serializer = ProductSerializer(wishlist.products.all(), many=True)
+        serializer = ProductSerializer(wishlist.products.select_related('rating_summary'), many=True)
         return Response(serializer.data)
 
 
@@ -732,8 +714,8 @@ class ContactView(APIView):
             email = form.cleaned_data['email']
             message = form.cleaned_data['message']
 
-            # Save the message to the database
-            ContactMessage.objects.create(name=name, email=email, message=message)
+            # Queue the message, it is saved with the others of its batch
+            contact_buffer.add(name, email, message)
 
             return Response({'success': True})
         else:
@@ -747,4 +729,14 @@ class ContactView(APIView):
 
     
     
-    
\ No newline at end of file
+    
+
+
+#---------------------------------------------------------------------------------------------------------
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        # Per-route request metrics of this process, in Prometheus text format
+        return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
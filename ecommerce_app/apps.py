@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class EcommerceAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ecommerce_app'
+
+    def ready(self):
+        # Register the model signal handlers
+        from ecommerce_app import signals  # noqa: F401
+
+        # WAL, synchronous=NORMAL and a busy timeout for every SQLite connection
+        from django.db.backends.signals import connection_created
+        from core.database import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='configure_sqlite')
@@ -0,0 +1,160 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+
+class CatalogCache:
+    """
+    Read-through cache for catalog payloads.
+
+    Keys embed a catalog-wide version number, bumped when products are
+    added, edited or deleted, which can change any page. Stock and rating
+    changes only stamp the products they touch with the tick of a shared
+    clock, and a payload built before the stamp of a product it shows is
+    stale. The backend is whatever cache alias CATALOG_CACHE_ALIAS points
+    at (local memory by default).
+    """
+
+    VERSION_KEY = 'catalog:version'
+    CLOCK_KEY = 'catalog:clock'
+    INVALIDATED_KEY = 'catalog:invalidated'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+    def version(self):
+        return self._counter(self.VERSION_KEY)
+
+    def _counter(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            # Seed from the clock so an evicted counter never goes back
+            self.backend.add(key, time.time_ns(), timeout=None)
+            value = self.backend.get(key)
+        return value
+
+    def _product_key(self, pk):
+        return f'catalog:product:{pk}'
+
+    def key(self, kind, request, pk=None):
+        return self._key(kind, request, pk, self.version())
+
+    def _key(self, kind, request, pk, version):
+        # Payloads carry absolute URLs, so the host is part of the key. Async
+        # views pass the plain Django request, which has no query_params
+        params = sorted(getattr(request, 'query_params', request.GET).lists())
+        digest = hashlib.md5(f'{request.get_host()}|{pk}|{params}'.encode()).hexdigest()
+        return f'catalog:{kind}:{version}:{digest}'
+
+    async def aget(self, kind, request, pk=None):
+        """Return the cached payload or None, without blocking the event loop."""
+        version = await self.backend.aget(self.VERSION_KEY)
+        if version is None:
+            return None
+        entry = await self.backend.aget(self._key(kind, request, pk, version))
+        if entry is None:
+            return None
+        stamps = await self.backend.aget_many(self._stamp_keys(entry))
+        if self._stale(entry, stamps):
+            return None
+        self._count(hit=True)
+        return entry['data']
+
+    def fetch(self, key, build, products):
+        """
+        Return a Response for `key`, calling `build()` on a miss.
+        `products(data)` lists the ids of the products a payload shows.
+        """
+        entry = self.backend.get(key)
+        if entry is not None and not self._stale(entry, self.backend.get_many(self._stamp_keys(entry))):
+            self._count(hit=True)
+            return Response(entry['data'])
+
+        self._count(hit=False)
+        # Read before building, so a write committed meanwhile stamps later
+        built_at = self._counter(self.CLOCK_KEY)
+        response = build()
+        if response.status_code == 200 and self._replica_caught_up():
+            entry = {'data': response.data, 'products': products(response.data), 'built_at': built_at}
+            self.backend.set(key, entry, self.timeout)
+        return response
+
+    def _stamp_keys(self, entry):
+        return [self._product_key(pk) for pk in entry['products']]
+
+    def _stale(self, entry, stamps):
+        return any(stamp > entry['built_at'] for stamp in stamps.values())
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def invalidate(self, products=None):
+        """
+        Drop the payloads showing any of the `products` ids, or every
+        payload without them, once the transaction commits.
+        """
+        products = None if products is None else list(products)
+        # Wait for the commit so a concurrent read can't re-cache old rows
+        transaction.on_commit(lambda: self._bump(products))
+
+    def _bump(self, products):
+        self.backend.set(self.INVALIDATED_KEY, timezone.now(), timeout=None)
+        if products is None:
+            self._incr(self.VERSION_KEY)
+        elif products:
+            # Payloads built before the stamp expire within the same timeout
+            stamp = self._incr(self.CLOCK_KEY)
+            self.backend.set_many({self._product_key(pk): stamp for pk in products}, self.timeout)
+
+    def _incr(self, key):
+        try:
+            return self.backend.incr(key)
+        except ValueError:
+            self._counter(key)
+            return self.backend.incr(key)
+
+    def _replica_caught_up(self):
+        # A payload built from a replica that hasn't replayed the write
+        # behind the last invalidation is served, but not cached
+        from ecommerce_app.replicas import current_replica, replica_synced_at
+
+        alias = current_replica()
+        if alias is None:
+            return True
+        invalidated = self.backend.get(self.INVALIDATED_KEY)
+        synced_at = replica_synced_at(alias)
+        return invalidated is None or (synced_at is not None and synced_at >= invalidated)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+            'version': self.version(),
+        }
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,59 @@
+from django.db import transaction
+
+from ecommerce_app.models import Cart, CartItem, Product
+
+
+class CartError(Exception):
+    pass
+
+
+def apply_cart_operations(cart, operations):
+    """
+    Apply [{'op': 'add'|'set'|'remove', 'product': id, 'quantity': n}, ...]
+    to `cart` in order, all or nothing, and return the upserted items.
+
+    The query count doesn't depend on the batch size: inside one
+    transaction a cart row lock, one product lookup, one read of the
+    affected items, one bulk upsert and one bulk delete.
+    """
+    product_ids = {operation['product'] for operation in operations}
+
+    with transaction.atomic():
+        # Serializes concurrent batches on the same cart, so 'add' never
+        # loses an increment between the read and the upsert. SQLite has no
+        # row locks and ignores this, there the transaction itself starts
+        # with BEGIN IMMEDIATE (core.backends.sqlite3) and takes the write lock.
+        Cart.objects.select_for_update().filter(pk=cart.pk).exists()
+
+        # Checked under the lock, a product deleted meanwhile can't slip in
+        existing = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+        missing = sorted(product_ids - existing)
+        if missing:
+            raise CartError(f"Products do not exist: {', '.join(map(str, missing))}")
+
+        quantities = dict(
+            CartItem.objects.filter(cart=cart, product_id__in=product_ids).values_list('product_id', 'quantity')
+        )
+        for operation in operations:
+            product_id = operation['product']
+            if operation['op'] == 'add':
+                quantities[product_id] = quantities.get(product_id, 0) + operation['quantity']
+            elif operation['op'] == 'set' and operation['quantity'] > 0:
+                quantities[product_id] = operation['quantity']
+            else:
+                quantities[product_id] = 0
+
+        items = CartItem.objects.bulk_create(
+            [
+                CartItem(cart=cart, product_id=product_id, quantity=quantity)
+                for product_id, quantity in quantities.items() if quantity
+            ],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+        removed = [product_id for product_id, quantity in quantities.items() if not quantity]
+        if removed:
+            CartItem.objects.filter(cart=cart, product_id__in=removed).delete()
+
+    return items
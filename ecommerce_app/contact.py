@@ -0,0 +1,163 @@
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ecommerce_app.models import ContactMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+class ContactBuffer:
+    """
+    Write-behind queue for contact messages.
+
+    Each message is appended to this process's spool file and acknowledged.
+    A background thread writes the spool in one transaction once it holds
+    CONTACT_BUFFER_SIZE messages or every CONTACT_BUFFER_INTERVAL seconds.
+    Spool files of processes that died are saved by
+    `manage.py drain_contact_messages`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Only one flush at a time writes the batches of this process
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._spool = None
+        self._pid = None
+        self._name = None
+        self.pending = 0
+
+    @property
+    def directory(self):
+        return Path(settings.CONTACT_SPOOL_DIR)
+
+    def add(self, name, email, message):
+        line = json.dumps({
+            'spool_id': uuid.uuid4().hex,
+            'name': name,
+            'email': email,
+            'message': message,
+            'created_at': timezone.now().isoformat(),
+        })
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            # Durable against the process dying, not the machine
+            self._spool.write(line + '\n')
+            self._spool.flush()
+            self.pending += 1
+            if self.pending >= settings.CONTACT_BUFFER_SIZE:
+                self._wake.set()
+
+    def _start(self):
+        # Callers hold the lock. Runs again in a forked child, which
+        # inherits neither the thread nor the spool
+        self._pid = os.getpid()
+        self._name = f'contact-{self._pid}-{uuid.uuid4().hex[:8]}'
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._spool = open_locked(self.directory / f'{self._name}.jsonl', 'a')
+        self.pending = 0
+        threading.Thread(target=self._run, name='contact-buffer', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.CONTACT_BUFFER_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not write buffered contact messages')
+            finally:
+                # The thread lives as long as the process, don't hold on
+                # to a connection between flushes
+                connection.close()
+
+    def flush(self):
+        """Write everything this process has spooled, returns how many messages."""
+        with self._flush_lock:
+            with self._lock:
+                if self._pid != os.getpid():
+                    return 0
+                if self.pending:
+                    # Later messages go to a fresh spool while this batch is written
+                    os.rename(self.directory / f'{self._name}.jsonl', self.directory / f'{self._name}.{time.time_ns()}.batch')
+                    self._spool.close()
+                    self._spool = open_locked(self.directory / f'{self._name}.jsonl', 'a')
+                    self.pending = 0
+            # Batches of earlier failed flushes are retried along with it
+            return sum(write_spool(path) for path in sorted(self.directory.glob(f'{self._name}.*.batch')))
+
+
+def open_locked(path, mode='r'):
+    """
+    Open `path` holding an exclusive lock on it, or return None when some
+    other process holds it. Spools are locked for as long as they are
+    being written to, so they are never drained under a live process.
+    """
+    spool = open(path, mode)
+    try:
+        fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        spool.close()
+        return None
+    return spool
+
+
+def write_spool(path):
+    """
+    Save the messages of a spool file in one transaction and delete it,
+    returns how many there were. Messages are keyed by spool_id, so a
+    file saved twice (a crash before the delete) adds nothing.
+    """
+    try:
+        spool = open_locked(path)
+    except FileNotFoundError:
+        return 0
+    if spool is None:
+        return 0
+
+    with spool:
+        messages = []
+        for line in spool:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                # A partial last line, written as the process died
+                logger.warning('Skipping a truncated contact message in %s', path)
+                continue
+            data['created_at'] = datetime.fromisoformat(data['created_at'])
+            messages.append(ContactMessage(**data))
+
+        with transaction.atomic():
+            ContactMessage.objects.bulk_create(messages, batch_size=500, ignore_conflicts=True)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            # Saved and deleted by someone else meanwhile
+            return 0
+    return len(messages)
+
+
+def drain_spools():
+    """Save the spool files of processes that are gone, returns how many messages they held."""
+    directory = Path(settings.CONTACT_SPOOL_DIR)
+    if not directory.is_dir():
+        return 0
+    return sum(write_spool(path) for path in sorted(directory.glob('contact-*')))
+
+
+contact_buffer = ContactBuffer()
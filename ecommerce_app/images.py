@@ -0,0 +1,153 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from ecommerce_app.cache import catalog_cache
+from ecommerce_app.models import Product
+
+
+logger = logging.getLogger(__name__)
+
+# name -> (width, height), a height of None keeps the aspect ratio
+VARIANTS = {
+    'thumb': (200, 200),
+    'w320': (320, None),
+    'w640': (640, None),
+    'w1280': (1280, None),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_path(digest, variant, extension):
+    # Content addressed: the same upload is only ever processed and stored once
+    return f'variants/{digest[:2]}/{digest}/{variant}.{extension}'
+
+
+def open_image(data):
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    return image
+
+
+def variant_size(image, width, height):
+    if height is not None:
+        return width, height
+    if image.width > width:
+        return width, round(image.height * width / image.width)
+    # Never upscale, small originals keep their size
+    return image.size
+
+
+def render_variants(image):
+    """Yield (variant, extension, bytes) for every variant and format of `image`."""
+    for variant, (width, height) in VARIANTS.items():
+        size = variant_size(image, width, height)
+        if height is not None:
+            resized = ImageOps.fit(image, size, Image.LANCZOS)
+        elif size != image.size:
+            resized = image.resize(size, Image.LANCZOS)
+        else:
+            resized = image
+
+        for extension, (format, options) in FORMATS.items():
+            frame = resized
+            if format == 'JPEG' and frame.mode != 'RGB':
+                frame = frame.convert('RGB')
+            elif format == 'WEBP' and frame.mode not in ('RGB', 'RGBA'):
+                frame = frame.convert('RGBA' if 'A' in frame.getbands() else 'RGB')
+            output = io.BytesIO()
+            frame.save(output, format, **options)
+            yield variant, extension, output.getvalue()
+
+
+def build_variants(name, force=False):
+    """Render and store the variants of the stored image `name`, returns their manifest."""
+    with default_storage.open(name, 'rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()
+    image = open_image(data)
+
+    manifest = {'source': name, 'digest': digest, 'variants': {}}
+    for variant, (width, height) in VARIANTS.items():
+        entry = manifest['variants'][variant] = {}
+        entry['width'], entry['height'] = variant_size(image, width, height)
+        for extension in FORMATS:
+            entry[extension] = variant_path(digest, variant, extension)
+
+    # An identical upload was rendered before, reuse its files
+    if not force and all(
+        default_storage.exists(entry[extension])
+        for entry in manifest['variants'].values() for extension in FORMATS
+    ):
+        return manifest
+
+    for variant, extension, content in render_variants(image):
+        path = variant_path(digest, variant, extension)
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        default_storage.save(path, ContentFile(content))
+    return manifest
+
+
+def process_product_image(product_id, force=False):
+    name = Product.objects.filter(pk=product_id).values_list('image', flat=True).first()
+    if not name:
+        return False
+    try:
+        manifest = build_variants(name, force=force)
+    except (OSError, Image.DecompressionBombError):
+        logger.exception('Could not build image variants for product %s', product_id)
+        return False
+
+    # Guarded by the image name, so a newer upload's variants always win
+    updated = Product.objects.filter(pk=product_id, image=name).update(image_variants=manifest)
+    if updated:
+        catalog_cache.invalidate([product_id])
+    return bool(updated)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PRODUCT_IMAGE_WORKERS, thread_name_prefix='product-images',
+            )
+        return _executor
+
+
+def _run(product_id):
+    from django.db import connection
+
+    try:
+        process_product_image(product_id)
+    finally:
+        # Pool threads outlive requests, so close what they opened
+        connection.close()
+
+
+def schedule_product_image(product):
+    """Build the variants of `product.image` after commit, off the request thread."""
+    if not product.image or (product.image_variants or {}).get('source') == product.image.name:
+        return
+    product_id = product.pk
+    if settings.PRODUCT_IMAGES_EAGER:
+        transaction.on_commit(lambda: process_product_image(product_id))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_run, product_id))
@@ -0,0 +1,339 @@
+import json
+import os
+import platform
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, urlunsplit
+
+import django
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+
+from ecommerce_app.models import Product, Cart, CartItem
+from user_app.tokens import issue_token
+
+
+class Scenario:
+    """One benchmarked route: `prepare` runs untimed, `request` is timed."""
+
+    def __init__(self, name, request, prepare=None):
+        self.name = name
+        self.request = request
+        # Setup steps share state (the benchmark cart), so those scenarios
+        # always run one request at a time
+        self.sequential = prepare is not None
+        self.prepare = prepare or (lambda bench: None)
+
+
+class Bench:
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.user = User.objects.create_user('benchmark', 'benchmark@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart, _ = Cart.objects.get_or_create(user=self.user)
+
+        self.product_ids = list(Product.objects.values_list('pk', flat=True))
+        self.in_stock_ids = list(Product.objects.filter(stock_quantity__gt=100).values_list('pk', flat=True))
+        self.words = list({name.split()[0] for name in Product.objects.values_list('name', flat=True)[:500]})
+        self.pages = max(1, len(self.product_ids) // settings.REST_FRAMEWORK['PAGE_SIZE'])
+
+    def product(self):
+        return self.rng.choice(self.product_ids)
+
+    def stocked_product(self):
+        return self.rng.choice(self.in_stock_ids or self.product_ids)
+
+    def fill_cart(self, items=3):
+        # Cart payments need a non-empty cart, set it up outside the timing
+        CartItem.objects.filter(cart=self.cart).delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product_id=product_id, quantity=1)
+            for product_id in {self.stocked_product() for _ in range(items)}
+        ])
+
+
+class HttpClient:
+    """Sends the scenarios' APIClient-style calls to a running server."""
+
+    def __init__(self, base_url, token):
+        self.base_url = base_url
+        self.token = token
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        # requests sessions aren't thread-safe, so one per client thread
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+            self.local.session.headers['Authorization'] = f'Token {self.token}'
+        return self.local.session
+
+    def get(self, path):
+        return self.session.get(self.base_url + path)
+
+    def post(self, path, data, format=None):
+        return self.session.post(self.base_url + path, json=data)
+
+
+SCENARIOS = [
+    Scenario('product_list', lambda b: b.client.get(f'/products/?page={b.rng.randint(1, min(b.pages, 50))}')),
+    Scenario('product_list_cursor', lambda b: b.client.get('/products/?pagination=cursor')),
+    Scenario('product_search', lambda b: b.client.get(f'/products/?search={b.rng.choice(b.words)}')),
+    Scenario('product_detail', lambda b: b.client.get(f'/products/{b.product()}/')),
+    Scenario('cart_add', lambda b: b.client.post(
+        '/cart/add/', {'products': [{'product': b.stocked_product(), 'quantity': 1}]}, format='json',
+    )),
+    Scenario('cart_list', lambda b: b.client.get('/cart/items/')),
+    Scenario('order_create', lambda b: b.client.post(
+        '/orders/create/',
+        {'products': [{'product': b.stocked_product(), 'quantity': 1} for _ in range(3)]},
+        format='json',
+    )),
+    Scenario(
+        'cart_payment',
+        lambda b: b.client.post('/payment/cart/process/', {'cart_id': b.cart.pk, 'stripe_token': 'tok_visa'}, format='json'),
+        prepare=lambda b: b.fill_cart(),
+    ),
+]
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the catalog, cart and checkout routes in-process against a seeded test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0, help='Dataset size, 1.0 is 1000 users and 1000 products')
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per scenario')
+        parser.add_argument('--scenario', action='append', help='Only run these scenarios (repeatable)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument(
+            '--server', action='store_true',
+            help='Run the scenarios over HTTP against gunicorn started with core/gunicorn.conf.py '
+                 '(SERVER_MODE, WEB_CONCURRENCY etc. are passed through)',
+        )
+        parser.add_argument('--concurrency', type=int, default=1, help='Concurrent clients, with --server only')
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in SCENARIOS if not options['scenario'] or s.name in options['scenario']]
+        if options['concurrency'] > 1 and not options['server']:
+            raise CommandError('--concurrency needs --server')
+
+        if options['server'] and connection.vendor == 'sqlite':
+            # The server runs in other processes, so an in-memory test
+            # database won't do
+            test_settings = connection.settings_dict['TEST']
+            test_settings['NAME'] = test_settings.get('NAME') or os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+
+        # Run against a throwaway test database, never the configured one
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with self.settings_for_benchmark():
+                results = self.run(scenarios, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'scale': options['scale'],
+            'requests': options['requests'],
+            'seed': options['seed'],
+            'server': self.server_config(options),
+            'scenarios': results,
+        }
+        self.print_report(results)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+    def settings_for_benchmark(self):
+        # Payments are charged inline against the local fake gateway, and
+        # one user hammering the API is the point, so nothing is throttled
+        return override_settings(
+            PAYMENT_GATEWAY='ecommerce_app.payments.FakeStripeGateway',
+            PAYMENT_JOBS_EAGER=True,
+            THROTTLE_ENABLED=False,
+        )
+
+    def server_config(self, options):
+        if not options['server']:
+            return None
+        return {
+            'mode': os.environ.get('SERVER_MODE', 'asgi'),
+            'workers': os.environ.get('WEB_CONCURRENCY'),
+            'threads': os.environ.get('WEB_THREADS'),
+            'cpu_count': os.cpu_count(),
+            'concurrency': options['concurrency'],
+        }
+
+    @contextmanager
+    def server(self):
+        """Start gunicorn on the test database and yield its base URL."""
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        env = dict(
+            os.environ,
+            DATABASE_URL=self.test_database_url(),
+            BIND=f'127.0.0.1:{port}',
+            WEB_ACCESS_LOG='',
+            PAYMENT_GATEWAY='ecommerce_app.payments.FakeStripeGateway',
+            PAYMENT_JOBS_EAGER='1',
+            PERF_METRICS_SAMPLE_RATE='1',
+            PERF_METRICS_SERVER_TIMING='all',
+            THROTTLE_ENABLED='0',
+        )
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'core/gunicorn.conf.py'], cwd=settings.BASE_DIR, env=env,
+        )
+        base_url = f'http://127.0.0.1:{port}'
+        try:
+            deadline = time.monotonic() + 60
+            while True:
+                if process.poll() is not None:
+                    raise CommandError(f'gunicorn exited with status {process.returncode}')
+                try:
+                    requests.get(base_url + '/products/', timeout=1)
+                    break
+                except requests.ConnectionError:
+                    if time.monotonic() > deadline:
+                        raise CommandError('gunicorn did not start within 60s')
+                    time.sleep(0.2)
+            yield base_url
+        finally:
+            process.terminate()
+            process.wait(timeout=60)
+
+    def test_database_url(self):
+        name = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite':
+            return f'sqlite:///{name}'
+        url = urlsplit(os.environ.get('DATABASE_URL', ''))
+        return urlunsplit(url._replace(path=f'/{name}'))
+
+    def seed(self, options):
+        scale = options['scale']
+        started = time.monotonic()
+        call_command(
+            'generate_fake_data',
+            users=int(1000 * scale), products=int(1000 * scale), orders=int(2000 * scale),
+            carts=int(500 * scale), reviews=int(2000 * scale), wishlists=int(500 * scale),
+            seed=options['seed'], stdout=self.stdout,
+        )
+        self.stdout.write(f'Seeded in {time.monotonic() - started:.1f}s')
+
+    def run(self, scenarios, options):
+        self.seed(options)
+        bench = Bench(options['seed'])
+        if not options['server']:
+            return self.run_scenarios(scenarios, bench, options)
+
+        with self.server() as base_url:
+            bench.client = HttpClient(base_url, issue_token(bench.user, 'benchmark')[0])
+            return self.run_scenarios(scenarios, bench, options)
+
+    def run_scenarios(self, scenarios, bench, options):
+        results = {}
+        for scenario in scenarios:
+            for _ in range(options['warmup']):
+                scenario.prepare(bench)
+                scenario.request(bench)
+
+            concurrency = 1 if scenario.sequential else options['concurrency']
+            started = time.perf_counter()
+            if concurrency == 1:
+                samples = [self.measure(scenario, bench, options['server']) for _ in range(options['requests'])]
+            else:
+                with ThreadPoolExecutor(concurrency) as executor:
+                    samples = list(executor.map(
+                        lambda _: self.measure(scenario, bench, True), range(options['requests']),
+                    ))
+            wall = time.perf_counter() - started
+
+            latencies = [elapsed * 1000 for elapsed, _, _ in samples]
+            queries = [count for _, count, _ in samples]
+            errors = sum(1 for _, _, status in samples if status >= 400)
+            # Sequential runs exclude the untimed setup, concurrent ones
+            # overlap their requests, so they are measured on the wall clock
+            busy = sum(elapsed for elapsed, _, _ in samples) if concurrency == 1 else wall
+
+            results[scenario.name] = {
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p95_ms': round(percentile(latencies, 95), 3),
+                'p99_ms': round(percentile(latencies, 99), 3),
+                'mean_ms': round(statistics.fmean(latencies), 3),
+                'throughput_rps': round(len(latencies) / busy, 1) if busy else None,
+                'queries_per_request': round(statistics.fmean(queries), 2),
+                'max_queries': max(queries),
+                'errors': errors,
+            }
+        return results
+
+    def measure(self, scenario, bench, over_http):
+        """Run one request, returning (seconds, queries, status code)."""
+        scenario.prepare(bench)
+        if over_http:
+            started = time.perf_counter()
+            response = scenario.request(bench)
+            elapsed = time.perf_counter() - started
+            # The server reports its query count in the Server-Timing header
+            match = re.search(r'desc="(\d+) queries"', response.headers.get('Server-Timing', ''))
+            return elapsed, int(match.group(1)) if match else 0, response.status_code
+
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = scenario.request(bench)
+            elapsed = time.perf_counter() - started
+        return elapsed, len(context), response.status_code
+
+    def print_report(self, results):
+        header = f'{"scenario":<22}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"req/s":>10}{"queries":>10}{"errors":>8}'
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<22}{result["p50_ms"]:>10}{result["p95_ms"]:>10}{result["p99_ms"]:>10}'
+                f'{result["throughput_rps"]:>10}{result["queries_per_request"]:>10}{result["errors"]:>8}'
+            )
@@ -0,0 +1,91 @@
+import random
+import resource
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rapidfuzz import fuzz, process
+
+from ecommerce_app.management.commands.generate_fake_data import Vocabulary
+from ecommerce_app.search import SEARCH_THRESHOLD, ProductSearchIndex
+
+
+class Command(BaseCommand):
+    help = 'Time the product search index against scoring every name, on generated names held in memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Product names to index')
+        parser.add_argument('--queries', type=int, default=50, help='Timed queries per query length')
+        parser.add_argument('--scans', type=int, default=3, help='Queries per length also timed as a full scan')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng, vocab = random.Random(options['seed']), Vocabulary(options['seed'])
+        # Named like generate_fake_data names its products
+        names = {
+            pk: f'{rng.choice(vocab.words)} {rng.choice(vocab.words)}'[:25]
+            for pk in range(1, options['rows'] + 1)
+        }
+
+        # What the index stores, and what scoring every product compares against
+        lowered = {pk: name.lower() for pk, name in names.items()}
+
+        index = ProductSearchIndex()
+        started = time.monotonic()
+        index.load(names.items())
+        self.stdout.write(
+            f'Indexed {len(index)} names in {time.monotonic() - started:.1f}s, '
+            f'peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB'
+        )
+
+        header = f'{"length":>6} {"median ms":>10} {"p95 ms":>8} {"candidates":>11} {"matches":>8} {"scan ms":>8} {"same":>5}'
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        # Nothing is written meanwhile, keep the index from reloading
+        with override_settings(SEARCH_INDEX_TTL=10 ** 9):
+            for length in (1, 2, 3, 4, 5, 6, 8, 12, 20):
+                self.stdout.write(self.measure(index, lowered, self.queries(rng, vocab, length, options['queries']), options['scans']))
+
+    def queries(self, rng, vocab, length, count):
+        # Distinct queries, repeats would be answered from the result cache
+        queries = []
+        for _ in range(count * 100):
+            if len(queries) == count:
+                break
+            text = ' '.join(rng.sample(vocab.words, 3))
+            start = rng.randrange(max(1, len(text) - length))
+            chars = list(text[start:start + length].lower())
+            # Every other query has a typo
+            if len(queries) % 2 and len(chars) > 2:
+                chars[rng.randrange(len(chars))] = rng.choice('abcdefghijklmnopqrstuvwxyz')
+            query = ''.join(chars)
+            if len(query) == length and query not in queries:
+                queries.append(query)
+        return queries
+
+    def measure(self, index, names, queries, scans):
+        timings, candidates, matches = [], [], []
+        for query in queries:
+            started = time.perf_counter()
+            found = index.search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+            candidates.append(len(index.candidates(query)))
+            matches.append(len(found))
+
+        scan_timings, same = [], True
+        for query in queries[:scans]:
+            started = time.perf_counter()
+            expected = process.extract(
+                query, names, scorer=fuzz.partial_ratio,
+                score_cutoff=SEARCH_THRESHOLD, limit=None,
+            )
+            scan_timings.append((time.perf_counter() - started) * 1000)
+            same = same and {pk for _, _, pk in expected} == set(index.search(query))
+
+        p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+        return (
+            f'{len(queries[0]):>6} {statistics.median(timings):>10.1f} {p95:>8.1f} '
+            f'{int(statistics.median(candidates)):>11} {int(statistics.median(matches)):>8} '
+            f'{statistics.median(scan_timings) if scan_timings else 0:>8.1f} {"yes" if same else "NO":>5}'
+        )
@@ -0,0 +1,54 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ecommerce_app.images import process_product_image
+from ecommerce_app.models import Product
+
+
+def _process(args):
+    product_id, force = args
+    return process_product_image(product_id, force=force)
+
+
+def _init_worker():
+    # Never share the parent's database connection across a fork
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Render the thumbnail and responsive variants of existing product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='Processes rendering images')
+        parser.add_argument('--force', action='store_true', help='Render again even if the variants are up to date')
+
+    def handle(self, *args, **options):
+        force = options['force']
+        products = Product.objects.exclude(image='').exclude(image__isnull=True).values_list('pk', 'image', 'image_variants')
+        pending = [
+            pk for pk, image, variants in products.iterator()
+            if force or (variants or {}).get('source') != image
+        ]
+        if not pending:
+            self.stdout.write('Every product image is up to date')
+            return
+
+        started = time.monotonic()
+        jobs = [(pk, force) for pk in pending]
+        workers = max(1, min(options['workers'], len(jobs)))
+        if workers == 1:
+            results = [_process(job) for job in jobs]
+        else:
+            # Resizing is CPU bound, so fan out to processes rather than threads
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker) as pool:
+                results = pool.map(_process, jobs, chunksize=8)
+
+        done = sum(results)
+        self.stdout.write(
+            f'Rendered variants for {done} of {len(jobs)} products in {time.monotonic() - started:.1f}s'
+            f' ({len(jobs) - done} failed or changed meanwhile)'
+        )
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce_app.contact import drain_spools
+
+
+class Command(BaseCommand):
+    help = 'Save the contact messages left in the spool by server processes that are gone'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep running, draining every this many seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            drained = drain_spools()
+            if drained:
+                self.stdout.write(f'Saved {drained} spooled contact messages')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
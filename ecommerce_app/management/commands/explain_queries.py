@@ -0,0 +1,146 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+
+from ecommerce_app.cache import catalog_cache
+from ecommerce_app.models import Product, Order, Cart, Wishlist
+
+
+ENDPOINTS = [
+    '/products/',
+    '/products/?category=books',
+    '/products/?pagination=cursor',
+    '/products/?category=books&pagination=cursor',
+    '/products/{product}/',
+    '/orders/',
+    '/orders/?pagination=cursor',
+    ('/orders/', 'staff'),
+    '/orders/{order}/',
+    '/orders/history/',
+    '/cart/{cart}/',
+    '/cart/items/',
+    '/payments/',
+    '/reviews/',
+    '/wishlist/',
+    '/wishlist/{wishlist}/list_products/',
+]
+
+# Queries with no endpoint of their own
+QUERIES = {
+    'pending fulfilment': lambda: Order.objects.filter(status='pending', is_shipped=False).order_by('created')[:50],
+}
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}')
+        return [row[0] for row in cursor.fetchall()]
+
+
+def problems(sql, plan):
+    # SQLite reports full scans as "SCAN table" without an index, and sorts
+    # it can't read off an index as temp b-trees; Postgres as "Seq Scan".
+    # Scans are only flagged for filtered queries, an unfiltered page or
+    # count reads the whole table whatever the indexes.
+    filtered = ' WHERE ' in sql.upper()
+    found = []
+    for line in plan:
+        line = line.strip()
+        if filtered and line.startswith('SCAN ') and ' INDEX ' not in line:
+            found.append(f'full scan: {line}')
+        elif filtered and 'Seq Scan' in line:
+            found.append(f'full scan: {line}')
+        elif 'TEMP B-TREE' in line or line.startswith('Sort '):
+            found.append(f'sort: {line}')
+    return found
+
+
+class Command(BaseCommand):
+    help = 'Print the query plan of every query the main endpoints run and flag full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0.2, help='Dataset size, 1.0 is 1000 users and 1000 products')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--verbose-plans', action='store_true', help='Print plans without problems too')
+        parser.add_argument('--fail-on-scan', action='store_true', help='Exit with an error if a full scan is found')
+
+    def handle(self, *args, **options):
+        # Plan against a throwaway database seeded like the benchmark one
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            flagged = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if flagged and options['fail_on_scan']:
+            raise CommandError(f'{flagged} queries with full scans or sorts')
+
+    def seed(self, options):
+        scale = options['scale']
+        call_command(
+            'generate_fake_data',
+            users=int(1000 * scale), products=int(1000 * scale), orders=int(2000 * scale),
+            carts=int(500 * scale), reviews=int(2000 * scale), wishlists=int(500 * scale),
+            seed=options['seed'], stdout=self.stdout,
+        )
+        # Give the planner table statistics, as a long running database has
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def run(self, options):
+        self.seed(options)
+
+        order = Order.objects.order_by('pk').first()
+        user = order.user
+        cart, _ = Cart.objects.get_or_create(user=user)
+        # Users can have several wishlists
+        wishlist = Wishlist.objects.filter(user=user).order_by('pk').first() or Wishlist.objects.create(user=user)
+        staff = User.objects.create_user('explain-staff', 'explain@example.com', 'password', is_staff=True)
+        ids = {
+            'product': Product.objects.order_by('pk').values_list('pk', flat=True).first(),
+            'order': order.pk,
+            'cart': cart.pk,
+            'wishlist': wishlist.pk,
+        }
+
+        client = APIClient()
+        runs = []
+        for endpoint in ENDPOINTS:
+            url, as_user = endpoint if isinstance(endpoint, tuple) else (endpoint, 'user')
+            url = url.format(**ids)
+            client.force_authenticate(staff if as_user == 'staff' else user)
+            catalog_cache.backend.clear()
+            with CaptureQueriesContext(connection) as context:
+                client.get(url)
+            runs.append((f'GET {url} as {as_user}', context.captured_queries))
+        for name, build in QUERIES.items():
+            with CaptureQueriesContext(connection) as context:
+                list(build())
+            runs.append((name, context.captured_queries))
+
+        flagged = 0
+        for name, queries in runs:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for query in queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                plan = explain(sql)
+                found = problems(sql, plan)
+                flagged += bool(found)
+                if found or options['verbose_plans']:
+                    self.stdout.write(f'  {sql[:200]}')
+                    for line in plan:
+                        self.stdout.write(f'    {line}')
+                for problem in found:
+                    self.stdout.write(self.style.WARNING(f'    ! {problem}'))
+        self.stdout.write(f'{flagged} queries with full scans or sorts')
+        return flagged
@@ -0,0 +1,254 @@
+import multiprocessing
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from faker import Faker
+
+from ecommerce_app.models import (
+    Product, Order, OrderItem, Cart, CartItem, Review, Wishlist
+)
+from ecommerce_app.search import product_index
+
+
+CATEGORIES = ['electronics', 'clothing', 'books']
+
+
+class Vocabulary:
+    # Faker is far too slow to call per row at millions of rows, so every
+    # generator draws from small pools built once from the seed
+    def __init__(self, seed):
+        fake = Faker()
+        fake.seed_instance(seed)
+        self.words = [fake.word() for _ in range(500)]
+        self.first_names = [fake.first_name().lower() for _ in range(200)]
+        self.sentences = [fake.sentence()[:255] for _ in range(300)]
+        self.paragraphs = [fake.text() for _ in range(100)]
+
+
+def generate_users(count, seed, offset, batch_size, pools):
+    rng, vocab = random.Random(seed), Vocabulary(seed)
+    # Hash once, every generated user shares the password 'password'
+    password = make_password('password')
+    rows = (
+        User(
+            username=f'{rng.choice(vocab.first_names)}{offset + i}',
+            email=f'user{offset + i}@example.com',
+            password=password,
+        )
+        for i in range(count)
+    )
+    return _insert(User, rows, batch_size)
+
+
+def generate_products(count, seed, offset, batch_size, pools):
+    rng, vocab = random.Random(seed), Vocabulary(seed)
+    user_ids = pools['users']
+    rows = (
+        Product(
+            name=f'{rng.choice(vocab.words)} {rng.choice(vocab.words)}'[:25],
+            description=rng.choice(vocab.sentences),
+            price=Decimal(rng.randint(1000, 50000)) / 100,
+            stock_quantity=rng.randint(0, 500),
+            category=rng.choice(CATEGORIES),
+            user_id=rng.choice(user_ids) if user_ids else None,
+        )
+        for _ in range(count)
+    )
+    return _insert(Product, rows, batch_size)
+
+
+def generate_orders(count, seed, offset, batch_size, pools):
+    rng = random.Random(seed)
+    user_ids, products = pools['users'], pools['products']
+    done = 0
+    while done < count:
+        size = min(batch_size, count - done)
+        baskets = [_basket(rng, products) for _ in range(size)]
+        with transaction.atomic():
+            orders = Order.objects.bulk_create([
+                Order(
+                    user_id=rng.choice(user_ids),
+                    amount=sum((price * quantity for _, price, quantity in basket), Decimal(0)),
+                    status=rng.choice(['pending', 'pending', 'shipped', 'delivered']),
+                )
+                for basket in baskets
+            ])
+            OrderItem.objects.bulk_create([
+                OrderItem(order_id=order.pk, product_id=product_id, quantity=quantity, unit_price=price)
+                for order, basket in zip(orders, baskets)
+                for product_id, price, quantity in basket
+            ], batch_size=batch_size)
+        done += size
+    return done
+
+
+def generate_carts(count, seed, offset, batch_size, pools):
+    rng = random.Random(seed)
+    # Carts are one per user, so each worker gets its own slice of users
+    owners = pools['cartless'][offset:offset + count]
+    products = pools['products']
+    done = 0
+    for start in range(0, len(owners), batch_size):
+        chunk = owners[start:start + batch_size]
+        with transaction.atomic():
+            carts = Cart.objects.bulk_create([Cart(user_id=user_id) for user_id in chunk])
+            CartItem.objects.bulk_create([
+                CartItem(cart_id=cart.pk, product_id=product_id, quantity=quantity)
+                for cart in carts
+                for product_id, _, quantity in _basket(rng, products)
+            ], batch_size=batch_size)
+        done += len(chunk)
+    return done
+
+
+def generate_reviews(count, seed, offset, batch_size, pools):
+    rng, vocab = random.Random(seed), Vocabulary(seed)
+    user_ids, products = pools['users'], pools['products']
+    rows = (
+        Review(
+            user_id=rng.choice(user_ids),
+            product_id=rng.choice(products)[0],
+            content=rng.choice(vocab.paragraphs),
+            rating=rng.randint(1, 5),
+        )
+        for _ in range(count)
+    )
+    return _insert(Review, rows, batch_size)
+
+
+def generate_wishlists(count, seed, offset, batch_size, pools):
+    rng = random.Random(seed)
+    user_ids, products = pools['users'], pools['products']
+    through = Wishlist.products.through
+    done = 0
+    while done < count:
+        size = min(batch_size, count - done)
+        with transaction.atomic():
+            wishlists = Wishlist.objects.bulk_create([Wishlist(user_id=rng.choice(user_ids)) for _ in range(size)])
+            through.objects.bulk_create([
+                through(wishlist_id=wishlist.pk, product_id=product_id)
+                for wishlist in wishlists
+                for product_id, _, _ in _basket(rng, products)
+            ], batch_size=batch_size)
+        done += size
+    return done
+
+
+def _basket(rng, products, most=5):
+    # Distinct products with a quantity each, as (id, price, quantity)
+    picked = rng.sample(products, min(len(products), rng.randint(1, most)))
+    return [(product_id, price, rng.randint(1, 3)) for product_id, price in picked]
+
+
+def _insert(model, rows, batch_size):
+    done, batch = 0, []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            done += _flush(model, batch)
+            batch = []
+    if batch:
+        done += _flush(model, batch)
+    return done
+
+
+def _flush(model, batch):
+    with transaction.atomic():
+        model.objects.bulk_create(batch)
+    return len(batch)
+
+
+def _run(args):
+    generator, count, seed, offset, batch_size, pools = args
+    return generator(count, seed, offset, batch_size, pools)
+
+
+def _init_worker():
+    # Never share the parent's database connection across a fork
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, reproducible fake dataset for load testing'
+
+    STEPS = [
+        ('users', generate_users),
+        ('products', generate_products),
+        ('orders', generate_orders),
+        ('carts', generate_carts),
+        ('reviews', generate_reviews),
+        ('wishlists', generate_wishlists),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--carts', type=int, default=500)
+        parser.add_argument('--reviews', type=int, default=2000)
+        parser.add_argument('--wishlists', type=int, default=500)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=1, help='Processes to fan each table out to')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        pools = {}
+
+        for step, (name, generator) in enumerate(self.STEPS):
+            if name in ('orders', 'carts', 'reviews', 'wishlists') and not (pools['users'] and pools['products']):
+                self.stdout.write(f'{name}: skipped, there are no users or products to draw from')
+                continue
+
+            count = options[name]
+            base = 0
+            if name == 'users':
+                # Continue numbering after existing users to keep usernames unique
+                base = User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            elif name == 'carts':
+                count = min(count, len(pools['cartless']))
+
+            if count:
+                started = time.monotonic()
+                created = self.fan_out(generator, count, step, base, options, pools)
+                self.stdout.write(f'{name}: {created} rows in {time.monotonic() - started:.1f}s')
+
+            # Later steps draw from id pools instead of ORDER BY RANDOM()
+            if name == 'users':
+                pools['users'] = list(User.objects.values_list('pk', flat=True))
+                pools['cartless'] = list(User.objects.filter(cart__isnull=True).values_list('pk', flat=True))
+            elif name == 'products':
+                pools['products'] = list(Product.objects.values_list('pk', 'price'))
+                # bulk_create skips the signals, so running servers reload their search index
+                if count:
+                    product_index.changed()
+
+        # bulk_create skips the signals and code paths that maintain the summaries
+        if options['reviews'] and pools['products']:
+            call_command('rebuild_rating_summaries', stdout=self.stdout)
+        if options['orders'] and pools['products']:
+            call_command('rebuild_order_summaries', stdout=self.stdout)
+
+    def fan_out(self, generator, count, step, base, options, pools):
+        workers = max(1, options['workers'])
+        shares = [count // workers + (1 if i < count % workers else 0) for i in range(workers)]
+        jobs, offset = [], 0
+        for index, share in enumerate(shares):
+            if share:
+                # Each (step, worker) pair gets its own seed, so a run is
+                # reproducible for a given seed and worker count
+                seed = options['seed'] * 1000 + step * 100 + index
+                jobs.append((generator, share, seed, base + offset, options['batch_size'], pools))
+            offset += share
+
+        if workers == 1:
+            return sum(_run(job) for job in jobs)
+
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker) as pool:
+            return sum(pool.map(_run, jobs))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+
+from ecommerce_app.models import Order, OrderItem, OrderSummary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the order history summaries from the Order and OrderItem tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        items = OrderItem.objects.select_related('product').only(
+            'order_id', 'product_id', 'quantity', 'unit_price', 'product__name',
+        ).order_by('pk')
+        orders = Order.objects.order_by('pk').prefetch_related(Prefetch('order_items', queryset=items))
+
+        rebuilt = 0
+        with transaction.atomic():
+            OrderSummary.objects.all().delete()
+            batch = []
+            for order in orders.iterator(chunk_size=batch_size):
+                batch.append(OrderSummary.for_order(order, [
+                    (item.product_id, item.product.name, item.unit_price, item.quantity)
+                    for item in order.order_items.all()
+                ]))
+                if len(batch) == batch_size:
+                    rebuilt += len(OrderSummary.objects.bulk_create(batch))
+                    batch = []
+            rebuilt += len(OrderSummary.objects.bulk_create(batch))
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt order summaries for {rebuilt} orders'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from ecommerce_app.cache import catalog_cache
+from ecommerce_app.models import ProductRating, Review
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-product rating summaries from the Review table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        # Histogram buckets use the same rounding as rating_bucket()
+        buckets = {
+            f'rating_{bucket}': Count('id', filter=Q(rating__gte=bucket - 0.5, rating__lt=bucket + 0.5))
+            for bucket in range(2, 5)
+        }
+        buckets['rating_1'] = Count('id', filter=Q(rating__lt=1.5))
+        buckets['rating_5'] = Count('id', filter=Q(rating__gte=4.5))
+
+        rows = (
+            Review.objects.order_by()
+            .values('product_id')
+            .annotate(review_count=Count('id'), rating_total=Sum('rating'), **buckets)
+        )
+        summaries = [ProductRating(**row) for row in rows.iterator()]
+
+        with transaction.atomic():
+            ProductRating.objects.all().delete()
+            ProductRating.objects.bulk_create(summaries, batch_size=options['batch_size'])
+        catalog_cache.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating summaries for {len(summaries)} products'))
@@ -0,0 +1,55 @@
+import asyncio
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ecommerce_app.payments import work, work_async
+
+
+def _work(poll_interval, once, concurrency=1):
+    # Each process needs its own database connection
+    connections.close_all()
+    if concurrency > 1:
+        asyncio.run(work_async(concurrency=concurrency, poll_interval=poll_interval, once=once))
+    else:
+        work(poll_interval=poll_interval, once=once)
+
+
+class Command(BaseCommand):
+    help = 'Run payment workers that execute queued PaymentJob rows against the gateway'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained')
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Gateway calls each worker keeps in flight on an event loop (1 charges one at a time)',
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        poll_interval = options['poll_interval']
+        once = options['once']
+        concurrency = options['concurrency']
+
+        if workers == 1:
+            _work(poll_interval, once, concurrency)
+            return
+
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=_work, args=(poll_interval, once, concurrency), daemon=True)
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Started {workers} payment workers')
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
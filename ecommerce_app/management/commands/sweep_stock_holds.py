@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce_app.reservations import sweep_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Release expired stock holds back to the available stock (run periodically, or with --interval)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep running, sweeping every this many seconds')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        while True:
+            released = sweep_expired_holds(batch_size=options['batch_size'])
+            if released:
+                self.stdout.write(f'Released {released} expired stock holds')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
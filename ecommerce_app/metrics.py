@@ -0,0 +1,277 @@
+import contextvars
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+# Metrics of the request being handled on this thread/task, None when unsampled
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.slowest_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper(), times every query
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.sql_time += elapsed
+            self.slowest_time = max(self.slowest_time, elapsed)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class RouteStats:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.response_bytes = 0
+        self.slowest_query_seconds = 0.0
+
+
+class MetricsRegistry:
+    """Per-process aggregates, keyed by (method, route, status)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, method, route, status, metrics, duration, size):
+        with self._lock:
+            stats = self.routes.get((method, route, status))
+            if stats is None:
+                stats = self.routes[(method, route, status)] = RouteStats()
+            stats.duration.observe(duration)
+            stats.queries.observe(metrics.queries)
+            stats.sql_seconds += metrics.sql_time
+            stats.serializer_seconds += metrics.serializer_time
+            stats.response_bytes += size
+            stats.slowest_query_seconds = max(stats.slowest_query_seconds, metrics.slowest_time)
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+
+    def render(self):
+        """Render everything in the Prometheus text exposition format."""
+        from ecommerce_app.cache import catalog_cache
+        from ecommerce_app.throttling import throttler
+        from user_app.authentication import token_cache
+
+        lines = []
+        with self._lock:
+            routes = sorted(self.routes.items())
+
+            lines += _histogram_lines('http_request_duration_seconds', 'Wall time per request', routes, 'duration')
+            lines += _histogram_lines('http_request_db_queries', 'SQL queries per request', routes, 'queries')
+            for name, help_text, attribute in [
+                ('http_request_db_seconds_total', 'Time spent in SQL', 'sql_seconds'),
+                ('http_request_serializer_seconds_total', 'Time spent serializing', 'serializer_seconds'),
+                ('http_response_bytes_total', 'Response body bytes', 'response_bytes'),
+            ]:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                lines += [f'{name}{{{_labels(key)}}} {getattr(stats, attribute)}' for key, stats in routes]
+            name = 'http_request_slowest_query_seconds'
+            lines += [f'# HELP {name} Slowest single query seen', f'# TYPE {name} gauge']
+            lines += [f'{name}{{{_labels(key)}}} {stats.slowest_query_seconds}' for key, stats in routes]
+
+        cache_stats = catalog_cache.stats()
+        lines += ['# HELP catalog_cache_requests_total Catalog cache lookups', '# TYPE catalog_cache_requests_total counter']
+        lines += [
+            f'catalog_cache_requests_total{{result="hit"}} {cache_stats["hits"]}',
+            f'catalog_cache_requests_total{{result="miss"}} {cache_stats["misses"]}',
+        ]
+        token_stats = token_cache.stats()
+        lines += ['# HELP auth_token_cache_requests_total Token authentication cache lookups', '# TYPE auth_token_cache_requests_total counter']
+        lines += [
+            f'auth_token_cache_requests_total{{result="hit"}} {token_stats["hits"]}',
+            f'auth_token_cache_requests_total{{result="shared_hit"}} {token_stats["shared_hits"]}',
+            f'auth_token_cache_requests_total{{result="miss"}} {token_stats["misses"]}',
+        ]
+        lines += ['# HELP auth_token_cache_entries Tokens cached in this process', '# TYPE auth_token_cache_entries gauge']
+        lines.append(f'auth_token_cache_entries {token_stats["size"]}')
+        lines += ['# HELP throttle_rejections_total Requests rejected by a token bucket', '# TYPE throttle_rejections_total counter']
+        lines += [
+            f'throttle_rejections_total{{scope="{scope}",bucket="{bucket}"}} {count}'
+            for (scope, bucket), count in sorted(throttler.stats().items())
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(key):
+    method, route, status = key
+    route = route.replace('\\', '\\\\').replace('"', '\\"')
+    return f'method="{method}",route="{route}",status="{status}"'
+
+
+def _histogram_lines(name, help_text, routes, attribute):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for key, stats in routes:
+        histogram = getattr(stats, attribute)
+        labels = _labels(key)
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+        lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+registry = MetricsRegistry()
+
+
+def timed_serialization(method):
+    """Wrap a serializer method so the outermost call is timed."""
+    def wrapper(self, *args, **kwargs):
+        metrics = _current.get()
+        if metrics is None:
+            return method(self, *args, **kwargs)
+
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            metrics.serializer_depth -= 1
+            if metrics.serializer_depth == 0:
+                metrics.serializer_time += time.perf_counter() - started
+    wrapper.__wrapped__ = method
+    return wrapper
+
+
+def instrument_serializers():
+    from rest_framework import serializers
+
+    # Nested serializers run inside their parent, so only the outermost
+    # to_representation call adds to the request's serializer time
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not hasattr(cls.to_representation, '__wrapped__'):
+            cls.to_representation = timed_serialization(cls.to_representation)
+
+
+class PerformanceMetricsMiddleware:
+    """
+    Times sampled requests and reports them as Server-Timing headers and
+    per-route histograms (served by MetricsView).
+
+    PERF_METRICS_SAMPLE_RATE is the fraction of requests measured, 0
+    disables the middleware entirely. PERF_METRICS_SERVER_TIMING says who
+    gets the header: 'all', 'staff' or 'off'.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PERF_METRICS_SAMPLE_RATE', 0.05)
+        self.server_timing = getattr(settings, 'PERF_METRICS_SERVER_TIMING', 'staff')
+        if self.sample_rate > 0:
+            instrument_serializers()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return self.sample_rate > 0 and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                wrap_connections(stack, metrics)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, metrics, self.show_timing(request))
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        stack = ExitStack()
+        try:
+            # Connections are per thread, and the ORM runs this request's
+            # queries on its thread-sensitive thread, so wrap them there
+            await sync_to_async(wrap_connections)(stack, metrics)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _current.reset(token)
+        if self.server_timing == 'staff':
+            # Resolving a session user queries the database
+            show_timing = await sync_to_async(self.show_timing)(request)
+        else:
+            show_timing = self.show_timing(request)
+        return self.record(request, response, metrics, show_timing)
+
+    def show_timing(self, request):
+        if self.server_timing == 'all':
+            return True
+        # DRF sets the authenticated user back on the Django request
+        user = getattr(request, 'user', None)
+        return self.server_timing == 'staff' and user is not None and user.is_staff
+
+    def record(self, request, response, metrics, show_timing):
+        duration = time.perf_counter() - metrics.started
+        size = 0 if response.streaming else len(response.content)
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        registry.record(request.method, route, response.status_code, metrics, duration, size)
+
+        if show_timing:
+            response['Server-Timing'] = ', '.join([
+                f'total;dur={duration * 1000:.2f}',
+                f'db;dur={metrics.sql_time * 1000:.2f};desc="{metrics.queries} queries"',
+                f'db-slowest;dur={metrics.slowest_time * 1000:.2f}',
+                f'serialize;dur={metrics.serializer_time * 1000:.2f}',
+                f'size;desc="{size} bytes"',
+            ])
+        return response
+
+
+def wrap_connections(stack, metrics):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(metrics))
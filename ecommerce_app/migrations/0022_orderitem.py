@@ -0,0 +1,59 @@
+# Generated by Django 5.0 on 2026-10-18 10:00
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_unit_prices(apps, schema_editor):
+    OrderItem = apps.get_model('ecommerce_app', 'OrderItem')
+    Product = apps.get_model('ecommerce_app', 'Product')
+    prices = dict(Product.objects.values_list('id', 'price'))
+    items = list(OrderItem.objects.all())
+    for item in items:
+        item.unit_price = prices.get(item.product_id, Decimal(0))
+    OrderItem.objects.bulk_update(items, ['unit_price'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce_app', '0021_alter_order_tracking_id'),
+    ]
+
+    operations = [
+        # Adopt the existing auto-created M2M table as an explicit through model
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='OrderItem',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='ecommerce_app.order')),
+                        ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='ecommerce_app.product')),
+                    ],
+                    options={
+                        'db_table': 'ecommerce_app_order_products',
+                        'unique_together': {('order', 'product')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='order',
+                    name='products',
+                    field=models.ManyToManyField(related_name='orders', through='ecommerce_app.OrderItem', to='ecommerce_app.product'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_unit_prices, migrations.RunPython.noop),
+    ]
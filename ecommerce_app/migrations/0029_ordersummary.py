@@ -0,0 +1,35 @@
+# Generated by Django 5.0 on 2026-10-18 17:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce_app', '0028_product_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=50)),
+                ('is_shipped', models.BooleanField(default=False)),
+                ('shipping_date', models.DateTimeField(blank=True, null=True)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('line_items', models.JSONField(default=list)),
+                ('created', models.DateTimeField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='ecommerce_app.order')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created', '-id'], name='ordersummary_user_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0 on 2026-10-18 18:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fail_duplicate_jobs(apps, schema_editor):
+    # Jobs queued behind another live one for the same order or cart would
+    # charge twice, they are failed before they run
+    PaymentJob = apps.get_model('ecommerce_app', 'PaymentJob')
+    for field, live in (('order', ['queued', 'processing', 'succeeded']), ('cart', ['queued', 'processing'])):
+        seen = {}
+        jobs = PaymentJob.objects.filter(status__in=live).exclude(**{f'{field}_id': None})
+        # Keep the job furthest along, then the oldest
+        for job in sorted(jobs, key=lambda job: (-live.index(job.status), job.pk)):
+            first = seen.setdefault(getattr(job, f'{field}_id'), job.pk)
+            if first == job.pk:
+                continue
+            if job.status != 'queued':
+                raise RuntimeError(
+                    f'Payment jobs {first} and {job.pk} are both live for {field} {getattr(job, f"{field}_id")}, '
+                    f'settle one of them before adding the unique constraint.'
+                )
+            job.status = 'failed'
+            job.result = {'error': f'Payment failed. Duplicate of payment job {first}.'}
+            job.save(update_fields=['status', 'result'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce_app', '0030_contactmessage_spool_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='paymentjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'failed'), _negated=True), fields=('order',), name='paymentjob_live_order_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='paymentjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'processing'])), fields=('cart',), name='paymentjob_live_cart_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 19:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce_app', '0031_paymentjob_live_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='needs_attention',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -12,23 +12,47 @@ class Product(models.Model):
     description = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock_quantity = models.PositiveIntegerField(default=0)
+    # Sum of the live StockHolds, only ever changed by conditional UPDATEs
+    stock_reserved = models.PositiveIntegerField(default=0)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='products', null=True)
     image = models.ImageField(upload_to='', null=True, blank=True) 
+    # Manifest of the resized copies of `image`, see ecommerce_app.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     category = models.CharField(max_length=20, choices=[
         ('electronics', 'Electronics'),
         ('clothing', 'Clothing'),
         ('books', 'Books'),
 
     ], null=True, blank=True)
-    
+
+    class Meta:
+        indexes = [
+            # Category filtered catalog pages, in id order
+            models.Index(fields=['category', 'id'], name='product_category_id_idx'),
+        ]
     
     def get_reviews(self):
         return self.product_reviews.all()
 
+    @property
+    def available_quantity(self):
+        return max(0, self.stock_quantity - self.stock_reserved)
+
+    def save(self, *args, **kwargs):
+        # stock_reserved moves under concurrent reservations, so saving an
+        # instance loaded earlier (the update view, the admin) must not
+        # write its stale copy back
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'stock_reserved'
+            ]
+        super().save(*args, **kwargs)
+
 
 
 class Order(models.Model):
-    products = models.ManyToManyField(Product, related_name='orders')
+    products = models.ManyToManyField(Product, related_name='orders', through='OrderItem')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     created = models.DateTimeField(auto_now_add=True)
     is_shipped = models.BooleanField(default=False)
@@ -36,6 +60,103 @@ class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     tracking_id = models.CharField(max_length=255, default=uuid.uuid4().hex, null=True, blank=True)
     status = models.CharField(max_length=50, default='pending')
+    # Paid for after its holds expired, when some of the stock had sold
+    # out meanwhile (see reservations.convert_holds), for staff to sort out
+    needs_attention = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Order history, newest first: a user's own and the staff view of all
+            models.Index(fields=['user', '-created', '-id'], name='order_user_created_idx'),
+            models.Index(fields=['-created', '-id'], name='order_created_idx'),
+            # Fulfilment queue, only the (few) orders still waiting to ship
+            models.Index(
+                fields=['created'], name='order_pending_unshipped_idx',
+                condition=models.Q(status='pending', is_shipped=False),
+            ),
+        ]
+
+
+class StockHold(models.Model):
+    # Stock set aside for an order until it is paid for (converted into a
+    # stock decrement) or the hold expires or the payment fails (released)
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('converted', 'Converted'),
+        ('released', 'Released'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_holds')
+    order = models.ForeignKey('Order', on_delete=models.CASCADE, related_name='stock_holds')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'expires_at'], name='stockhold_status_expires_idx')]
+
+
+class OrderItem(models.Model):
+    # Reuses the table of the former auto-created Order.products M2M
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order_items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_items')
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'ecommerce_app_order_products'
+        unique_together = ('order', 'product')
+
+    @property
+    def line_total(self):
+        return self.unit_price * self.quantity
+
+
+class OrderSummary(models.Model):
+    # Order history read model, one row per order with its line items
+    # denormalized. Written by place_order(), kept in step with the order's
+    # status by a signal, rebuilt by `manage.py rebuild_order_summaries`
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='summary')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='order_summaries')
+    status = models.CharField(max_length=50)
+    is_shipped = models.BooleanField(default=False)
+    shipping_date = models.DateTimeField(null=True, blank=True)
+    total = models.DecimalField(max_digits=10, decimal_places=2)
+    item_count = models.PositiveIntegerField(default=0)
+    # [{'product', 'name', 'unit_price', 'quantity', 'line_total'}, ...]
+    line_items = models.JSONField(default=list)
+    created = models.DateTimeField()
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-created', '-id'], name='ordersummary_user_created_idx')]
+
+    @classmethod
+    def for_order(cls, order, lines):
+        """Build the summary of `order` from (product id, name, unit price, quantity) lines."""
+        line_items = [
+            {
+                'product': product_id,
+                'name': name,
+                'unit_price': str(unit_price),
+                'quantity': quantity,
+                'line_total': str(unit_price * quantity),
+            }
+            for product_id, name, unit_price, quantity in lines
+        ]
+        return cls(
+            order=order, user_id=order.user_id, status=order.status, is_shipped=order.is_shipped,
+            shipping_date=order.shipping_date, total=order.amount, created=order.created,
+            item_count=sum(line['quantity'] for line in line_items), line_items=line_items,
+        )
+
+    @classmethod
+    def sync_status(cls, order):
+        cls.objects.filter(order_id=order.pk).update(
+            status=order.status, is_shipped=order.is_shipped, shipping_date=order.shipping_date,
+            total=order.amount, updated=timezone.now(),
+        )
 
 
 
@@ -57,6 +178,12 @@ class Payment(models.Model):
     status = models.CharField(max_length=50)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payments')
     stripe_token = models.CharField(max_length=255, default='placeholder_value_for_existing_rows')
+
+    class Meta:
+        indexes = [
+            # A user's payments, newest first
+            models.Index(fields=['user', '-id'], name='payment_user_id_idx'),
+        ]
     
     def process_payment(self):
         # Check if the payment has already been processed
@@ -105,6 +232,53 @@ class Payment(models.Model):
             self.save()
     
     
+class PaymentJob(models.Model):
+    # Queued gateway call, executed by the run_payment_worker command
+    KIND_CHOICES = [
+        ('order', 'Order'),
+        ('cart', 'Cart'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payment_jobs')
+    idempotency_key = models.CharField(max_length=255)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payment_jobs')
+    cart = models.ForeignKey('Cart', on_delete=models.SET_NULL, related_name='payment_jobs', null=True, blank=True)
+    stripe_token = models.CharField(max_length=255)
+    payment_method = models.CharField(max_length=255, default='stripe')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    result = models.JSONField(default=dict, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'idempotency_key')
+        indexes = [models.Index(fields=['status', 'available_at'])]
+        constraints = [
+            # A retried request can't queue a second charge: an order is
+            # paid for by one job at a time, and one that succeeded is paid
+            models.UniqueConstraint(fields=['order'], condition=~models.Q(status='failed'), name='paymentjob_live_order_uniq'),
+            # Nor can a cart be checked out again while its payment runs
+            models.UniqueConstraint(
+                fields=['cart'], condition=models.Q(status__in=['queued', 'processing']), name='paymentjob_live_cart_uniq',
+            ),
+        ]
+
+    @property
+    def gateway_idempotency_key(self):
+        # Client keys are only unique per user, the gateway's are global
+        return f'user-{self.user_id}-{self.idempotency_key}'
+
+
 class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='product_reviews')
@@ -116,6 +290,44 @@ class Review(models.Model):
         if self.rating < 1 or self.rating > 5:
             raise ValidationError({'rating': 'Rating must be between 1 and 5.'})
 
+
+def rating_bucket(rating):
+    # Histogram bucket (1-5) a rating is counted in
+    return min(5, max(1, int(rating + 0.5)))
+
+
+class ProductRating(models.Model):
+    # Denormalized review stats, maintained by the Review signal handlers
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='rating_summary')
+    review_count = models.PositiveIntegerField(default=0)
+    rating_total = models.FloatField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    @property
+    def rating_mean(self):
+        if not self.review_count:
+            return None
+        return round(self.rating_total / self.review_count, 2)
+
+    @property
+    def histogram(self):
+        return {str(bucket): getattr(self, f'rating_{bucket}') for bucket in range(1, 6)}
+
+    @classmethod
+    def apply(cls, product_id, rating, sign=1):
+        # Add (sign=1) or remove (sign=-1) one review in a single UPDATE
+        cls.objects.get_or_create(product_id=product_id)
+        bucket = f'rating_{rating_bucket(rating)}'
+        cls.objects.filter(product_id=product_id).update(**{
+            'review_count': models.F('review_count') + sign,
+            'rating_total': models.F('rating_total') + sign * rating,
+            bucket: models.F(bucket) + sign,
+        })
+
 # class Address(models.Model):
 #     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='addresses')
 #     street_address = models.CharField(max_length=255)
@@ -159,7 +371,16 @@ class ContactMessage(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField()
     message = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the message is received, it may be written much later
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Messages written through ecommerce_app.contact are keyed, so a spool
+    # file written twice (after a crash mid-flush) adds nothing the second time
+    spool_id = models.UUIDField(unique=True, null=True, blank=True, editable=False)
 
     def __str__(self):
-        return f'{self.name} - {self.created_at}'
\ No newline at end of file
+        return f'{self.name} - {self.created_at}'
+
+class ReplicaHeartbeat(models.Model):
+    # A single row stamped on the primary by `manage.py replicate`, the copy
+    # a replica holds tells how far behind the primary it is
+    beat = models.DateTimeField()
@@ -0,0 +1,77 @@
+from decimal import Decimal
+
+from django.db import transaction
+
+from ecommerce_app.cache import catalog_cache
+from ecommerce_app.models import Product, Order, OrderItem, OrderSummary
+from ecommerce_app.reservations import hold_stock, reserve_stock
+
+
+class OrderError(Exception):
+    pass
+
+
+def collapse_line_items(products_data):
+    """Turn [{'product': id, 'quantity': n}, ...] into {id: total quantity}."""
+    quantities = {}
+    for product_data in products_data:
+        try:
+            product_id = product_data['product']
+            quantity = product_data['quantity']
+        except KeyError:
+            raise OrderError("Product data is missing the required fields.")
+
+        if quantity < 1:
+            raise OrderError(f"Quantity for product {product_id} must be at least 1.")
+
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def place_order(user, quantities, **order_fields):
+    """
+    Create an order for {product_id: quantity} and hold the stock for it.
+
+    Stock is only reserved here, with StockHolds that expire after
+    STOCK_HOLD_TTL_SECONDS unless the payment succeeds first. Runs in one
+    transaction with a fixed number of queries whatever the cart size: the
+    product fetch, one conditional reservation UPDATE, the order INSERT,
+    bulk INSERTs of the line items and holds and the OrderSummary INSERT.
+    """
+    if not quantities:
+        raise OrderError("No products provided.")
+
+    with transaction.atomic():
+        products = Product.objects.in_bulk(list(quantities))
+
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if product is None:
+                raise OrderError(f"Product with ID {product_id} does not exist.")
+            if quantity > product.available_quantity:
+                raise OrderError(f"Not enough stock for product {product.name}. Available stock: {product.available_quantity}")
+
+        # The checks above may be stale by now, the UPDATE rechecks every row
+        if not reserve_stock(quantities):
+            raise OrderError("Stock changed while placing the order, please try again.")
+
+        amount = sum(
+            (products[product_id].price * quantity for product_id, quantity in quantities.items()),
+            Decimal(0),
+        )
+        order = Order.objects.create(user=user, amount=amount, **order_fields)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id, quantity=quantity, unit_price=products[product_id].price)
+            for product_id, quantity in quantities.items()
+        ])
+        hold_stock(order, quantities)
+        # The history read model is written here, from the rows already in hand
+        OrderSummary.for_order(order, [
+            (product_id, products[product_id].name, products[product_id].price, quantity)
+            for product_id, quantity in quantities.items()
+        ]).save()
+
+        # The reservation UPDATE bypasses post_save, so drop the cached payloads here
+        catalog_cache.invalidate(quantities)
+
+    return order
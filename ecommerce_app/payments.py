@@ -0,0 +1,425 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from ecommerce_app.models import Payment, PaymentJob
+from ecommerce_app.reservations import convert_holds, release_holds
+
+
+logger = logging.getLogger(__name__)
+
+# Waiters back off from this to MAX_WAIT_INTERVAL between checks of the
+# cache for jobs finished in another process
+WAIT_INTERVAL = 0.25
+MAX_WAIT_INTERVAL = 2.0
+
+# job id -> (loop, event) of the waiters in this process
+_waiters = defaultdict(set)
+_waiters_lock = threading.Lock()
+
+
+class PaymentFailed(Exception):
+    pass
+
+
+class GatewayUnavailable(Exception):
+    pass
+
+
+class StripeGateway:
+    """Charges through the Stripe API."""
+
+    def charge(self, amount, source, description, idempotency_key):
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        try:
+            charge = stripe.Charge.create(
+                amount=amount,
+                currency='usd',
+                source=source,
+                description=description,
+                idempotency_key=idempotency_key,
+            )
+        except stripe.error.CardError as e:
+            raise PaymentFailed(str(e))
+        except (stripe.error.APIConnectionError, stripe.error.RateLimitError) as e:
+            raise GatewayUnavailable(str(e))
+        except stripe.error.StripeError as e:
+            raise PaymentFailed(str(e))
+        return {'id': charge.id, 'status': charge.status}
+
+    async def charge_async(self, amount, source, description, idempotency_key):
+        # The stripe library blocks, so the async worker talks to the REST
+        # API directly over one pooled HTTP client
+        import httpx
+
+        try:
+            response = await self.async_client().post(
+                'https://api.stripe.com/v1/charges',
+                data={'amount': amount, 'currency': 'usd', 'source': source, 'description': description},
+                headers={'Idempotency-Key': idempotency_key},
+                auth=(settings.STRIPE_SECRET_KEY, ''),
+            )
+        except httpx.TransportError as e:
+            raise GatewayUnavailable(str(e))
+
+        body = response.json()
+        if response.status_code == 429 or response.status_code >= 500:
+            raise GatewayUnavailable(body.get('error', {}).get('message', response.reason_phrase))
+        if response.status_code >= 400:
+            raise PaymentFailed(body.get('error', {}).get('message', response.reason_phrase))
+        return {'id': body['id'], 'status': body['status']}
+
+    def async_client(self):
+        import httpx
+
+        if getattr(self, '_async_client', None) is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=30,
+                limits=httpx.Limits(max_connections=settings.PAYMENT_GATEWAY_MAX_CONNECTIONS),
+            )
+        return self._async_client
+
+
+class FakeStripeGateway:
+    """
+    Local stand-in for Stripe used by tests and benchmarks.
+
+    Charges are keyed by idempotency key like the real API, and the test
+    tokens 'tok_chargeDeclined' and 'tok_unavailable' simulate failures.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.charges = {}
+
+    def charge(self, amount, source, description, idempotency_key):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._charge(amount, source, idempotency_key)
+
+    async def charge_async(self, amount, source, description, idempotency_key):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._charge(amount, source, idempotency_key)
+
+    def _charge(self, amount, source, idempotency_key):
+        if source == 'tok_chargeDeclined':
+            raise PaymentFailed('Your card was declined.')
+        if source == 'tok_unavailable':
+            raise GatewayUnavailable('Could not connect to the payment gateway.')
+
+        if idempotency_key not in self.charges:
+            self.charges[idempotency_key] = {
+                'id': f'ch_fake_{uuid.uuid4().hex[:24]}',
+                'status': 'succeeded',
+                'amount': amount,
+            }
+        charge = self.charges[idempotency_key]
+        return {'id': charge['id'], 'status': charge['status']}
+
+
+_gateways = {}
+
+
+def get_gateway():
+    # One instance per configured class, so overriding the setting takes effect
+    path = settings.PAYMENT_GATEWAY
+    if path not in _gateways:
+        _gateways[path] = import_string(path)()
+    return _gateways[path]
+
+
+def enqueue_payment(user, kind, order, stripe_token, idempotency_key=None, cart=None, payment_method='stripe'):
+    """
+    Queue a charge for `order` and return (job, created).
+
+    Replaying an idempotency key returns the job it first created instead
+    of queueing a second charge, and so does paying again for an order
+    that is being or has been paid for.
+    """
+    job = live_job(order=order)
+    if job is not None:
+        return job, False
+    idempotency_key = idempotency_key or uuid.uuid4().hex
+    try:
+        with transaction.atomic():
+            job = PaymentJob.objects.create(
+                user=user, idempotency_key=idempotency_key, kind=kind, order=order,
+                cart=cart, stripe_token=stripe_token, payment_method=payment_method,
+            )
+    except IntegrityError:
+        # A concurrent request won the race for the key, the order or the cart
+        job = (
+            PaymentJob.objects.filter(user=user, idempotency_key=idempotency_key).first()
+            or live_job(order=order)
+            or (cart is not None and live_job(cart=cart))
+        )
+        if not job:
+            raise
+        return job, False
+
+    if getattr(settings, 'PAYMENT_JOBS_EAGER', False):
+        transaction.on_commit(lambda: run_job(job.pk))
+    return job, True
+
+
+def live_job(order=None, cart=None):
+    """
+    The job paying for `order` unless it failed, or the job still running
+    for `cart`. The unique constraints of PaymentJob allow one of each.
+    """
+    if order is not None:
+        return PaymentJob.objects.filter(order=order).exclude(status='failed').first()
+    return PaymentJob.objects.filter(cart=cart, status__in=['queued', 'processing']).first()
+
+
+def claim_job():
+    """
+    Claim the oldest runnable job with a conditional UPDATE, so workers
+    never need row locks and two workers can't claim the same job.
+    Jobs whose worker died mid-call are picked up again after the lease.
+    """
+    now = timezone.now()
+    lease = now - timedelta(seconds=settings.PAYMENT_JOB_LEASE_SECONDS)
+    runnable = Q(status='queued', available_at__lte=now) | Q(status='processing', locked_at__lt=lease)
+
+    while True:
+        job_id = PaymentJob.objects.filter(runnable).order_by('available_at').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+
+        claimed = PaymentJob.objects.filter(runnable, pk=job_id).update(
+            status='processing', locked_at=timezone.now(), attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return PaymentJob.objects.select_related('order', 'cart').get(pk=job_id)
+
+
+def run_job(job_id):
+    claimed = PaymentJob.objects.filter(pk=job_id, status='queued').update(
+        status='processing', locked_at=timezone.now(), attempts=F('attempts') + 1,
+    )
+    if claimed:
+        process_job(PaymentJob.objects.select_related('order', 'cart').get(pk=job_id))
+
+
+def charge_arguments(job):
+    amount = int(job.order.amount * 100)  # Convert amount to cents
+    if amount < 1:
+        raise PaymentFailed('Invalid amount value')
+    return {
+        'amount': amount,
+        'source': job.stripe_token,
+        'description': 'Payment for Order #{}'.format(job.order_id),
+        'idempotency_key': job.gateway_idempotency_key,
+    }
+
+
+def process_job(job):
+    try:
+        charge = get_gateway().charge(**charge_arguments(job))
+    except Exception as e:
+        return charge_failed(job, e)
+    charge_succeeded(job, charge)
+
+
+async def process_job_async(job):
+    # Only the gateway call is awaited, the bookkeeping is short and sync
+    try:
+        charge = await get_gateway().charge_async(**charge_arguments(job))
+    except Exception as e:
+        return await sync_to_async(charge_failed)(job, e)
+    await sync_to_async(charge_succeeded)(job, charge)
+
+
+def charge_failed(job, error):
+    if isinstance(error, GatewayUnavailable):
+        # The gateway dedupes on the idempotency key, so retrying is safe
+        if job.attempts < settings.PAYMENT_JOB_MAX_ATTEMPTS:
+            retry_in = retry_job(job, error)
+            logger.warning('Payment job %s will be retried in %s: %s', job.pk, retry_in, error)
+            return
+        return fail_job(job, str(error))
+    if isinstance(error, PaymentFailed):
+        return fail_job(job, str(error))
+    logger.error('Payment job %s crashed', job.pk, exc_info=error)
+    return fail_job(job, 'An unexpected error occurred. {}'.format(str(error)))
+
+
+def retry_job(job, error):
+    """Queue `job` again after a backoff and return the delay."""
+    retry_in = timedelta(seconds=min(2 ** job.attempts, settings.PAYMENT_JOB_LEASE_SECONDS))
+    PaymentJob.objects.filter(pk=job.pk).update(
+        status='queued', locked_at=None, available_at=timezone.now() + retry_in, result={'error': str(error)},
+    )
+    return retry_in
+
+
+def recover_job(job, error):
+    """
+    Requeue a job whose processing raised, e.g. while recording a charge,
+    so the worker carries on with the next one. The gateway dedupes on
+    the idempotency key, so a charge that went through isn't taken twice.
+    """
+    logger.error('Payment job %s crashed', job.pk, exc_info=error)
+    try:
+        retry_job(job, error)
+    except Exception:
+        # Still picked up again once its lease runs out
+        logger.exception('Payment job %s could not be requeued', job.pk)
+
+
+def charge_succeeded(job, charge):
+    order = job.order
+    with transaction.atomic():
+        shipping_date = timezone.now() + timedelta(days=3) if job.kind == 'order' else timezone.now()
+        transaction_details = {
+            'charge_id': charge['id'],
+            'payment_status': charge['status'],
+            'shipping_date': shipping_date.strftime('%Y-%m-%d %H:%M:%S'),
+            'payment_amount': str(order.amount),
+        }
+        Payment.objects.update_or_create(order=order, defaults={
+            'payment_method': job.payment_method,
+            'transaction_details': transaction_details,
+            'status': 'success',
+            'user_id': job.user_id,
+            'stripe_token': job.stripe_token,
+        })
+        # The order's stock was only held so far, take it for good
+        convert_holds(order)
+
+        if job.kind == 'cart':
+            # Checkout from a cart ships straight away and takes the bought
+            # products out of the cart, ones added since stay
+            if job.cart_id:
+                job.cart.cart_items.filter(product__in=order.order_items.values('product')).delete()
+            order.is_shipped = True
+            order.shipping_date = shipping_date
+            order.save(update_fields=['is_shipped', 'shipping_date'])
+
+        job.status = 'succeeded'
+        job.result = transaction_details
+        job.locked_at = None
+        job.save(update_fields=['status', 'result', 'locked_at', 'updated'])
+        transaction.on_commit(lambda: job_finished(job.pk))
+
+
+def fail_job(job, error):
+    with transaction.atomic():
+        Payment.objects.update_or_create(order=job.order, defaults={
+            'payment_method': job.payment_method,
+            'transaction_details': {'error': error},
+            'status': 'failed',
+            'user_id': job.user_id,
+            'stripe_token': job.stripe_token,
+        })
+        # Give the held stock back to other buyers straight away
+        release_holds(job.order)
+        job.status = 'failed'
+        job.result = {'error': 'Payment failed. {}'.format(error)}
+        job.locked_at = None
+        job.save(update_fields=['status', 'result', 'locked_at', 'updated'])
+        transaction.on_commit(lambda: job_finished(job.pk))
+
+
+def _finished_key(job_id):
+    return f'payment:job:{job_id}:finished'
+
+
+def _jobs_cache():
+    return caches[settings.PAYMENT_JOB_CACHE_ALIAS]
+
+
+def job_finished(job_id):
+    """Wake whoever waits for job `job_id`, in this process or another."""
+    _jobs_cache().set(_finished_key(job_id), True, timeout=300)
+    with _waiters_lock:
+        waiters = list(_waiters.get(job_id, ()))
+    for loop, event in waiters:
+        loop.call_soon_threadsafe(event.set)
+
+
+async def wait_for_job(job_id, timeout):
+    """
+    Return once job `job_id` has succeeded or failed, or after `timeout`
+    seconds. Jobs finished in this process wake the waiter at once, ones
+    finished by another are seen in the cache, checked less and less often.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    waiter = (loop, asyncio.Event())
+    with _waiters_lock:
+        _waiters[job_id].add(waiter)
+    try:
+        interval = WAIT_INTERVAL
+        # Checked first too, the job may have finished before we got here
+        while not await _jobs_cache().aget(_finished_key(job_id)):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(waiter[1].wait(), min(interval, remaining))
+                return
+            except asyncio.TimeoutError:
+                interval = min(interval * 2, MAX_WAIT_INTERVAL)
+    finally:
+        with _waiters_lock:
+            _waiters[job_id].discard(waiter)
+            if not _waiters[job_id]:
+                del _waiters[job_id]
+
+
+def work(poll_interval=1.0, once=False):
+    """Process jobs until interrupted, or until the queue is empty with `once`."""
+    while True:
+        job = claim_job()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        try:
+            process_job(job)
+        except Exception as e:
+            recover_job(job, e)
+
+
+async def work_async(concurrency=100, poll_interval=1.0, once=False):
+    """
+    Like work(), but keeps up to `concurrency` gateway calls in flight on
+    one event loop instead of blocking on each charge in turn.
+    """
+    # task -> job
+    in_flight = {}
+    while True:
+        while len(in_flight) < concurrency:
+            job = await sync_to_async(claim_job)()
+            if job is None:
+                break
+            in_flight[asyncio.create_task(process_job_async(job))] = job
+
+        if not in_flight:
+            if once:
+                return
+            await asyncio.sleep(poll_interval)
+            continue
+
+        done, _ = await asyncio.wait(in_flight, timeout=poll_interval, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            job = in_flight.pop(task)
+            if task.exception() is not None:
+                await sync_to_async(recover_job)(job, task.exception())
@@ -0,0 +1,188 @@
+import contextvars
+import math
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+from django.utils import timezone
+from rest_framework.permissions import SAFE_METHODS
+
+
+# Replica alias the current request reads from, None reads from the primary
+_read_alias = contextvars.ContextVar('replica_read_alias', default=None)
+# Per-request state set up by ReplicaPinningMiddleware
+_request_state = contextvars.ContextVar('replica_request_state', default=None)
+
+# alias -> (checked at, last heartbeat seen on the replica)
+_heartbeats = {}
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def replica_synced_at(alias):
+    """
+    The primary's heartbeat as of the replica's last sync, None when the
+    replica can't be read. Checked at most every REPLICA_LAG_CHECK_INTERVAL.
+    """
+    from ecommerce_app.models import ReplicaHeartbeat
+
+    now = time.monotonic()
+    checked = _heartbeats.get(alias)
+    if checked is not None and now - checked[0] < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return checked[1]
+    try:
+        beat = ReplicaHeartbeat.objects.using(alias).values_list('beat', flat=True).first()
+    except DatabaseError:
+        beat = None
+    _heartbeats[alias] = (now, beat)
+    return beat
+
+
+def replica_lag(alias):
+    synced_at = replica_synced_at(alias)
+    if synced_at is None:
+        return math.inf
+    return (timezone.now() - synced_at).total_seconds()
+
+
+PIN_COOKIE = 'replica_pin'
+
+
+def _pin_key(user):
+    return f'replica:pin:{user.pk}'
+
+
+def _pins_cache():
+    return caches[settings.REPLICA_PIN_CACHE_ALIAS]
+
+
+def pin_to_primary(request, response, user):
+    # The pin travels with the client in a signed cookie, so it holds
+    # whichever worker serves the next request
+    response.set_signed_cookie(
+        PIN_COOKIE, str(user.pk), salt=PIN_COOKIE, max_age=settings.REPLICA_PIN_SECONDS,
+        secure=request.is_secure(), httponly=True, samesite='Lax',
+    )
+    # Token clients often keep no cookies, pin the user in the shared cache too
+    _pins_cache().set(_pin_key(user), True, timeout=settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(request, user):
+    # The signature's timestamp expires the pin even if the cookie is kept
+    pinned = request.get_signed_cookie(PIN_COOKIE, default=None, salt=PIN_COOKIE, max_age=settings.REPLICA_PIN_SECONDS)
+    return pinned == str(user.pk) or bool(_pins_cache().get(_pin_key(user)))
+
+
+def choose_replica(request):
+    """Pick a replica for a read-only request, or None for the primary."""
+    aliases = replica_aliases()
+    if not aliases:
+        return None
+    # Read-your-writes: someone who just wrote reads their own rows back
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and is_pinned(request, user):
+        return None
+    fresh = [alias for alias in aliases if replica_lag(alias) <= settings.REPLICA_MAX_LAG_SECONDS]
+    return random.choice(fresh) if fresh else None
+
+
+def current_replica():
+    return _read_alias.get()
+
+
+class ReplicaRouter:
+    """
+    Sends ecommerce_app reads to the replica picked for the request by
+    ReplicaReadMixin, everything else (and every write) to `default`.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is not None and model._meta.app_label == 'ecommerce_app':
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """Pins users to the primary for REPLICA_PIN_SECONDS after they write."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = {'wrote': False}
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        if state['wrote']:
+            self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        state = {'wrote': False}
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        if state['wrote']:
+            # Resolving a session user queries the database
+            await sync_to_async(self.pin)(request, response)
+        return response
+
+    def pin(self, request, response):
+        # DRF sets the authenticated user back on the Django request
+        user = getattr(request, 'user', None)
+        if replica_aliases() and user is not None and user.is_authenticated:
+            pin_to_primary(request, response, user)
+
+
+class ReplicaReadMixin:
+    """
+    Serves safe (read-only) requests of an APIView from a replica, unless
+    the user is pinned to the primary or every replica lags too far behind.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _read_alias.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication has run by now, so pins can be looked up per user
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            _read_alias.set(choose_replica(request))
@@ -0,0 +1,134 @@
+import logging
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, Value, When
+from django.utils import timezone
+
+from ecommerce_app.cache import catalog_cache
+from ecommerce_app.models import Order, Product, StockHold
+
+
+logger = logging.getLogger(__name__)
+
+
+def reserve_stock(quantities):
+    """
+    Add {product_id: quantity} to the products' reserved stock in one
+    conditional UPDATE, each row guarded by its own availability check.
+
+    Returns False, having reserved nothing, unless every product had
+    enough stock left. No rows are locked, so concurrent buyers of the
+    same product only ever wait for the UPDATE itself.
+    """
+    guards = reduce(or_, (
+        Q(pk=product_id, stock_quantity__gte=F('stock_reserved') + quantity)
+        for product_id, quantity in quantities.items()
+    ))
+    with transaction.atomic():
+        updated = Product.objects.filter(guards).update(
+            stock_reserved=F('stock_reserved') + _case_by_pk(quantities)
+        )
+        if updated != len(quantities):
+            transaction.set_rollback(True)
+            return False
+    return True
+
+
+def hold_stock(order, quantities):
+    """Record the holds backing a successful reserve_stock() for `order`."""
+    expires_at = timezone.now() + timedelta(seconds=settings.STOCK_HOLD_TTL_SECONDS)
+    return StockHold.objects.bulk_create([
+        StockHold(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in quantities.items()
+    ])
+
+
+def convert_holds(order):
+    """
+    Turn the order's holds into stock decrements once it is paid for, with
+    one UPDATE of the holds and one per hold status of the products.
+    """
+    with transaction.atomic():
+        # Locking the holds makes sure each is settled only once, even if
+        # the sweeper releases it at the same moment
+        holds = list(order.stock_holds.select_for_update().filter(status__in=['held', 'released']).values_list(
+            'pk', 'product_id', 'quantity', 'status',
+        ))
+        if not holds:
+            return
+        StockHold.objects.filter(pk__in=[pk for pk, _, _, _ in holds]).update(status='converted')
+
+        held = _quantities(hold[:3] for hold in holds if hold[3] == 'held')
+        if held:
+            Product.objects.filter(pk__in=list(held)).update(
+                stock_quantity=F('stock_quantity') - _case_by_pk(held),
+                stock_reserved=F('stock_reserved') - _case_by_pk(held),
+            )
+        released = _quantities(hold[:3] for hold in holds if hold[3] == 'released')
+        if released:
+            # Expired before the payment went through, take the stock where
+            # it is still there
+            guards = reduce(or_, (
+                Q(pk=product_id, stock_quantity__gte=F('stock_reserved') + quantity)
+                for product_id, quantity in released.items()
+            ))
+            taken = Product.objects.filter(guards).update(stock_quantity=F('stock_quantity') - _case_by_pk(released))
+            if taken != len(released):
+                # The payment stands, flag the order rather than oversell
+                logger.error('Order %s was paid for after its holds expired and some of the stock is gone', order.pk)
+                Order.objects.filter(pk=order.pk).update(needs_attention=True)
+                order.needs_attention = True
+        catalog_cache.invalidate({product_id for _, product_id, _, _ in holds})
+
+
+def release_holds(order):
+    """Give the stock held for an unpaid order back, returns how many holds were released."""
+    with transaction.atomic():
+        return _release(order.stock_holds.select_for_update().filter(status='held'))
+
+
+def sweep_expired_holds(batch_size=500):
+    """Release every expired hold, returns how many were released."""
+    released = 0
+    while True:
+        with transaction.atomic():
+            # Holds an order is settling right now are left for next time
+            expired = StockHold.objects.select_for_update(skip_locked=True).filter(
+                status='held', expires_at__lte=timezone.now(),
+            )[:batch_size]
+            count = _release(expired)
+        released += count
+        if count < batch_size:
+            return released
+
+
+def _release(holds):
+    # Callers lock `holds` in their transaction first
+    holds = list(holds.values_list('pk', 'product_id', 'quantity'))
+    if not holds:
+        return 0
+    StockHold.objects.filter(pk__in=[pk for pk, _, _ in holds]).update(status='released')
+    quantities = _quantities(holds)
+    Product.objects.filter(pk__in=list(quantities)).update(stock_reserved=F('stock_reserved') - _case_by_pk(quantities))
+    catalog_cache.invalidate(quantities)
+    return len(holds)
+
+
+def _quantities(holds):
+    # (pk, product_id, quantity) rows -> {product_id: total quantity}
+    quantities = {}
+    for _, product_id, quantity in holds:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def _case_by_pk(values):
+    return Case(
+        *(When(pk=pk, then=Value(value)) for pk, value in values.items()),
+        default=Value(0),
+        output_field=PositiveIntegerField(),
+    )
@@ -0,0 +1,381 @@
+import functools
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rapidfuzz import fuzz, process
+
+
+SEARCH_THRESHOLD = 80
+
+# The pair lookups in candidates() are only exact from this threshold up,
+# below it every search scores the whole catalog
+MIN_PRUNABLE_THRESHOLD = 80
+
+# Other processes replay at most this many logged changes before they
+# fall back to reloading the whole index
+MAX_CATCH_UP = 500
+
+# Results of the most recent distinct searches, dropped on any change
+RESULT_CACHE_SIZE = 256
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _pairs(text):
+    # Bigrams plus the pairs one character apart, which survive a single
+    # edit between them
+    return _bigrams(text) | {text[i] + text[i + 2] for i in range(len(text) - 2)}
+
+
+@functools.cache
+def _fewest_shared(threshold, length):
+    """
+    Fewest bigrams of a string of `length` that stay adjacent in any
+    string it partial matches at `threshold`, as the shorter side.
+
+    Against a window of w characters with l of them in common the
+    score is 200 * l / (length + w). A character dropped breaks at
+    most two bigrams and one inserted breaks at most one, which leaves
+    at least 3 * l - length - w - 1 of the length - 1 bigrams.
+    """
+    fewest = max(length - 1, 0)
+    for window in range(1, length + 1):
+        common = -(-threshold * (length + window) // 200)
+        if common <= window:
+            fewest = min(fewest, 3 * common - length - window - 1)
+    return max(fewest, 0)
+
+
+def _in_at_least(postings, times):
+    # Ids found in at least `times` of the postings, with set operations
+    # only: levels[i] holds the ids seen more than i times so far
+    levels = [set() for _ in range(times)]
+    for posting in postings:
+        for i in range(times - 1, 0, -1):
+            levels[i] |= levels[i - 1] & posting
+        levels[0] |= posting
+    return levels[-1]
+
+
+def _discard(index, key, pk):
+    posting = index.get(key)
+    if posting is not None:
+        posting.discard(pk)
+        if not posting:
+            del index[key]
+
+
+def _decrement(counter, key):
+    # Keep emptied keys out, candidates() walks every bucket
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
+
+
+def _normalise(name):
+    return (name or '').lower()
+
+
+class ProductSearchIndex:
+    """
+    In-process bigram index over product names.
+
+    Candidates are pruned with a count filter that is exact for
+    partial_ratio: whichever of the query and the name is shorter keeps
+    at least _fewest_shared() of its bigrams in the other (fewer if it
+    repeats some). Postings are bucketed by name length and by how many
+    of their own bigrams names share with any match, so names at least
+    as long as the query are counted against the query's requirement
+    and shorter names against their own. Strings too short to keep any
+    bigram (1 and 3 characters at threshold 80) are looked up by their
+    characters, or by pairs at most one character apart, which survive
+    the single edit they can take. This is exact at thresholds of 80 and
+    above, and survivors are scored with rapidfuzz, so the results are
+    the same as scoring every product.
+
+    Every process builds its own index. Changes are published through a
+    version counter and a short log of changed ids in the catalog cache,
+    which other processes replay before their next search, and the whole
+    index is reloaded every SEARCH_INDEX_TTL seconds.
+    """
+
+    VERSION_KEY = 'search:version'
+
+    def __init__(self, threshold=SEARCH_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._loaded = False
+        self._version = None
+        self._loaded_at = 0.0
+        self._names = {}
+        # (length, shared, bigram) -> ids, with a count per (length, shared)
+        self._postings = defaultdict(set)
+        self._buckets = Counter()
+        self._grams = Counter()
+        # (length, character or pair) -> ids, for names that share no bigram
+        self._shorter = defaultdict(set)
+        self._results = OrderedDict()
+        self._generation = 0
+
+    @property
+    def backend(self):
+        return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'SEARCH_INDEX_TTL', 300)
+
+    def _changes_key(self, version):
+        return f'search:changes:{version}'
+
+    def _shared_version(self):
+        value = self.backend.get(self.VERSION_KEY)
+        if value is None:
+            # Seed from the clock so an evicted counter never goes back
+            self.backend.add(self.VERSION_KEY, time.time_ns(), timeout=None)
+            value = self.backend.get(self.VERSION_KEY)
+        return value
+
+    def _shared(self, text, grams):
+        # How many of its `grams` a match must share, when `text` is the shorter
+        fewest = _fewest_shared(self.threshold, len(text))
+        repeated = len(text) - 1 - len(grams)
+        return max(min(fewest, 1), fewest - repeated)
+
+    def _touch(self):
+        # Cached results may no longer hold
+        self._generation += 1
+        self._results.clear()
+
+    def _add(self, pk, name):
+        name = _normalise(name)
+        self._names[pk] = name
+        self._touch()
+        if not name:
+            return
+        grams = _bigrams(name)
+        bucket = (len(name), self._shared(name, grams))
+        self._buckets[bucket] += 1
+        for gram in grams:
+            self._postings[(*bucket, gram)].add(pk)
+            self._grams[gram] += 1
+        if not bucket[1]:
+            for key in name if len(name) == 1 else _pairs(name):
+                self._shorter[len(name), key].add(pk)
+
+    def _remove(self, pk):
+        if pk not in self._names:
+            return
+        name = self._names.pop(pk)
+        self._touch()
+        if not name:
+            return
+        grams = _bigrams(name)
+        bucket = (len(name), self._shared(name, grams))
+        _decrement(self._buckets, bucket)
+        for gram in grams:
+            _decrement(self._grams, gram)
+            _discard(self._postings, (*bucket, gram), pk)
+        if not bucket[1]:
+            for key in name if len(name) == 1 else _pairs(name):
+                _discard(self._shorter, (len(name), key), pk)
+
+    def _replace(self, pk, name):
+        if self._names.get(pk) != _normalise(name):
+            self._remove(pk)
+            self._add(pk, name)
+
+    def load(self, rows=None):
+        """Rebuild the index from (pk, name) `rows`, every product by default."""
+        from ecommerce_app.models import Product
+
+        # Read the version first, changes published while loading are replayed
+        version = self._shared_version()
+        if rows is None:
+            rows = Product.objects.values_list('pk', 'name').iterator(chunk_size=5000)
+        # Build aside and swap, searches keep using the old index meanwhile
+        fresh = ProductSearchIndex(self.threshold)
+        for pk, name in rows:
+            fresh._add(pk, name)
+        with self._lock:
+            self._names, self._postings, self._shorter = fresh._names, fresh._postings, fresh._shorter
+            self._buckets, self._grams = fresh._buckets, fresh._grams
+            self._touch()
+            self._version = version
+            self._loaded_at = time.monotonic()
+            self._loaded = True
+
+    def _refresh(self):
+        version = self._shared_version()
+        if self._loaded and version == self._version and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        # One thread refreshes, the others keep searching a loaded index
+        if not self._refresh_lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            if not self._loaded or time.monotonic() - self._loaded_at >= self.ttl or not self._catch_up(version):
+                self.load()
+        finally:
+            self._refresh_lock.release()
+
+    def _catch_up(self, target):
+        """Replay the changes logged since our version, False if some are missing."""
+        from ecommerce_app.models import Product
+
+        if target <= self._version:
+            return True
+        if not 0 < target - self._version <= MAX_CATCH_UP:
+            return False
+        keys = [self._changes_key(version) for version in range(self._version + 1, target + 1)]
+        changes = self.backend.get_many(keys)
+        # A missing entry or one without ids (see changed()) needs a reload
+        if len(changes) < len(keys) or any(pks is None for pks in changes.values()):
+            return False
+        pks = {pk for logged in changes.values() for pk in logged}
+        names = dict(Product.objects.filter(pk__in=pks).values_list('pk', 'name'))
+        with self._lock:
+            for pk in pks:
+                if pk in names:
+                    self._replace(pk, names[pk])
+                else:
+                    self._remove(pk)
+            self._version = max(self._version, target)
+        return True
+
+    def changed(self, pks=None):
+        """
+        Tell every process that the names of products `pks` changed, once
+        the transaction commits. Without `pks` every index is reloaded,
+        e.g. after a bulk_create.
+        """
+        pks = None if pks is None else list(pks)
+        transaction.on_commit(lambda: self._publish(pks))
+
+    def _publish(self, pks):
+        try:
+            version = self.backend.incr(self.VERSION_KEY)
+        except ValueError:
+            self._shared_version()
+            version = self.backend.incr(self.VERSION_KEY)
+        # Log entries only need to outlive the indexes built before them
+        self.backend.set(self._changes_key(version), pks, timeout=max(self.ttl, 1))
+        with self._lock:
+            # Our own change is already applied, unless something else
+            # was published in between
+            if pks is not None and self._version == version - 1:
+                self._version = version
+
+    def update(self, pk, name):
+        with self._lock:
+            if self._loaded and self._names.get(pk) == _normalise(name):
+                # Saved without a rename, nothing to tell the others
+                return
+            if self._loaded:
+                self._replace(pk, name)
+        self.changed([pk])
+
+    def remove(self, pk):
+        with self._lock:
+            if self._loaded:
+                self._remove(pk)
+        self.changed([pk])
+
+    def reset(self):
+        with self._lock:
+            self._loaded = False
+            self._version = None
+            self._names = {}
+            self._postings = defaultdict(set)
+            self._buckets = Counter()
+            self._grams = Counter()
+            self._shorter = defaultdict(set)
+            self._touch()
+
+    def __len__(self):
+        return len(self._names)
+
+    def candidates(self, query):
+        """Return the ids that can possibly reach the threshold, or None to scan everything."""
+        if self.threshold < MIN_PRUNABLE_THRESHOLD:
+            return None
+
+        postings, shorter = self._postings, self._shorter
+        grams = _bigrams(query)
+        shared = self._shared(query, grams)
+        found = set()
+        counted = defaultdict(list)
+        if not shared:
+            # A query with no bigram to spare: its character, or a pair at
+            # most one character apart, is in every longer match
+            anchors = [gram for gram in self._grams if query in gram] if len(query) == 1 else _pairs(query)
+
+        for length, own in self._buckets:
+            # Names at least as long as the query must share the query's
+            # bigrams, shorter ones their own (equal lengths either way)
+            needed = []
+            if length >= len(query) and shared:
+                needed.append(shared)
+            if length <= len(query) and own:
+                needed.append(own)
+            needed = min(needed, default=0)
+            for gram in grams if needed else ():
+                posting = postings.get((length, own, gram))
+                if not posting:
+                    continue
+                if needed == 1:
+                    found |= posting
+                else:
+                    counted[needed].append(posting)
+
+            if length >= len(query) and not shared:
+                for key in anchors:
+                    found |= postings.get((length, own, key), set())
+
+            if length <= len(query) and not own:
+                # Likewise for short names, which are indexed by those keys
+                for key in set(query) if length == 1 else grams:
+                    found |= shorter.get((length, key), set())
+
+        for needed, group in counted.items():
+            found |= _in_at_least(group, needed)
+        return found
+
+    def search(self, term):
+        """Return the ids of products whose name partially matches `term`."""
+        self._refresh()
+        query = _normalise(term)
+        if not query:
+            return []
+
+        with self._lock:
+            if query in self._results:
+                self._results.move_to_end(query)
+                return self._results[query]
+            generation = self._generation
+            ids = self.candidates(query)
+            ids = list(self._names) if ids is None else list(ids)
+            choices = list(map(self._names.__getitem__, ids))
+
+        matches = process.extract(
+            query, choices, scorer=fuzz.partial_ratio,
+            score_cutoff=self.threshold, limit=None,
+        )
+        found = [ids[index] for _, _, index in matches]
+
+        with self._lock:
+            # Unless the index changed while scoring
+            if generation == self._generation:
+                self._results[query] = found
+                if len(self._results) > RESULT_CACHE_SIZE:
+                    self._results.popitem(last=False)
+        return found
+
+
+product_index = ProductSearchIndex()
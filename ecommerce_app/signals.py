@@ -0,0 +1,67 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from ecommerce_app.models import Order, OrderSummary, Product, ProductRating, Review
+from ecommerce_app.search import product_index
+from ecommerce_app.cache import catalog_cache
+from ecommerce_app.images import schedule_product_image
+from ecommerce_app.reservations import release_holds
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    # Keep the fuzzy search index in step with product names
+    product_index.update(instance.pk, instance.name)
+    catalog_cache.invalidate()
+
+
+@receiver(post_save, sender=Product)
+def resize_product_image(sender, instance, **kwargs):
+    # Thumbnails and responsive widths are rendered on the image worker pool
+    schedule_product_image(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    product_index.remove(instance.pk)
+    catalog_cache.invalidate()
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    # Keep the stored values so an edit can be taken out of the summary
+    instance._previous = None
+    if instance.pk:
+        instance._previous = Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    if previous == (instance.product_id, instance.rating):
+        return
+    if previous is not None:
+        ProductRating.apply(*previous, sign=-1)
+        catalog_cache.invalidate([previous[0]])
+    ProductRating.apply(instance.product_id, instance.rating)
+    catalog_cache.invalidate([instance.product_id])
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    ProductRating.apply(instance.product_id, instance.rating, sign=-1)
+    catalog_cache.invalidate([instance.product_id])
+
+
+@receiver(post_save, sender=Order)
+def update_order_summary(sender, instance, created, **kwargs):
+    # place_order() writes the summary of a new order once its items exist
+    if not created:
+        OrderSummary.sync_status(instance)
+
+
+@receiver(pre_delete, sender=Order)
+def release_order_holds(sender, instance, **kwargs):
+    # The order's holds are deleted along with it, so give their stock
+    # back first, in the same transaction as the delete
+    release_holds(instance)
@@ -1,3 +1,1070 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import warnings
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from urllib.parse import urlencode
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import UnorderedObjectListWarning
+from django.db import connection, connections
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from PIL import Image
+from rapidfuzz import fuzz
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from ecommerce_app import payments, replicas
+from ecommerce_app.api.urls import async_urlpatterns
+from ecommerce_app.cache import catalog_cache
+from ecommerce_app.contact import contact_buffer, drain_spools
+from ecommerce_app.metrics import registry
+from ecommerce_app.models import (
+    Product, Order, OrderItem, OrderSummary, Cart, CartItem, ContactMessage, Payment, PaymentJob, Review, StockHold,
+    Wishlist,
+)
+from ecommerce_app.orders import OrderError, place_order
+from ecommerce_app.reservations import convert_holds, release_holds, sweep_expired_holds
+from ecommerce_app.search import SEARCH_THRESHOLD, ProductSearchIndex, product_index
+from ecommerce_app.throttling import throttler
+from user_app.tokens import issue_token
+
+
+class QueryCountTests(APITestCase):
+    """
+    Every read endpoint must run the same number of queries whether the
+    fixtures hold SMALL or LARGE rows, so an N+1 query pattern fails here.
+    """
+
+    # SMALL stays below PAGE_SIZE so per-page N+1s show up as well
+    SMALL = 3
+    LARGE = 10000
+
+    ENDPOINTS = [
+        '/products/',
+        '/products/?pagination=cursor',
+        '/products/?search=keyboard&category=electronics',
+        '/products/{product}/',
+        '/orders/',
+        ('/orders/', 'staff'),
+        '/orders/{order}/',
+        '/orders/history/',
+        '/cart/{cart}/',
+        '/cart/items/',
+        '/payments/',
+        '/payment/{payment}/',
+        '/reviews/',
+        '/wishlist/',
+        '/wishlist/{wishlist}/',
+        '/wishlist/{wishlist}/list_products/',
+    ]
+
+    def setUp(self):
+        catalog_cache.backend.clear()
+        product_index.reset()
+        throttler.reset()
+
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        self.cart = Cart.objects.create(user=self.user)
+        self.wishlist = Wishlist.objects.create(user=self.user)
+        self.rows = 0
+
+    def grow(self, size):
+        # Add rows until every fixture table holds `size` of them
+        start, self.rows = self.rows, size
+        products = Product.objects.bulk_create([
+            Product(name=f'keyboard {i}', description='Mechanical keyboard', price=10,
+                    stock_quantity=100, category='electronics')
+            for i in range(start, size)
+        ])
+        orders = Order.objects.bulk_create([
+            Order(user=self.user, amount=10) for _ in range(start, size)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=orders[0], product=product, quantity=1, unit_price=10)
+            for product in products
+        ])
+        OrderSummary.objects.bulk_create([
+            OrderSummary.for_order(order, [(product.pk, product.name, product.price, 1) for product in products[:3]])
+            for order in orders
+        ])
+        Payment.objects.bulk_create([
+            Payment(order=order, user=self.user, payment_method='stripe',
+                    transaction_details='{}', status='success')
+            for order in orders
+        ])
+        Review.objects.bulk_create([
+            Review(user=self.user, product=product, content='Great', rating=4)
+            for product in products
+        ])
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=product, quantity=1) for product in products
+        ])
+        Wishlist.products.through.objects.bulk_create([
+            Wishlist.products.through(wishlist=self.wishlist, product=product) for product in products
+        ])
+        Wishlist.objects.bulk_create([Wishlist(user=self.user) for _ in range(start + 1, size)])
+        product_index.reset()
+
+    def count_queries(self, url, user):
+        catalog_cache.backend.clear()
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(context)
+
+    def measure(self):
+        ids = {
+            'product': Product.objects.order_by('pk').values_list('pk', flat=True).first(),
+            'order': Order.objects.order_by('pk').values_list('pk', flat=True).first(),
+            'payment': Payment.objects.order_by('pk').values_list('pk', flat=True).first(),
+            'cart': self.cart.pk,
+            'wishlist': self.wishlist.pk,
+        }
+        counts = {}
+        for endpoint in self.ENDPOINTS:
+            url, as_user = endpoint if isinstance(endpoint, tuple) else (endpoint, 'user')
+            counts[endpoint] = self.count_queries(url.format(**ids), getattr(self, as_user))
+        return counts
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        # Seeding is the slow part, so every endpoint shares the two sizes
+        self.grow(self.SMALL)
+        small = self.measure()
+        self.grow(self.LARGE)
+        large = self.measure()
+
+        for endpoint in self.ENDPOINTS:
+            with self.subTest(endpoint=endpoint):
+                self.assertEqual(
+                    small[endpoint], large[endpoint],
+                    f'{endpoint} ran {small[endpoint]} queries with {self.SMALL} rows '
+                    f'and {large[endpoint]} with {self.LARGE}',
+                )
+
+
+
+class PlaceOrderTests(APITestCase):
+    def setUp(self):
+        catalog_cache.backend.clear()
+        throttler.reset()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Keyboard {i}', description='Mechanical', price=10, stock_quantity=5) for i in range(10)
+        ])
+
+    def assertReserved(self, *reserved):
+        self.assertEqual(
+            list(Product.objects.order_by('pk').values_list('stock_reserved', flat=True)[:len(reserved)]), list(reserved),
+        )
+
+    def test_query_count_does_not_grow_with_lines(self):
+        counts = []
+        for products in (self.products[:1], self.products):
+            with CaptureQueriesContext(connection) as context:
+                place_order(self.user, {product.pk: 1 for product in products})
+            counts.append(len(context))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_stock_taken_after_the_check_fails_the_whole_order(self):
+        first, second = self.products[:2]
+        in_bulk = Product.objects.in_bulk
+
+        def in_bulk_then_sell_out(*args, **kwargs):
+            # Another buyer reserves the rest of the second product meanwhile
+            products = in_bulk(*args, **kwargs)
+            Product.objects.filter(pk=second.pk).update(stock_reserved=4)
+            return products
+
+        with mock.patch.object(Product.objects, 'in_bulk', in_bulk_then_sell_out):
+            with self.assertRaisesMessage(OrderError, 'Stock changed while placing the order'):
+                place_order(self.user, {first.pk: 1, second.pk: 2})
+        self.assertFalse(Order.objects.exists())
+        self.assertReserved(0, 0)
+
+    def test_unknown_products_and_short_stock_are_rejected(self):
+        with self.assertRaisesMessage(OrderError, 'Product with ID 0 does not exist.'):
+            place_order(self.user, {self.products[0].pk: 1, 0: 1})
+        with self.assertRaisesMessage(OrderError, 'Not enough stock for product Keyboard 0. Available stock: 5'):
+            place_order(self.user, {self.products[0].pk: 6})
+        self.assertFalse(Order.objects.exists())
+        self.assertReserved(0)
+
+        # The API answers both with a 400
+        self.client.force_authenticate(self.user)
+        for products in ([{'product': 0, 'quantity': 1}], [{'product': self.products[0].pk, 'quantity': 6}]):
+            response = self.client.post('/orders/create/', {'products': products}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(THROTTLE_ENABLED=True, THROTTLE_RATES={'user': (1, 20), 'anon': (1, 20)})
+class ThrottleTests(APITestCase):
+    def setUp(self):
+        catalog_cache.backend.clear()
+        throttler.reset()
+        # Don't leave the test client's IP throttled for the other tests
+        self.addCleanup(throttler.reset)
+
+    def test_searches_cost_more_than_reads(self):
+        # A burst of 20 tokens is 20 detail reads, but only 2 searches
+        for _ in range(2):
+            self.assertEqual(self.client.get('/products/?search=keyboard').status_code, 200)
+        response = self.client.get('/products/?search=mouse')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(throttler.stats(), {('product-search', 'anon'): 1})
+
+        # The client's bucket was emptied, whatever the endpoint
+        self.assertEqual(self.client.get('/products/').status_code, 429)
+
+    def test_forged_forwarded_for_headers_share_the_real_address(self):
+        statuses = [
+            self.client.get('/products/?search=keyboard', HTTP_X_FORWARDED_FOR=f'10.0.0.{i}').status_code
+            for i in range(3)
+        ]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    @override_settings(THROTTLE_RATES={'user': (1, 1000), 'anon': (1, 1000)})
+    def test_login_attempts_are_limited_per_client(self):
+        def login(address):
+            return self.client.post('/account/login/', {'username': 'buyer', 'password': 'wrong'}, REMOTE_ADDR=address)
+
+        # Five attempts at cost 10 fill a burst of 50
+        self.assertEqual([login('10.0.0.1').status_code for _ in range(6)], [400] * 5 + [429])
+        self.assertEqual(throttler.stats(), {('login', 'anon_scope'): 1})
+        # Someone else can still log in
+        self.assertEqual(login('10.0.0.2').status_code, 400)
+
+
+class ContactBufferTests(APITestCase):
+    def setUp(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_dir = Path(spool_dir.name)
+        # The buffer's own thread never wakes up, the test flushes
+        overrides = override_settings(CONTACT_SPOOL_DIR=spool_dir.name, CONTACT_BUFFER_SIZE=1000, CONTACT_BUFFER_INTERVAL=3600)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # Start over with a spool in the temporary directory
+        contact_buffer._pid = None
+
+    def test_messages_are_saved_in_one_batch(self):
+        for i in range(5):
+            response = self.client.post('/contact/', {'name': f'Buyer {i}', 'email': 'buyer@example.com', 'message': 'Hi'})
+            self.assertEqual(response.data, {'success': True})
+        self.assertFalse(ContactMessage.objects.exists())
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(contact_buffer.flush(), 5)
+        self.assertEqual(ContactMessage.objects.count(), 5)
+        self.assertEqual(len([q for q in context if q['sql'].startswith('INSERT')]), 1)
+
+    def test_drain_saves_spools_of_dead_processes(self):
+        line = {'spool_id': 'a' * 32, 'name': 'Buyer', 'email': 'buyer@example.com', 'message': 'Hi',
+                'created_at': '2026-01-01T00:00:00+00:00'}
+        (self.spool_dir / 'contact-1-dead.jsonl').write_text(json.dumps(line) + '\n{"truncated')
+        self.assertEqual(drain_spools(), 1)
+        self.assertEqual(ContactMessage.objects.get().created_at.year, 2026)
+        self.assertEqual(list(self.spool_dir.iterdir()), [])
+
+
+class StockHoldTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.product = Product.objects.create(name='Keyboard', description='Mechanical', price=10, stock_quantity=3)
+
+    def assertStock(self, quantity, reserved):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.product.stock_reserved), (quantity, reserved))
+
+    def test_orders_hold_stock_until_paid(self):
+        order = place_order(self.user, {self.product.pk: 2})
+        self.assertStock(3, 2)
+        self.assertEqual(order.stock_holds.get().status, 'held')
+        with self.assertRaises(OrderError):
+            place_order(self.user, {self.product.pk: 2})
+
+        convert_holds(order)
+        self.assertStock(1, 0)
+        self.assertEqual(order.stock_holds.get().status, 'converted')
+        # Settling twice changes nothing
+        convert_holds(order)
+        release_holds(order)
+        self.assertStock(1, 0)
+
+    def test_released_and_expired_holds_give_the_stock_back(self):
+        order = place_order(self.user, {self.product.pk: 2})
+        self.assertEqual(release_holds(order), 1)
+        self.assertStock(3, 0)
+
+        order = place_order(self.user, {self.product.pk: 3})
+        StockHold.objects.filter(order=order).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(sweep_expired_holds(), 1)
+        self.assertEqual(sweep_expired_holds(), 0)
+        self.assertStock(3, 0)
+
+    def test_paying_after_the_stock_sold_out_flags_the_order(self):
+        late = place_order(self.user, {self.product.pk: 2})
+        StockHold.objects.filter(order=late).update(expires_at=timezone.now() - timedelta(seconds=1))
+        sweep_expired_holds()
+        # Someone else buys the stock meanwhile
+        convert_holds(place_order(self.user, {self.product.pk: 3}))
+
+        with self.assertLogs('ecommerce_app.reservations', 'ERROR'):
+            convert_holds(late)
+        late.refresh_from_db()
+        self.assertTrue(late.needs_attention)
+        self.assertStock(0, 0)
+
+        # Stock that is still there is simply taken
+        self.product.stock_quantity = 2
+        self.product.save()
+        order = place_order(self.user, {self.product.pk: 2})
+        release_holds(order)
+        convert_holds(order)
+        order.refresh_from_db()
+        self.assertFalse(order.needs_attention)
+        self.assertStock(0, 0)
+
+    def test_settling_runs_the_same_queries_for_any_number_of_lines(self):
+        products = Product.objects.bulk_create([
+            Product(name=f'Mouse {i}', description='Wireless', price=5, stock_quantity=3) for i in range(5)
+        ])
+        counts = []
+        for lines in ({self.product.pk: 1}, {product.pk: 1 for product in products}):
+            paid, unpaid = place_order(self.user, lines), place_order(self.user, lines)
+            with CaptureQueriesContext(connection) as convert:
+                convert_holds(paid)
+            with CaptureQueriesContext(connection) as release:
+                release_holds(unpaid)
+            counts.append((len(convert), len(release)))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_saving_a_loaded_product_keeps_newer_reservations(self):
+        product = Product.objects.get(pk=self.product.pk)
+        place_order(self.user, {self.product.pk: 2})
+        product.stock_quantity = 5
+        product.save()
+        self.assertStock(5, 2)
+
+    def test_deleting_an_unpaid_order_releases_its_holds(self):
+        order = place_order(self.user, {self.product.pk: 3})
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.delete(f'/orders/{order.pk}/delete/').status_code, 204)
+        self.assertStock(3, 0)
+        place_order(self.user, {self.product.pk: 3})
+
+
+class OrderSummaryTests(APITestCase):
+    def setUp(self):
+        throttler.reset()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.product = Product.objects.create(name='Keyboard', description='Mechanical', price=10, stock_quantity=5)
+        self.order = place_order(self.user, {self.product.pk: 2}, status='pending')
+        self.client.force_authenticate(self.user)
+
+    def assertSummaryFollows(self):
+        self.order.refresh_from_db()
+        summary = OrderSummary.objects.get(order=self.order)
+        self.assertEqual(
+            (summary.status, summary.is_shipped, summary.shipping_date, summary.total),
+            (self.order.status, self.order.is_shipped, self.order.shipping_date, self.order.amount),
+        )
+
+    def test_status_and_shipping_changes_reach_the_summary(self):
+        self.assertSummaryFollows()
+
+        response = self.client.patch(f'/orders/{self.order.pk}/update/', {'status': 'shipped', 'is_shipped': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertSummaryFollows()
+        self.assertIsNotNone(self.order.shipping_date)
+
+        # Partial saves, like the payment worker's, are followed too
+        self.order.status = 'delivered'
+        self.order.save(update_fields=['status'])
+        self.assertSummaryFollows()
+        self.assertEqual(self.client.get('/orders/history/').data['results'][0]['status'], 'delivered')
+
+
+@override_settings(PAYMENT_GATEWAY='ecommerce_app.payments.FakeStripeGateway', PAYMENT_JOBS_EAGER=False)
+class PaymentTests(APITestCase):
+    def setUp(self):
+        payments._gateways.clear()
+        throttler.reset()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.cart = Cart.objects.create(user=self.user)
+        self.product = Product.objects.create(name='Keyboard', description='Mechanical', price=10, stock_quantity=5)
+        self.client.force_authenticate(self.user)
+
+    def pay_order(self, order, token='tok_visa'):
+        return self.client.post('/payment/process/', {
+            'order': order.pk, 'payment_method': 'stripe', 'stripe_token': token,
+            'transaction_details': '{}', 'status': 'pending',
+        })
+
+    def pay_cart(self, token='tok_visa'):
+        return self.client.post('/payment/cart/process/', {'cart_id': self.cart.pk, 'stripe_token': token})
+
+    def test_paying_an_order_again_returns_the_queued_job(self):
+        order = place_order(self.user, {self.product.pk: 2}, status='pending')
+        first, retry = self.pay_order(order), self.pay_order(order)
+        self.assertEqual((first.status_code, retry.status_code), (202, 200))
+        self.assertEqual(first.data['id'], retry.data['id'])
+
+        payments.work(once=True)
+        self.assertEqual(len(payments.get_gateway().charges), 1)
+        self.assertEqual(PaymentJob.objects.get().status, 'succeeded')
+        # Nor is a paid order charged again
+        self.assertEqual(self.pay_order(order).data['id'], first.data['id'])
+        self.assertEqual(PaymentJob.objects.count(), 1)
+
+    def test_a_declined_order_can_be_paid_again(self):
+        order = place_order(self.user, {self.product.pk: 2}, status='pending')
+        declined = self.pay_order(order, 'tok_chargeDeclined')
+        payments.work(once=True)
+        self.assertEqual(PaymentJob.objects.get(pk=declined.data['id']).status, 'failed')
+        self.assertEqual(Payment.objects.get(order=order).status, 'failed')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_reserved, 0)
+
+        self.assertEqual(self.pay_order(order).status_code, 202)
+        self.assertEqual(PaymentJob.objects.count(), 2)
+
+    def test_a_crash_after_the_charge_requeues_the_job(self):
+        first, second = (place_order(self.user, {self.product.pk: 1}, status='pending') for _ in range(2))
+        self.pay_order(first)
+        self.pay_order(second)
+        recorded = payments.charge_succeeded
+
+        def crash_once(job, charge):
+            if job.order_id == first.pk and not job.result:
+                raise RuntimeError('disk full')
+            return recorded(job, charge)
+
+        with mock.patch.object(payments, 'charge_succeeded', crash_once), self.assertLogs('ecommerce_app.payments', 'ERROR'):
+            # The worker carries on with the second job
+            payments.work(once=True)
+        job = PaymentJob.objects.get(order=first)
+        self.assertEqual((job.status, job.result), ('queued', {'error': 'disk full'}))
+        self.assertGreater(job.available_at, timezone.now())
+        self.assertEqual(PaymentJob.objects.get(order=second).status, 'succeeded')
+
+        # Retried later, without charging the card again
+        PaymentJob.objects.filter(pk=job.pk).update(available_at=timezone.now())
+        with mock.patch.object(payments, 'charge_succeeded', crash_once):
+            payments.work(once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(len(payments.get_gateway().charges), 2)
+
+    def test_checking_out_a_cart_again_returns_the_running_job(self):
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        first, retry = self.pay_cart(), self.pay_cart()
+        self.assertEqual((first.status_code, retry.status_code), (202, 200))
+        self.assertEqual(first.data['id'], retry.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+
+        # Added while the payment runs, not part of the order
+        other = Product.objects.create(name='Mouse', description='Wireless', price=5, stock_quantity=5)
+        CartItem.objects.create(cart=self.cart, product=other, quantity=1)
+        payments.work(once=True)
+
+        order = Order.objects.get()
+        self.assertTrue(order.is_shipped)
+        self.assertEqual(Payment.objects.get(order=order).status, 'success')
+        self.assertEqual(list(self.cart.cart_items.values_list('product', flat=True)), [other.pk])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.product.stock_reserved), (3, 0))
+        self.assertEqual(len(payments.get_gateway().charges), 1)
+
+
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        catalog_cache.backend.clear()
+        throttler.reset()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.keyboard = Product.objects.create(name='Keyboard', description='Mechanical', price=10, stock_quantity=5)
+        self.mouse = Product.objects.create(name='Mouse', description='Wireless', price=5, stock_quantity=5)
+
+    def get(self, url):
+        # -> (hit, payload)
+        hits = catalog_cache.hits
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return catalog_cache.hits > hits, response.json()
+
+    def test_repeated_reads_are_hits(self):
+        self.assertFalse(self.get('/products/')[0])
+        self.assertTrue(self.get('/products/')[0])
+        # Other query parameters are other pages
+        self.assertFalse(self.get('/products/?category=electronics')[0])
+
+    def test_orders_only_drop_the_payloads_of_their_products(self):
+        for url in ('/products/', f'/products/{self.keyboard.pk}/', f'/products/{self.mouse.pk}/'):
+            self.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.user, {self.keyboard.pk: 2})
+
+        hit, payload = self.get(f'/products/{self.keyboard.pk}/')
+        self.assertEqual((hit, payload['available_quantity']), (False, 3))
+        self.assertTrue(self.get(f'/products/{self.mouse.pk}/')[0])
+        hit, payload = self.get('/products/')
+        self.assertEqual((hit, payload['results'][0]['available_quantity']), (False, 3))
+
+    def test_product_edits_drop_every_payload(self):
+        self.get(f'/products/{self.mouse.pk}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Monitor', description='27 inch', price=100, stock_quantity=5)
+        self.assertFalse(self.get(f'/products/{self.mouse.pk}/')[0])
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaPinTests(APITransactionTestCase):
+    """
+    Reads against a replica in a second SQLite file, a copy of the primary
+    taken by `manage.py replicate` before the writes.
+    """
+
+    # Resolved in setUpClass, once the replica is configured
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        connections.settings['replica1'] = {**connections.settings['default'], 'NAME': str(Path(directory.name) / 'replica.sqlite3')}
+        cls.addClassCleanup(cls.remove_replica)
+        super().setUpClass()
+
+    @classmethod
+    def remove_replica(cls):
+        connections['replica1'].close()
+        del connections['replica1']
+        del connections.settings['replica1']
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.product = Product.objects.create(name='Keyboard', description='Mechanical', price=10, stock_quantity=5)
+        call_command('replicate', once=True)
+        replicas._heartbeats.clear()
+        self.pins = caches[settings.REPLICA_PIN_CACHE_ALIAS]
+        self.pins.clear()
+        self.client.force_authenticate(self.user)
+
+    def order_count(self):
+        return self.client.get('/orders/').data['count']
+
+    def test_writers_read_the_primary_from_any_worker(self):
+        response = self.client.post(
+            '/orders/create/', {'products': [{'product': self.product.pk, 'quantity': 1}]}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        # The cookie alone pins the client
+        self.pins.clear()
+        self.assertEqual(self.order_count(), 1)
+
+        # Without the cookie the read goes to the replica, which hasn't
+        # seen the order yet
+        self.client.cookies.clear()
+        self.assertEqual(self.order_count(), 0)
+
+    def test_token_clients_without_cookies_are_pinned_by_user(self):
+        key, _ = issue_token(self.user)
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        # Placed after the replica was copied, only the primary has it
+        place_order(self.user, {self.product.pk: 1})
+        self.assertEqual(len(self.client.get('/orders/history/').data['results']), 0)
+
+        response = self.client.post('/cart/bulk/', {'operations': [{'op': 'add', 'product': self.product.pk}]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.client.cookies.clear()
+        self.assertEqual(len(self.client.get('/orders/history/').data['results']), 1)
+
+
+@override_settings(PERF_METRICS_SAMPLE_RATE=1)
+class PerformanceMetricsTests(APITestCase):
+    def setUp(self):
+        catalog_cache.backend.clear()
+        throttler.reset()
+        registry.reset()
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+
+    def test_server_timing_is_for_staff(self):
+        self.assertNotIn('Server-Timing', self.client.get('/products/'))
+        self.client.force_authenticate(self.staff)
+        self.assertRegex(self.client.get('/orders/')['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries"')
+        # Both requests were measured
+        self.assertEqual(sum(stats.duration.count for stats in registry.routes.values()), 2)
+
+    @override_settings(PERF_METRICS_SERVER_TIMING='off')
+    def test_server_timing_can_be_turned_off(self):
+        self.client.force_authenticate(self.staff)
+        self.assertNotIn('Server-Timing', self.client.get('/orders/'))
+
+    @override_settings(PERF_METRICS_SAMPLE_RATE=0, PERF_METRICS_SERVER_TIMING='all')
+    def test_unsampled_requests_are_not_measured(self):
+        self.assertNotIn('Server-Timing', self.client.get('/products/'))
+        self.assertEqual(registry.routes, {})
+
+
+class CartTests(APITestCase):
+    def setUp(self):
+        throttler.reset()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Keyboard {i}', description='Mechanical', price=10, stock_quantity=5) for i in range(10)
+        ])
+        self.client.force_authenticate(self.user)
+
+    def quantities(self):
+        return dict(self.cart.cart_items.values_list('product', 'quantity'))
+
+    def bulk(self, *operations):
+        return self.client.post('/cart/bulk/', {'operations': list(operations)}, format='json')
+
+    def test_adding_returns_the_item_of_the_last_product_sent(self):
+        a, b = self.products[:2]
+        CartItem.objects.create(cart=self.cart, product=a, quantity=1)
+        response = self.client.post('/cart/add/', {'products': [{'product': b.pk}, {'product': a.pk}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['product'], response.data['quantity']), (a.pk, 2))
+        self.assertEqual(self.quantities(), {a.pk: 2, b.pk: 1})
+
+    def test_adding_malformed_entries_is_a_bad_request(self):
+        a = self.products[0]
+        for products in ([a.pk], [{'product': a.pk}, 'x'], {'product': a.pk}, 'x'):
+            with self.subTest(products=products):
+                response = self.client.post('/cart/add/', {'products': products}, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {})
+
+    def test_bulk_operations_apply_in_order(self):
+        a, b, c = self.products[:3]
+        CartItem.objects.create(cart=self.cart, product=c, quantity=4)
+        response = self.bulk(
+            {'op': 'add', 'product': a.pk, 'quantity': 2},
+            {'op': 'add', 'product': a.pk},
+            {'op': 'set', 'product': b.pk, 'quantity': 5},
+            {'op': 'set', 'product': b.pk, 'quantity': 2},
+            {'op': 'remove', 'product': c.pk},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({item['product']: item['quantity'] for item in response.data['cart_items']}, {a.pk: 3, b.pk: 2})
+        self.assertEqual(self.quantities(), {a.pk: 3, b.pk: 2})
+
+    def test_bulk_batches_are_all_or_nothing(self):
+        response = self.bulk({'op': 'add', 'product': self.products[0].pk}, {'op': 'add', 'product': 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['detail'], 'Products do not exist: 0')
+        self.assertEqual(self.bulk({'op': 'add', 'product': self.products[0].pk, 'quantity': 0}).status_code, 400)
+        self.assertEqual(self.quantities(), {})
+
+    def test_bulk_query_count_does_not_grow_with_the_batch(self):
+        counts = []
+        for products in (self.products[:1], self.products):
+            with CaptureQueriesContext(connection) as context:
+                self.bulk(*({'op': 'add', 'product': product.pk} for product in products))
+            counts.append(len(context))
+        self.assertEqual(counts[0], counts[1])
+
+
+class ProductSearchTests(APITestCase):
+    WORDS = ['keyboard', 'mouse', 'monitor', 'cable', 'usb', 'hub', 'laptop', 'stand', 'desk', 'lamp', 'mechanical', 'ab']
+
+    def setUp(self):
+        catalog_cache.backend.clear()
+        throttler.reset()
+        product_index.reset()
+        rng = random.Random(0)
+        names = [' '.join(rng.sample(self.WORDS, rng.randint(1, 3))) for _ in range(300)]
+        # Typos, so some matches are partial
+        names += [name[:i] + name[i + 1:] for name in names[:100] for i in [rng.randrange(len(name))]]
+        Product.objects.bulk_create([
+            Product(name=name, description='', price=1, stock_quantity=1) for name in names
+        ])
+        self.queries = [
+            'a', 'ab', 'usb', 'hbu', 'mous', 'mouse', 'lmap', 'keyboad', 'monitor stand',
+            'mechanical keyboard', 'laptop desk lamp', 'zzzzzzz',
+        ]
+
+    def scan(self, query):
+        # What fuzzy_search did before the index: score every product
+        return {
+            pk for pk, name in Product.objects.values_list('pk', 'name')
+            if fuzz.partial_ratio(query.lower(), name.lower()) >= SEARCH_THRESHOLD
+        }
+
+    def test_index_matches_a_full_scan(self):
+        for query in self.queries:
+            with self.subTest(query=query):
+                self.assertEqual(set(product_index.search(query)), self.scan(query))
+
+    def test_index_follows_product_writes(self):
+        product_index.search('keyboard')
+        product = Product.objects.create(name='Ergonomic keyboard tray', description='', price=1, stock_quantity=1)
+        self.assertIn(product.pk, product_index.search('keyboard tray'))
+        product.name = 'Monitor arm'
+        product.save()
+        self.assertNotIn(product.pk, product_index.search('keyboard tray'))
+        product.delete()
+        self.assertEqual(set(product_index.search('monitor arm')), self.scan('monitor arm'))
+
+    def test_other_processes_see_changes(self):
+        # A second index stands in for another worker's
+        other = ProductSearchIndex()
+        other.search('keyboard')
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='Ergonomic keyboard tray', description='', price=1, stock_quantity=1)
+        self.assertIn(product.pk, other.search('keyboard tray'))
+
+        # Writes that skip the signals are picked up by the periodic reload
+        Product.objects.filter(pk=product.pk).update(name='Monitor arm')
+        self.assertIn(product.pk, other.search('keyboard tray'))
+        with override_settings(SEARCH_INDEX_TTL=0):
+            self.assertNotIn(product.pk, other.search('keyboard tray'))
+            self.assertIn(product.pk, other.search('monitor arm'))
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        catalog_cache.backend.clear()
+        throttler.reset()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, link):
+        # -> the pages of ids met following `link` from `url`
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def cursor(self, position):
+        # A cursor as KeysetPagination encodes one, holding any `position`
+        encoded = base64.b64encode(urlencode({'p': json.dumps(position)}).encode()).decode()
+        return urlencode({'cursor': encoded})
+
+    def round_trip(self, url, expected):
+        pages = self.walk(url, 'next')
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertTrue(all(len(page) == 10 for page in pages[:-1]))
+
+        # And back again from the last page
+        last = self.client.get(url)
+        while last.data['next']:
+            last = self.client.get(last.data['next'])
+        back = self.walk(last.data['previous'], 'previous')
+        self.assertEqual(back, pages[-2::-1])
+
+    def test_products_round_trip(self):
+        Product.objects.bulk_create([
+            Product(name=f'Keyboard {i}', description='', price=1, stock_quantity=1) for i in range(25)
+        ])
+        expected = list(Product.objects.order_by('-id').values_list('pk', flat=True))
+        self.round_trip('/products/?pagination=cursor', expected)
+        self.assertEqual(self.client.get('/products/?cursor=cD1ub3Rqc29u').status_code, 404)
+        for position in (['abc'], [None], [[1]], [1, 2]):
+            with self.subTest(position=position):
+                self.assertEqual(self.client.get(f'/products/?{self.cursor(position)}').status_code, 404)
+
+    def test_orders_with_equal_timestamps_round_trip(self):
+        Order.objects.bulk_create([Order(user=self.user, amount=10) for _ in range(25)])
+        # Ties on created are broken by id, so no order is skipped or repeated
+        Order.objects.update(created=timezone.now())
+        expected = list(Order.objects.order_by('-created', '-id').values_list('pk', flat=True))
+        self.round_trip('/orders/?pagination=cursor', expected)
+        for position in (['yesterday', '1'], [{}, '1'], [str(timezone.now()), 'x']):
+            with self.subTest(position=position):
+                self.assertEqual(self.client.get(f'/orders/?{self.cursor(position)}').status_code, 404)
+
+
+    def test_reviews_and_wishlists_page_newest_first(self):
+        product = Product.objects.create(name='Keyboard', description='', price=1, stock_quantity=1)
+        Review.objects.bulk_create([Review(user=self.user, product=product, content='Fine', rating=4) for _ in range(3)])
+        Wishlist.objects.bulk_create([Wishlist(user=self.user) for _ in range(3)])
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            for url, model in (('/reviews/', Review), ('/wishlist/', Wishlist)):
+                with self.subTest(url=url):
+                    ids = [row['id'] for row in self.client.get(url).data['results']]
+                    self.assertEqual(ids, list(model.objects.order_by('-id').values_list('pk', flat=True)))
+
+
+class ExplainQueriesTests(SimpleTestCase):
+    def test_main_endpoints_plan_without_full_scans(self):
+        # A process of its own, the command creates and drops a test
+        # database of its own, which would clobber this one
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'explain_queries', '--scale', '0.05', '--fail-on-scan'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+
+class RatingSummaryTests(APITestCase):
+    def setUp(self):
+        throttler.reset()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.keyboard = Product.objects.create(name='Keyboard', description='Mechanical', price=10, stock_quantity=5)
+        self.mouse = Product.objects.create(name='Mouse', description='Wireless', price=5, stock_quantity=5)
+        self.client.force_authenticate(self.user)
+
+    def rating(self, product):
+        catalog_cache.backend.clear()
+        return self.client.get(f'/products/{product.pk}/').data['rating']
+
+    def review(self, product, rating):
+        response = self.client.post('/reviews/create/', {'product': product.pk, 'content': 'Fine', 'rating': rating})
+        self.assertEqual(response.status_code, 201)
+        return Review.objects.get(pk=response.data['id'])
+
+    def test_summary_follows_reviews(self):
+        self.assertEqual(self.rating(self.keyboard), {'count': 0, 'mean': None, 'histogram': {str(i): 0 for i in range(1, 6)}})
+        first = self.review(self.keyboard, 5)
+        self.review(self.keyboard, 2)
+        self.assertEqual(self.rating(self.keyboard), {'count': 2, 'mean': 3.5, 'histogram': {'1': 0, '2': 1, '3': 0, '4': 0, '5': 1}})
+
+        # An edit moves the review out of one summary into the other
+        first.product, first.rating = self.mouse, 4
+        first.save()
+        self.assertEqual(self.rating(self.keyboard)['count'], 1)
+        self.assertEqual(self.rating(self.mouse), {'count': 1, 'mean': 4.0, 'histogram': {'1': 0, '2': 0, '3': 0, '4': 1, '5': 0}})
+
+        Review.objects.filter(product=self.keyboard).delete()
+        self.assertEqual(self.rating(self.keyboard)['count'], 0)
+        self.assertEqual(self.rating(self.keyboard)['mean'], None)
+
+    def test_rebuild_matches_the_incremental_summaries(self):
+        for product, rating in ((self.keyboard, 1), (self.keyboard, 4), (self.mouse, 3)):
+            self.review(product, rating)
+        Review.objects.filter(product=self.mouse).delete()
+        incremental = [self.rating(self.keyboard), self.rating(self.mouse)]
+        call_command('rebuild_rating_summaries', stdout=StringIO())
+        self.assertEqual([self.rating(self.keyboard), self.rating(self.mouse)], incremental)
+
+
+class ProductImageTests(APITestCase):
+    def setUp(self):
+        catalog_cache.backend.clear()
+        throttler.reset()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name, PRODUCT_IMAGES_EAGER=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def upload(self, name, size, color='red'):
+        content = BytesIO()
+        Image.new('RGB', size, color).save(content, 'PNG')
+        return SimpleUploadedFile(name, content.getvalue(), content_type='image/png')
+
+    def create(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='Keyboard', description='', price=1, stock_quantity=1, image=image)
+        product.refresh_from_db()
+        return product
+
+    def test_variants_are_rendered_and_served(self):
+        product = self.create(self.upload('keyboard.png', (800, 400)))
+        variants = product.image_variants['variants']
+        sizes = {name: (entry['width'], entry['height']) for name, entry in variants.items()}
+        # Resized to each width, never upscaled, the thumbnail cropped square
+        self.assertEqual(sizes, {'thumb': (200, 200), 'w320': (320, 160), 'w640': (640, 320), 'w1280': (800, 400)})
+        for entry in variants.values():
+            with default_storage.open(entry['webp']) as webp, default_storage.open(entry['jpeg']) as jpeg:
+                self.assertEqual((Image.open(webp).format, Image.open(jpeg).format), ('WEBP', 'JPEG'))
+                self.assertEqual(Image.open(jpeg).size, (entry['width'], entry['height']))
+
+        payload = self.client.get(f'/products/{product.pk}/').data['image_variants']
+        self.assertEqual(payload['thumb']['webp'], f'http://testserver/media/{variants["thumb"]["webp"]}')
+
+    def test_identical_uploads_share_their_variants(self):
+        first = self.create(self.upload('a.png', (400, 400)))
+        second = self.create(self.upload('b.png', (400, 400)))
+        self.assertNotEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image_variants['variants'], second.image_variants['variants'])
+
+    def test_unreadable_images_get_no_variants(self):
+        with self.assertLogs('ecommerce_app.images', 'ERROR'):
+            product = self.create(SimpleUploadedFile('broken.png', b'not an image', content_type='image/png'))
+        self.assertEqual(product.image_variants, {})
+        self.assertEqual(self.client.get(f'/products/{product.pk}/').data['image_variants'], {})
+
+
+class FileServingTests(APITestCase):
+    CONTENT = bytes(range(256)) * 4
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.root = Path(media.name)
+        (self.root / 'manual.txt').write_bytes(self.CONTENT)
+
+    def get(self, path, **headers):
+        response = self.client.get(f'/media/{path}', headers=headers)
+        self.addCleanup(response.close)
+        return response
+
+    def test_unchanged_files_are_not_modified(self):
+        response = self.get('manual.txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.getvalue(), self.CONTENT)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=0, must-revalidate')
+        etag = response['ETag']
+
+        for if_none_match in (etag, f'W/{etag}', f'"other", {etag}', '*'):
+            with self.subTest(if_none_match=if_none_match):
+                revalidated = self.get('manual.txt', if_none_match=if_none_match)
+                self.assertEqual(revalidated.status_code, 304)
+                self.assertEqual(revalidated['ETag'], etag)
+        self.assertEqual(self.get('manual.txt', if_none_match='"other"').status_code, 200)
+        self.assertEqual(self.get('manual.txt', if_modified_since=response['Last-Modified']).status_code, 304)
+
+    def test_ranges_return_partial_content(self):
+        size = len(self.CONTENT)
+        for header, (start, end) in (('bytes=10-19', (10, 19)), ('bytes=-5', (size - 5, size - 1)),
+                                     ('bytes=1000-', (1000, size - 1)), ('bytes=1020-5000', (1020, size - 1))):
+            with self.subTest(range=header):
+                response = self.get('manual.txt', range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+                self.assertEqual(response.getvalue(), self.CONTENT[start:end + 1])
+
+        self.assertEqual(self.get('manual.txt', range=f'bytes={size}-')['Content-Range'], f'bytes */{size}')
+        # Multiple ranges and headers that don't parse are ignored
+        for header in ('bytes=0-1,5-6', 'bytes=9-2', 'bytes=-', 'lines=0-9', 'bytes=ab-cd'):
+            with self.subTest(range=header):
+                response = self.get('manual.txt', range=header)
+                self.assertEqual((response.status_code, response.getvalue()), (200, self.CONTENT))
+                self.assertNotIn('Content-Range', response)
+        # A range of an older copy gets the whole current file
+        response = self.get('manual.txt', range='bytes=0-9', if_range='"stale"')
+        self.assertEqual((response.status_code, len(response.getvalue())), (200, size))
+
+    def test_precompressed_copies_and_cache_lifetimes(self):
+        (self.root / 'manual.txt.gz').write_bytes(b'gzipped')
+        response = self.get('manual.txt', accept_encoding='gzip, br')
+        self.assertEqual((response['Content-Encoding'], response.getvalue()), ('gzip', b'gzipped'))
+        (self.root / 'manual.txt.br').write_bytes(b'brotli')
+        response = self.get('manual.txt', accept_encoding='gzip, deflate, br')
+        self.assertEqual((response['Content-Encoding'], response.getvalue()), ('br', b'brotli'))
+        self.assertEqual(self.get('manual.txt', accept_encoding='gzip')['Content-Encoding'], 'gzip')
+        # Ranges address the uncompressed bytes
+        self.assertNotIn('Content-Encoding', self.get('manual.txt', accept_encoding='gzip', range='bytes=0-0'))
+
+        (self.root / 'variants').mkdir()
+        (self.root / 'variants' / 'thumb.webp').write_bytes(b'webp')
+        self.assertEqual(self.get('variants/thumb.webp')['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(self.get('../settings.py').status_code, 404)
+
+
+# The async views are only routed under ASGI (ASYNC_VIEWS), AsyncViewTests
+# routes them in front of the usual URLs here
+urlpatterns = [path('', include(async_urlpatterns)), path('', include('core.urls'))]
+
+
+@override_settings(
+    ROOT_URLCONF=__name__, PAYMENT_GATEWAY='ecommerce_app.payments.FakeStripeGateway', PAYMENT_JOBS_EAGER=False,
+)
+class AsyncViewTests(APITestCase):
+    def setUp(self):
+        catalog_cache.backend.clear()
+        payments._gateways.clear()
+        throttler.reset()
+        self.addCleanup(throttler.reset)
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.product = Product.objects.create(name='Keyboard', description='Mechanical', price=10, stock_quantity=5)
+        order = place_order(self.user, {self.product.pk: 1}, status='pending')
+        self.job, _ = payments.enqueue_payment(self.user, 'order', order, 'tok_visa')
+        self.async_client.force_login(self.user)
+
+    def wait(self, query=''):
+        return self.async_client.get(f'/payment/jobs/{self.job.pk}/wait/{query}')
+
+    def work(self):
+        # Sync code of async tests runs on the main thread, whose
+        # connection holds the on_commit callbacks
+        with self.captureOnCommitCallbacks(execute=True):
+            payments.work(once=True)
+
+    async def test_catalog_hits_skip_the_drf_view(self):
+        hits = catalog_cache.hits
+        miss = await self.async_client.get('/products/')
+        hit = await self.async_client.get('/products/')
+        self.assertEqual((miss.status_code, hit.status_code), (200, 200))
+        self.assertEqual(hit.json(), miss.json())
+        self.assertEqual(catalog_cache.hits, hits + 1)
+
+    @override_settings(THROTTLE_RATES={'user': (1, 2), 'anon': (1, 2)})
+    async def test_catalog_hits_are_throttled(self):
+        self.assertEqual((await self.async_client.get('/products/')).status_code, 200)
+        self.assertEqual((await self.async_client.get('/products/')).status_code, 200)
+        response = await self.async_client.get('/products/')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    async def test_contact_messages_are_spooled(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        with override_settings(CONTACT_SPOOL_DIR=spool_dir.name, CONTACT_BUFFER_SIZE=1000, CONTACT_BUFFER_INTERVAL=3600):
+            contact_buffer._pid = None
+            message = {'name': 'Buyer', 'email': 'buyer@example.com', 'message': 'Hi'}
+            response = await self.async_client.post('/contact/', message, content_type='application/json')
+            self.assertEqual(response.json(), {'success': True})
+            malformed = await self.async_client.post('/contact/', '{', content_type='application/json')
+            self.assertEqual(malformed.status_code, 400)
+            self.assertEqual(await sync_to_async(contact_buffer.flush)(), 1)
+        self.assertEqual(await ContactMessage.objects.acount(), 1)
+
+    async def test_waiting_returns_when_the_job_finishes(self):
+        # Nothing checks the cache before the worker's wake-up
+        with mock.patch.object(payments, 'WAIT_INTERVAL', 60):
+            waiting = asyncio.ensure_future(self.wait('?timeout=10'))
+            await asyncio.sleep(0.1)
+            self.assertFalse(waiting.done())
+            await sync_to_async(self.work)()
+            response = await asyncio.wait_for(waiting, 2)
+        self.assertEqual((response.status_code, response.json()['status']), (200, 'succeeded'))
+
+    async def test_waiting_needs_the_owner(self):
+        await self.async_client.alogout()
+        self.assertEqual((await self.wait()).status_code, 401)
+        other = await sync_to_async(User.objects.create_user)('other', 'other@example.com', 'password')
+        await self.async_client.aforce_login(other)
+        self.assertEqual((await self.wait()).status_code, 404)
+
+    async def test_timeouts_are_clamped(self):
+        for timeout in ('nan', 'inf', '-inf', 'soon'):
+            with self.subTest(timeout=timeout):
+                self.assertEqual((await self.wait(f'?timeout={timeout}')).status_code, 400)
+        # Answered at once with the current state
+        response = await asyncio.wait_for(self.wait('?timeout=-5'), 1)
+        self.assertEqual(response.json()['status'], 'queued')
 
-# Create your tests here.
@@ -0,0 +1,157 @@
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+
+class MemoryBucketStore:
+    """Buckets of this process, the least recently used dropped past `max_size`."""
+
+    def __init__(self, max_size=100000):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self.max_size = max_size
+
+    def take(self, buckets, cost):
+        now = time.monotonic()
+        with self._lock:
+            states = {key: self._buckets.get(key) for key, _, _ in buckets}
+            wait, rejected_by, states = _take(buckets, cost, states, now)
+            if not wait:
+                for key, state in states.items():
+                    self._buckets[key] = state
+                    self._buckets.move_to_end(key)
+                while len(self._buckets) > self.max_size:
+                    self._buckets.popitem(last=False)
+        return wait, rejected_by
+
+
+class CacheBucketStore:
+    """
+    Buckets kept in a Django cache, shared by every process using it.
+
+    Reads and writes aren't atomic, so concurrent requests of one client
+    may now and then both get the last token.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def take(self, buckets, cost):
+        cache = caches[self.alias]
+        keys = {f'throttle:{key}': key for key, _, _ in buckets}
+        cached = cache.get_many(list(keys))
+        states = {key: cached.get(cache_key) for cache_key, key in keys.items()}
+        wait, rejected_by, states = _take(buckets, cost, states, time.time())
+        if not wait:
+            # A bucket left alone for burst / rate seconds is full again
+            timeout = max(math.ceil(burst / rate) for _, rate, burst in buckets)
+            cache.set_many({f'throttle:{key}': state for key, state in states.items()}, timeout)
+        return wait, rejected_by
+
+
+def _take(buckets, cost, states, now):
+    """
+    Refill each (key, rate, burst) bucket from its (tokens, updated) state
+    and take `cost` tokens from all of them, or from none. Returns the
+    seconds to wait (0 when admitted), the key of the bucket that made the
+    request wait longest and the new states.
+    """
+    wait, rejected_by = 0.0, None
+    new_states = {}
+    for key, rate, burst in buckets:
+        tokens, updated = states.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < cost and (min(cost, burst) - tokens) / rate > wait:
+            wait, rejected_by = (min(cost, burst) - tokens) / rate, key
+        new_states[key] = (tokens - cost, now)
+    return wait, rejected_by, new_states
+
+
+class Throttler:
+    """
+    Token-bucket admission control. Every request takes its scope's cost
+    (THROTTLE_COSTS, 1 by default) from its client's bucket, per user or
+    per IP, from the client's bucket for the scope when
+    THROTTLE_CLIENT_SCOPE_RATES sets one, and from the scope's bucket
+    shared by all clients when THROTTLE_SCOPE_RATES sets one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._store = None
+        self.rejections = Counter()
+
+    @property
+    def store(self):
+        with self._lock:
+            if self._store is None:
+                alias = getattr(settings, 'THROTTLE_CACHE_ALIAS', None)
+                self._store = CacheBucketStore(alias) if alias else MemoryBucketStore()
+            return self._store
+
+    def check(self, scope, ident, authenticated):
+        """Take a request's tokens, returns 0 or the seconds to wait before retrying."""
+        if not settings.THROTTLE_ENABLED:
+            return 0
+        cost = settings.THROTTLE_COSTS.get(scope, 1)
+        kind = 'user' if authenticated else 'anon'
+        # bucket key -> the name rejections are counted under
+        names = {f'{kind}:{ident}': kind}
+        buckets = [(f'{kind}:{ident}', *settings.THROTTLE_RATES[kind])]
+        if scope in settings.THROTTLE_CLIENT_SCOPE_RATES:
+            names[f'{kind}:{ident}:{scope}'] = f'{kind}_scope'
+            buckets.append((f'{kind}:{ident}:{scope}', *settings.THROTTLE_CLIENT_SCOPE_RATES[scope]))
+        if scope in settings.THROTTLE_SCOPE_RATES:
+            names[f'scope:{scope}'] = 'scope'
+            buckets.append((f'scope:{scope}', *settings.THROTTLE_SCOPE_RATES[scope]))
+
+        wait, rejected_by = self.store.take(buckets, cost)
+        if wait:
+            with self._lock:
+                self.rejections[(scope, names[rejected_by])] += 1
+        return wait
+
+    def stats(self):
+        with self._lock:
+            return dict(self.rejections)
+
+    def reset(self):
+        with self._lock:
+            self._store = None
+            self.rejections.clear()
+
+
+throttler = Throttler()
+
+
+def scope_for(view, request):
+    # Views can name their scope (the search of ProductListView does),
+    # otherwise it is the URL name
+    get_scope = getattr(view, 'get_throttle_scope', None)
+    if get_scope is not None:
+        return get_scope(request)
+    match = getattr(request, 'resolver_match', None)
+    return match.url_name if match is not None and match.url_name else 'default'
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle backed by `throttler`, rejected requests get a Retry-After.
+    Anonymous clients are told apart by get_ident(), which only trusts
+    X-Forwarded-For as far as REST_FRAMEWORK['NUM_PROXIES'] says.
+    """
+
+    def allow_request(self, request, view):
+        user = request.user
+        authenticated = bool(user and user.is_authenticated)
+        ident = user.pk if authenticated else self.get_ident(request)
+        self.retry_after = throttler.check(scope_for(view, request), ident, authenticated)
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
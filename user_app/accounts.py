@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db.models import Func
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class NormalizedEmail(Func):
+    # Matches the unique index of migration 0002 expression for expression,
+    # so looking an address up is a single index probe. Blank addresses
+    # become NULL and never collide
+    template = "LOWER(NULLIF(%(expressions)s, ''))"
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+def email_taken(email):
+    from django.contrib.auth.models import User
+
+    return User.objects.annotate(normalized_email=NormalizedEmail('email')).filter(
+        normalized_email=normalize_email(email),
+    ).exists()
+
+
+_executor = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASHING_WORKERS, thread_name_prefix='password-hashing',
+            )
+            _slots = threading.BoundedSemaphore(settings.PASSWORD_HASHING_WORKERS + settings.PASSWORD_HASHING_QUEUE)
+        return _executor, _slots
+
+
+def hash_password(password):
+    """
+    make_password() on the bounded hashing pool, so a burst of sign-ups
+    takes at most PASSWORD_HASHING_WORKERS cores from the other requests.
+    Raises HashingBusy when the queue stays full for
+    PASSWORD_HASHING_QUEUE_TIMEOUT seconds.
+    """
+    if not settings.PASSWORD_HASHING_WORKERS:
+        return make_password(password)
+
+    executor, slots = get_executor()
+    if not slots.acquire(timeout=settings.PASSWORD_HASHING_QUEUE_TIMEOUT):
+        raise HashingBusy()
+    try:
+        # The hashers release the GIL, the waiting request thread idles
+        return executor.submit(make_password, password).result()
+    finally:
+        slots.release()
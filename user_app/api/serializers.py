@@ -1,6 +1,9 @@
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 
+from user_app.accounts import email_taken, hash_password, normalize_email
+
 
 class RegistrationSerializer(serializers.ModelSerializer):
     password2 = serializers.CharField(style={'input_type': 'password'}, write_only=True)
@@ -22,11 +25,20 @@ class RegistrationSerializer(serializers.ModelSerializer):
         if password != password2:
             raise serializers.ValidationError({'error': 'P1 and P2 should be the same!'})
         
-        if User.objects.filter(email=self.validated_data['email']).exists():
+        email = normalize_email(self.validated_data.get('email', ''))
+        # Checked before hashing, so duplicates cost no hashing time
+        if email and email_taken(email):
             raise serializers.ValidationError({'error': 'Email already exists!'})
         
-        account = User(email=self.validated_data['email'], username=self.validated_data['username'])
-        account.set_password(password)
-        account.save()
+        account = User(email=email, username=self.validated_data['username'])
+        account.password = hash_password(password)
+        try:
+            with transaction.atomic():
+                account.save()
+        except IntegrityError:
+            # Another sign-up took the address since the check above
+            if email and email_taken(email):
+                raise serializers.ValidationError({'error': 'Email already exists!'})
+            raise
         
         return account
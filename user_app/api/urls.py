@@ -1,12 +1,12 @@
 from django.urls import path
-from rest_framework.authtoken.views import obtain_auth_token
 
-from user_app.api.views import registration_view, logout_view
+from user_app.api.views import login_view, registration_view, logout_view, token_cache_stats_view
 
 
 urlpatterns = [
-    path('login/', obtain_auth_token, name='login'),
+    path('login/', login_view, name='login'),
     path('register/', registration_view, name='register'),
     path('logout/', logout_view, name='logout'),
+    path('token-cache/stats/', token_cache_stats_view, name='token-cache-stats'),
 ]
 
@@ -1,18 +1,35 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.serializers import AuthTokenSerializer
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 
+from user_app.accounts import HashingBusy
 from user_app.api.serializers import RegistrationSerializer
-from user_app import models
+from user_app.authentication import token_cache
+from user_app.models import AuthToken
+from user_app.tokens import issue_token
+
+
+@api_view(['POST'])
+def login_view(request):
+    # Every login issues a new token, one per device, so logging in on a
+    # phone doesn't sign the laptop out
+    serializer = AuthTokenSerializer(data=request.data, context={'request': request})
+    serializer.is_valid(raise_exception=True)
+    key, token = issue_token(serializer.validated_data['user'], request.data.get('device', ''))
+    return Response({'token': key, 'expires_at': token.expires_at})
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
-    # Delete the authentication token associated with the user
-    Token.objects.filter(user=request.user).delete()
+    # Delete the token this request came with, or all of the user's tokens
+    # with "all". Their post_delete signal drops them from the token cache
+    tokens = AuthToken.objects.filter(user=request.user)
+    if isinstance(request.auth, AuthToken) and not request.data.get('all'):
+        tokens = tokens.filter(pk=request.auth.pk)
+    tokens.delete()
 
     return Response({'detail': 'Logout successful'}, status=status.HTTP_200_OK)
 
@@ -25,17 +42,29 @@ def registration_view(request):
         data = {}
         
         if serializer.is_valid():
-            account = serializer.save()
+            try:
+                account = serializer.save()
+            except HashingBusy:
+                return Response(
+                    {'detail': 'Too many sign-ups right now, please retry shortly.'},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'},
+                )
             
             data['response'] = "Registration Successful!"
             data['username'] = account.username
             data['email'] = account.email
             
-            # Use get_or_create to ensure the Token is created if it doesn't exist
-            token, created = Token.objects.get_or_create(user=account)
-            data['token'] = token.key
+            key, token = issue_token(account, request.data.get('device', ''))
+            data['token'] = key
+            data['expires_at'] = token.expires_at
             
         else:
             data = serializer.errors
             
-        return Response(data, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def token_cache_stats_view(request):
+    return Response(token_cache.stats())
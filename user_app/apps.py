@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UserAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user_app'
+
+    def ready(self):
+        # Register the token cache invalidation handlers
+        from user_app import signals  # noqa: F401
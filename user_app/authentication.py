@@ -0,0 +1,173 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from user_app.tokens import digest, find_token, renew
+
+
+class TokenCache:
+    """
+    Token key -> AuthToken (with its user) resolution, cached in an in-process LRU
+    with a TTL and optionally in a shared cache behind it.
+
+    Entries are dropped as soon as a token is deleted or its user saved,
+    in this process and in the shared cache. Other processes' LRUs hold
+    on to an entry for at most AUTH_TOKEN_CACHE_TTL seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # user id -> digests of that user's cached tokens
+        self._by_user = {}
+        # Bumped by every invalidation, see set()
+        self.generation = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 30)
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000)
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', None)
+        return caches[alias] if alias else None
+
+    # Raw tokens never end up in a cache key. This is the digest stored
+    # on AuthToken, so a deleted token can be uncached without its key
+    digest = staticmethod(digest)
+
+    def get(self, key):
+        digest = self.digest(key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                token, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    # Each request gets its own copy, views cache related
+                    # objects on request.user
+                    return copy.deepcopy(token)
+                self._forget(digest)
+
+        shared = self.shared
+        token = shared.get(f'auth:token:{digest}') if shared is not None else None
+        with self._lock:
+            if token is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+        self._remember(digest, copy.deepcopy(token))
+        return token
+
+    def set(self, key, token, generation=None):
+        """
+        Cache `token`. Pass the `generation` read before the token was
+        loaded, so a token revoked in the meantime isn't cached again.
+        """
+        if generation is not None and generation != self.generation:
+            return
+        digest = self.digest(key)
+        shared = self.shared
+        if shared is not None:
+            shared.set(f'auth:token:{digest}', token, getattr(settings, 'AUTH_TOKEN_CACHE_SHARED_TTL', 300))
+        self._remember(digest, copy.deepcopy(token))
+
+    def _remember(self, digest, token):
+        with self._lock:
+            self._entries[digest] = (token, time.monotonic() + self.ttl)
+            self._entries.move_to_end(digest)
+            self._by_user.setdefault(token.user_id, set()).add(digest)
+            while len(self._entries) > self.max_size:
+                self._forget(next(iter(self._entries)))
+
+    def _forget(self, digest):
+        # Callers hold the lock
+        token, _ = self._entries.pop(digest)
+        digests = self._by_user.get(token.user_id)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_user[token.user_id]
+
+    def invalidate(self, key):
+        self.invalidate_digest(self.digest(key))
+
+    def invalidate_digest(self, digest):
+        with self._lock:
+            self.generation += 1
+            if digest in self._entries:
+                self._forget(digest)
+        shared = self.shared
+        if shared is not None:
+            shared.delete(f'auth:token:{digest}')
+
+    def invalidate_user(self, user_id, digests=()):
+        """Drop every cached token of a user, `digests` are also removed from the shared cache."""
+        with self._lock:
+            self.generation += 1
+            for digest in list(self._by_user.get(user_id, ())):
+                self._forget(digest)
+        shared = self.shared
+        if shared is not None and digests:
+            shared.delete_many([f'auth:token:{digest}' for digest in digests])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self.hits = self.shared_hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            hits, shared_hits, misses, size = self.hits, self.shared_hits, self.misses, len(self._entries)
+        total = hits + shared_hits + misses
+        return {
+            'hits': hits,
+            'shared_hits': shared_hits,
+            'misses': misses,
+            'hit_rate': (hits + shared_hits) / total if total else 0.0,
+            'size': size,
+        }
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Authenticates hashed, expiring AuthTokens (see user_app.tokens),
+    skipping the AuthToken/User query on a token_cache hit.
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None or token.expires_at <= timezone.now():
+            # The cached copy may predate a renewal done by another process
+            generation = token_cache.generation
+            token = find_token(key)
+            if token is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            token_cache.set(key, token, generation)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        if renew(token):
+            token_cache.set(key, token)
+        return token.user, token
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+# Same algorithm names as Django's hashers, so hashes made with other
+# parameters still verify and are upgraded on the next login
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    time_cost = settings.PASSWORD_ARGON2_TIME_COST
+    memory_cost = settings.PASSWORD_ARGON2_MEMORY_COST
+    parallelism = settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    work_factor = settings.PASSWORD_SCRYPT_WORK_FACTOR
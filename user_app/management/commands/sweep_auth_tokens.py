@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user_app.tokens import sweep_expired_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired API tokens (run periodically, or with --interval)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep running, sweeping every this many seconds')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = sweep_expired_tokens(batch_size=options['batch_size'])
+            if deleted:
+                self.stdout.write(f'Deleted {deleted} expired tokens')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,48 @@
+# Generated by Django 5.0 on 2026-10-18 18:02
+
+import hashlib
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def hash_existing_tokens(apps, schema_editor):
+    # Tokens handed out so far keep working, but their keys are only kept
+    # as a digest from now on
+    Token = apps.get_model('authtoken', 'Token')
+    AuthToken = apps.get_model('user_app', 'AuthToken')
+    expires_at = timezone.now() + timedelta(seconds=settings.AUTH_TOKEN_TTL)
+    AuthToken.objects.bulk_create([
+        AuthToken(user_id=token.user_id, prefix=token.key[:8], digest=hashlib.sha256(token.key.encode()).hexdigest(), expires_at=expires_at)
+        for token in Token.objects.all()
+    ], batch_size=1000)
+    Token.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('authtoken', '0003_tokenproxy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(db_index=True, max_length=8)),
+                ('digest', models.CharField(max_length=64)),
+                ('device', models.CharField(blank=True, max_length=100)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='auth_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(hash_existing_tokens, migrations.RunPython.noop),
+    ]
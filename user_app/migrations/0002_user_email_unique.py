@@ -0,0 +1,32 @@
+# Generated by Django 5.0 on 2026-10-18 18:20
+
+from django.db import migrations
+
+
+def check_duplicate_emails(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    seen = {}
+    for pk, email in User.objects.exclude(email='').values_list('pk', 'email'):
+        other = seen.setdefault(email.lower(), pk)
+        if other != pk:
+            raise RuntimeError(
+                f'Users {other} and {pk} share the email address {email!r}, '
+                f'change one of them before adding the unique email index.'
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('user_app', '0001_authtoken'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        # Must match user_app.accounts.NormalizedEmail exactly to be used
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX auth_user_email_normalized_uniq ON auth_user (LOWER(NULLIF(email, '')))",
+            'DROP INDEX auth_user_email_normalized_uniq',
+        ),
+    ]
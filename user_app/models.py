@@ -1,3 +1,20 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+class AuthToken(models.Model):
+    # An API token for one of the user's devices. The key itself is never
+    # stored: `prefix` (its first characters) finds the row through an
+    # index and `digest`, the SHA-256 of the whole key, proves it
+    PREFIX_LENGTH = 8
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='auth_tokens')
+    prefix = models.CharField(max_length=PREFIX_LENGTH, db_index=True)
+    digest = models.CharField(max_length=64)
+    device = models.CharField(max_length=100, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    # Slides forward as the token is used, see user_app.tokens.renew()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.prefix}... ({self.user}, {self.device or "unnamed device"})'
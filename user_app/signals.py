@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from user_app.authentication import token_cache
+from user_app.models import AuthToken
+
+
+@receiver(post_delete, sender=AuthToken)
+def uncache_token(sender, instance, **kwargs):
+    # Logging out (or deleting a token anywhere else) revokes it right away
+    token_cache.invalidate_digest(instance.digest)
+
+
+@receiver(post_save, sender=User)
+def uncache_user_tokens(sender, instance, created, **kwargs):
+    # Cached tokens carry a copy of the user, drop it when the user changes
+    if not created:
+        digests = AuthToken.objects.filter(user=instance).values_list('digest', flat=True) if token_cache.shared else ()
+        token_cache.invalidate_user(instance.pk, digests)
@@ -1,3 +1,80 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from user_app.authentication import token_cache
+from user_app.models import AuthToken
+from user_app.tokens import issue_token, sweep_expired_tokens
+
+
+class TokenCacheTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        self.key, self.token = issue_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_cached_token_saves_the_lookup_query(self):
+        cold = self.count_queries('/orders/')
+        warm = self.count_queries('/orders/')
+        self.assertEqual(warm, cold - 1)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+    def test_logout_revokes_the_cached_token(self):
+        self.count_queries('/orders/')
+        self.assertEqual(self.client.post('/account/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/orders/').status_code, 403)
+
+
+class AuthTokenTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+
+    def test_login_issues_a_hashed_token_per_device(self):
+        response = self.client.post('/account/login/', {'username': 'buyer', 'password': 'password', 'device': 'phone'})
+        key = response.data['token']
+        token = AuthToken.objects.get(user=self.user, device='phone')
+        self.assertEqual(token.prefix, key[:AuthToken.PREFIX_LENGTH])
+        self.assertNotIn(key, token.digest)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        self.assertEqual(self.client.get('/orders/').status_code, 200)
+
+    def test_expired_tokens_are_refused_and_swept(self):
+        key, token = issue_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        self.assertEqual(self.client.get('/orders/').status_code, 200)
+
+        # As if AUTH_TOKEN_TTL had passed without the token being used
+        AuthToken.objects.filter(pk=token.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        token_cache.clear()
+        self.assertEqual(self.client.get('/orders/').status_code, 403)
+        self.assertEqual(sweep_expired_tokens(), 1)
+        self.assertFalse(AuthToken.objects.exists())
+
+
+class RegistrationTests(APITestCase):
+    def register(self, username, email):
+        return self.client.post('/account/register/', {
+            'username': username, 'email': email, 'password': 'pass-word-1', 'password2': 'pass-word-1',
+        })
+
+    def test_emails_are_unique_regardless_of_case(self):
+        self.assertEqual(self.register('first', 'Buyer@Example.com').status_code, 201)
+        self.assertEqual(User.objects.get(username='first').email, 'buyer@example.com')
+        self.assertTrue(User.objects.get(username='first').check_password('pass-word-1'))
+
+        response = self.register('second', 'buyer@EXAMPLE.com ')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(username='second').exists())
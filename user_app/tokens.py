@@ -0,0 +1,68 @@
+import hashlib
+import hmac
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from user_app.models import AuthToken
+
+
+def digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def issue_token(user, device=''):
+    """Create a token for one of `user`'s devices, returns (key, token)."""
+    key = secrets.token_hex(20)
+    token = AuthToken.objects.create(
+        user=user, prefix=key[:AuthToken.PREFIX_LENGTH], digest=digest(key), device=device[:100],
+        expires_at=timezone.now() + timedelta(seconds=settings.AUTH_TOKEN_TTL),
+    )
+    return key, token
+
+
+def find_token(key):
+    """
+    Return the unexpired AuthToken for `key` (with its user) or None.
+
+    The prefix index narrows millions of tokens down to one or two rows,
+    and the digests are compared in constant time.
+    """
+    if len(key) <= AuthToken.PREFIX_LENGTH:
+        return None
+    key_digest = digest(key)
+    candidates = AuthToken.objects.select_related('user').filter(
+        prefix=key[:AuthToken.PREFIX_LENGTH], expires_at__gt=timezone.now(),
+    )
+    for token in candidates:
+        if hmac.compare_digest(token.digest, key_digest):
+            return token
+    return None
+
+
+def renew(token):
+    """
+    Slide the expiry of a token in use, at most once per
+    AUTH_TOKEN_RENEW_INTERVAL so requests don't each write the row.
+    Returns whether the token was renewed.
+    """
+    now = timezone.now()
+    renew_after = token.expires_at - timedelta(seconds=settings.AUTH_TOKEN_TTL - settings.AUTH_TOKEN_RENEW_INTERVAL)
+    if now < renew_after:
+        return False
+    token.expires_at = now + timedelta(seconds=settings.AUTH_TOKEN_TTL)
+    AuthToken.objects.filter(pk=token.pk).update(expires_at=token.expires_at)
+    return True
+
+
+def sweep_expired_tokens(batch_size=1000):
+    """Delete every expired token, returns how many were deleted."""
+    deleted = 0
+    while True:
+        ids = list(AuthToken.objects.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)[:batch_size])
+        if ids:
+            deleted += AuthToken.objects.filter(pk__in=ids).delete()[0]
+        if len(ids) < batch_size:
+            return deleted